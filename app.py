@@ -4,7 +4,8 @@ Flask 应用主文件
 from flask import Flask
 from flask_cors import CORS
 from flask_login import LoginManager
-from config import Config
+from werkzeug.middleware.proxy_fix import ProxyFix
+from config import Config, PROXY_FIX_X_FOR
 
 # 创建扩展实例
 from db.database import db
@@ -13,6 +14,12 @@ login_manager = LoginManager()
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
+    # 使用带统计的连接池，供 /api/health/db 查看
+    from db.pool import InstrumentedQueuePool
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'poolclass': InstrumentedQueuePool,
+        **app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    }
 
     # 初始化扩展
     db.init_app(app)
@@ -22,18 +29,24 @@ def create_app():
 
     CORS(app, supports_credentials=True)
 
+    # 部署在反向代理之后时，从代理设置的 X-Forwarded-For 中取真实的客户端 IP（登录限流按 IP 计数）
+    if PROXY_FIX_X_FOR > 0:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_X_FOR)
+
     # 导入并注册蓝图
     from routes.auth_routes import auth_bp
     from routes.protocol_routes import protocol_bp
     from routes.git_routes import git_bp
     from routes.user_routes import user_bp
     from routes.log_routes import log_bp
+    from routes.health_routes import health_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(protocol_bp)
     app.register_blueprint(git_bp)
     app.register_blueprint(user_bp)
     app.register_blueprint(log_bp)
+    app.register_blueprint(health_bp)
 
     return app
 
@@ -42,8 +55,14 @@ app = create_app()
 
 @login_manager.user_loader
 def load_user(user_id):
-    from db.models import User
-    return db.session.get(User, int(user_id))
+    from services.auth_service import load_session_user
+    return load_session_user(int(user_id))
+
+@login_manager.request_loader
+def load_user_from_request(request):
+    # 没有会话 Cookie 时尝试 Bearer 令牌，校验签名即可，不查询数据库
+    from services.token_service import load_token_user
+    return load_token_user(request)
 
 if __name__ == '__main__':
     with app.app_context():
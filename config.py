@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -11,6 +12,94 @@ BASE_DIR = Path(__file__).parent.parent  # 返回到项目根目录
 # 协议项目目录（从环境变量读取）
 FRONTEND_DIR = os.environ.get('FRONTEND_DIR')
 
+# alpha 分支发布用的独立工作树目录，默认与前端项目目录同级
+ALPHA_WORKTREE_DIR = os.environ.get('ALPHA_WORKTREE_DIR') or (
+    f"{FRONTEND_DIR.rstrip('/')}_alpha_worktree" if FRONTEND_DIR else None
+)
+
+# 运行时目录（多个 worker 之间共享的版本戳、锁文件等）
+RUNTIME_DIR = os.environ.get('RUNTIME_DIR') or os.path.join(tempfile.gettempdir(), 'h5_protocol_server')
+
+# 密码哈希算法（werkzeug 的 method 格式，如 scrypt:32768:8:1、pbkdf2:sha256:600000），
+# 用户登录成功时，旧算法或旧参数的哈希会自动按新配置重新计算
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'
+
+# 前面的反向代理层数（如 Nginx 为 1）：大于 0 时按 X-Forwarded-For 取客户端 IP，
+# 只能在服务只接受代理转发的请求时开启，否则客户端可以伪造 IP
+PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR') or 0)
+
+# 登录限流（令牌桶，每个 worker 独立计数）：桶容量和每秒补充的次数，分别按用户名和 IP 限制
+LOGIN_USER_BURST = int(os.environ.get('LOGIN_USER_BURST') or 5)
+LOGIN_USER_RATE = float(os.environ.get('LOGIN_USER_RATE') or 0.1)
+LOGIN_IP_BURST = int(os.environ.get('LOGIN_IP_BURST') or 20)
+LOGIN_IP_RATE = float(os.environ.get('LOGIN_IP_RATE') or 0.5)
+
+# 登录用户缓存的有效期（秒）；角色、状态变化会立即使缓存失效，这里只是兜底
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 60)
+
+# API 令牌的有效期（秒）
+TOKEN_MAX_AGE = int(os.environ.get('TOKEN_MAX_AGE') or 12 * 3600)
+
+# 后台 git fetch：间隔（秒，0 表示不自动 fetch）、单次超时和失败后的最长退避间隔
+GIT_FETCH_INTERVAL = int(os.environ.get('GIT_FETCH_INTERVAL') or 60)
+GIT_FETCH_TIMEOUT = int(os.environ.get('GIT_FETCH_TIMEOUT') or 30)
+GIT_FETCH_MAX_BACKOFF = int(os.environ.get('GIT_FETCH_MAX_BACKOFF') or 600)
+
+# git status 结果缓存的最长有效期（秒）：直接修改工作区文件（不经过接口）时，状态最多滞后这么久
+GIT_STATUS_CACHE_TTL = int(os.environ.get('GIT_STATUS_CACHE_TTL') or 2)
+
+# 协议列表缓存的最长有效期（秒），兜底捕获原地修改文件内容等目录 mtime 无法感知的变化
+PROTOCOL_CATALOG_MAX_AGE = int(os.environ.get('PROTOCOL_CATALOG_MAX_AGE') or 60)
+
+# 协议写入意图日志：需放在持久化的目录（不要放在 RUNTIME_DIR 或前端仓库里），默认与前端项目目录同级
+PROTOCOL_JOURNAL_PATH = os.environ.get('PROTOCOL_JOURNAL_PATH') or (
+    f"{FRONTEND_DIR.rstrip('/')}_protocol_journal.ndjson" if FRONTEND_DIR else None
+)
+# 协议写入是否 fsync（开发环境可设为 0 换取速度，断电时可能丢失最近的写入）
+PROTOCOL_FSYNC = os.environ.get('PROTOCOL_FSYNC', '1') != '0'
+
+# 批量导入的请求体上限（字节），超过时返回 413
+PROTOCOL_IMPORT_MAX_BYTES = int(os.environ.get('PROTOCOL_IMPORT_MAX_BYTES') or 100 * 1024 * 1024)
+
+# 预览存储：sqlite（多 worker 共享，默认）或 memory（仅当前进程）
+PREVIEW_BACKEND = os.environ.get('PREVIEW_BACKEND') or 'sqlite'
+PREVIEW_STORE_PATH = os.environ.get('PREVIEW_STORE_PATH') or os.path.join(RUNTIME_DIR, 'previews.sqlite3')
+PREVIEW_TTL = int(os.environ.get('PREVIEW_TTL') or 3600)  # 预览有效期（秒）
+PREVIEW_MAX_BYTES = int(os.environ.get('PREVIEW_MAX_BYTES') or 64 * 1024 * 1024)  # 预览内容总大小上限
+PREVIEW_REAP_INTERVAL = int(os.environ.get('PREVIEW_REAP_INTERVAL') or 60)  # 后台清理过期预览的最长间隔（秒）
+
+# 操作日志异步批量写入：每批最多条数、攒批的最长等待时间（秒）
+OPERATION_LOG_BATCH_SIZE = int(os.environ.get('OPERATION_LOG_BATCH_SIZE') or 100)
+OPERATION_LOG_FLUSH_INTERVAL = float(os.environ.get('OPERATION_LOG_FLUSH_INTERVAL') or 1)
+# 操作日志列表总数的缓存时间（秒）
+OPERATION_LOG_COUNT_TTL = int(os.environ.get('OPERATION_LOG_COUNT_TTL') or 30)
+
+# 操作日志保留：保留天数（默认 0，不清理；需要时显式开启）、清理方式（delete：分批删除；partition：删除过期的月分区）、
+# 清理间隔（秒）、分批删除的每批条数和批间暂停（秒）、分区模式下预建的未来月份数
+LOG_RETENTION_DAYS = int(os.environ.get('LOG_RETENTION_DAYS') or 0)
+LOG_RETENTION_MODE = os.environ.get('LOG_RETENTION_MODE') or 'delete'
+LOG_RETENTION_INTERVAL = int(os.environ.get('LOG_RETENTION_INTERVAL') or 86400)
+LOG_RETENTION_BATCH_SIZE = int(os.environ.get('LOG_RETENTION_BATCH_SIZE') or 1000)
+LOG_RETENTION_PAUSE = float(os.environ.get('LOG_RETENTION_PAUSE') or 0.1)
+LOG_PARTITION_MONTHS_AHEAD = int(os.environ.get('LOG_PARTITION_MONTHS_AHEAD') or 2)
+
+# 部署任务：单次 SSE 连接的最长持续时间（秒），需小于 gunicorn 的 timeout，超时后客户端自动重连；
+# 连接期间占用一个 worker，不宜过长
+DEPLOY_EVENTS_MAX_SECONDS = int(os.environ.get('DEPLOY_EVENTS_MAX_SECONDS') or 15)
+
+# 数据库连接池（每个 worker 进程一个池）：常驻连接数和高峰时额外允许的连接数，
+# 用 gunicorn 启动时由 gunicorn_config.py 按 worker 类型和并发数设置默认值
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+# 连接最长使用时间（秒），需小于 MySQL 的 wait_timeout，避免取到已被服务端断开的连接
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+# 取连接时先 ping 一次，断开的连接丢弃重连（每次取连接多一次往返）
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+# 连接池已满时等待空闲连接的最长时间（秒）
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT') or 10)
+# 建立 MySQL 连接的超时时间（秒）
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT') or 5)
+
 class Config:
     # 数据库配置（从环境变量读取）
     MYSQL_HOST = os.environ.get('MYSQL_HOST') or 'localhost'
@@ -21,6 +110,15 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # 连接池类在 create_app 中设置（db.pool.InstrumentedQueuePool），config 不依赖 SQLAlchemy
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'connect_args': {'connect_timeout': DB_CONNECT_TIMEOUT}
+    }
 
     # 密钥
     SECRET_KEY = os.environ.get('SECRET_KEY')
@@ -30,3 +128,6 @@ class Config:
     
     # JSON配置：不转义中文
     JSON_AS_ASCII = False
+
+    # 请求体上限取批量导入的上限：没有 Content-Length 的分块上传在 werkzeug 读取请求体时按此上限中止
+    MAX_CONTENT_LENGTH = PROTOCOL_IMPORT_MAX_BYTES
@@ -39,8 +39,10 @@ CREATE TABLE IF NOT EXISTS operation_logs (
     details TEXT,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-    INDEX idx_user_id (user_id),
-    INDEX idx_created_at (created_at)
+    INDEX idx_created_at_id (created_at, id),
+    INDEX idx_user_id_created_at (user_id, created_at, id),
+    INDEX idx_action_created_at (action, created_at, id),
+    INDEX idx_resource_type_created_at (resource_type, created_at, id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- 插入默认管理员账户 (用户名: admin@fun.tv, 密码: ******)
@@ -0,0 +1,17 @@
+-- 操作日志索引迁移脚本（已按旧版 init.sql 建表的数据库执行一次）
+-- 日志按 (created_at, id) 倒序翻页，各筛选条件的复合索引都以 (created_at, id) 结尾；
+-- 新索引覆盖了旧的单列索引，因此删除旧索引（外键 user_id 由 idx_user_id_created_at 支撑）
+
+USE h5_protocol_db;
+
+ALTER TABLE operation_logs
+    ADD INDEX idx_created_at_id (created_at, id),
+    ADD INDEX idx_user_id_created_at (user_id, created_at, id),
+    ADD INDEX idx_action_created_at (action, created_at, id),
+    ADD INDEX idx_resource_type_created_at (resource_type, created_at, id),
+    ALGORITHM=INPLACE, LOCK=NONE;
+
+ALTER TABLE operation_logs
+    DROP INDEX idx_user_id,
+    DROP INDEX idx_created_at,
+    ALGORITHM=INPLACE, LOCK=NONE;
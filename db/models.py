@@ -1,12 +1,31 @@
 """
 数据库模型定义
 """
+import pytz
+from functools import lru_cache
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timezone
 
 # 从database模块导入db实例
 from db.database import db
+from config import PASSWORD_HASH_METHOD
+
+# 日志时间以 UTC 存储，展示时转换为上海时区（时区对象只创建一次）
+LOCAL_TZ = pytz.timezone('Asia/Shanghai')
+
+
+@lru_cache(maxsize=1)
+def _password_hash_prefix():
+    """当前配置生成的哈希前缀（配置可以简写，如 scrypt、pbkdf2，这里得到补全参数后的形式）"""
+    return generate_password_hash('', method=PASSWORD_HASH_METHOD).split('$', 1)[0]
+
+
+def format_local_time(utc_time):
+    """把数据库中的 UTC 时间格式化为本地时间字符串"""
+    if not utc_time:
+        return None
+    return utc_time.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ).strftime('%Y-%m-%d %H:%M:%S')
 
 
 class User(UserMixin, db.Model):
@@ -23,12 +42,16 @@ class User(UserMixin, db.Model):
 
     def set_password(self, password):
         """设置密码哈希"""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = generate_password_hash(password, method=PASSWORD_HASH_METHOD)
 
     def check_password(self, password):
         """检查密码"""
         return check_password_hash(self.password_hash, password)
 
+    def needs_rehash(self):
+        """密码哈希的算法或参数是否与当前配置不一致"""
+        return self.password_hash.split('$', 1)[0] != _password_hash_prefix()
+
     def to_dict(self):
         """转换为字典格式"""
         return {
@@ -64,6 +87,14 @@ class Protocol(db.Model):
 class OperationLog(db.Model):
     """操作日志模型"""
     __tablename__ = 'operation_logs'
+    # 日志按 (created_at, id) 倒序翻页，各筛选条件的索引都以 (created_at, id) 结尾，
+    # 筛选后的翻页只需沿索引顺序读取，不需要排序
+    __table_args__ = (
+        db.Index('idx_created_at_id', 'created_at', 'id'),
+        db.Index('idx_user_id_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('idx_action_created_at', 'action', 'created_at', 'id'),
+        db.Index('idx_resource_type_created_at', 'resource_type', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -78,15 +109,6 @@ class OperationLog(db.Model):
 
     def to_dict(self):
         """转换为字典格式"""
-        # 将UTC时间转换为本地时间（假设本地时区为UTC+8）
-        local_time = None
-        if self.created_at:
-            import pytz
-            from datetime import timezone
-            # 将UTC时间转换为本地时间（上海时区）
-            utc_time = self.created_at.replace(tzinfo=timezone.utc)
-            local_tz = pytz.timezone('Asia/Shanghai')
-            local_time = utc_time.astimezone(local_tz)
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -95,5 +117,5 @@ class OperationLog(db.Model):
             'resource_type': self.resource_type,
             'resource_name': self.resource_name,
             'details': self.details,
-            'created_at': local_time.strftime('%Y-%m-%d %H:%M:%S') if local_time else None
+            'created_at': format_local_time(self.created_at)
         }
@@ -0,0 +1,40 @@
+-- 操作日志按月分区（可选，仅 MySQL）
+-- 分区后日志清理只需 DROP PARTITION，不再逐行删除；执行后设置环境变量 LOG_RETENTION_MODE=partition
+-- 和 LOG_RETENTION_DAYS（默认 0 不清理，也就不会预建分区）。
+-- MySQL 分区表的限制：
+--   1. 不支持外键，需要先删除 user_id 上的外键（删除用户时不再级联删除其日志）
+--   2. 主键和唯一索引必须包含分区列，主键改为 (id, created_at)
+--   3. created_at 不能为 NULL
+-- 大表执行 ALTER 会重建整张表，请在低峰期执行，或先用 pt-online-schema-change 等工具
+-- 初始只建两个分区：p_old 存放本月之前的全部日志，pmax 存放本月及以后的日志；
+-- 清理任务每次运行时从 pmax 中拆出本月和未来 LOG_PARTITION_MONTHS_AHEAD 个月的分区（pYYYYMM），
+-- p_old 在其中最新的日志也过期后整个删除。执行后可以先手动调用一次 run_log_retention() 预建分区。
+
+USE h5_protocol_db;
+
+SET @fk_name = (
+    SELECT CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS
+    WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME = 'operation_logs'
+    LIMIT 1
+);
+SET @sql = IF(@fk_name IS NULL, 'SELECT 1', CONCAT('ALTER TABLE operation_logs DROP FOREIGN KEY ', @fk_name));
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+UPDATE operation_logs SET created_at = UTC_TIMESTAMP() WHERE created_at IS NULL;
+
+ALTER TABLE operation_logs
+    MODIFY created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, created_at);
+
+-- 分区边界按执行时的当前月份计算，不写死日期
+SET @sql = CONCAT(
+    'ALTER TABLE operation_logs PARTITION BY RANGE (TO_DAYS(created_at)) (',
+    'PARTITION p_old VALUES LESS THAN (', TO_DAYS(DATE_FORMAT(UTC_TIMESTAMP(), '%Y-%m-01')), '), ',
+    'PARTITION pmax VALUES LESS THAN MAXVALUE)'
+);
+PREPARE stmt FROM @sql;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
@@ -0,0 +1,133 @@
+"""
+带统计的数据库连接池
+
+在 QueuePool 的基础上记录每次从池中取连接的耗时（含等待空闲连接、新建连接和 pre_ping 检测）、
+等待超时次数，以及新建和失效的连接数，供 /api/health/db 查看，用于按实际负载调整连接池大小。
+统计按连接池保存，只在当前 worker 进程内有效。
+"""
+import time
+import weakref
+import threading
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# 计算分位数时保留的最近取连接耗时样本数
+ACQUIRE_SAMPLE_SIZE = 1000
+
+# 当前进程中所有带统计的连接池，fork 后由 reset_pool_stats() 清零
+_pools = weakref.WeakSet()
+
+
+class PoolStats:
+    """单个连接池的统计"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.acquired = 0          # 成功取到连接的次数
+        self.timeouts = 0          # 等待连接超时（pool_timeout）的次数
+        self.total_seconds = 0.0   # 取连接的累计耗时
+        self.max_seconds = 0.0     # 取连接的最长耗时
+        self.samples = deque(maxlen=ACQUIRE_SAMPLE_SIZE)
+        self.opened = 0            # 新建的数据库连接数（含断线重连）
+        self.invalidated = 0       # 失效丢弃的连接数（pre_ping 发现断开、执行出错等）
+
+    def reset(self):
+        with self.lock:
+            self._clear()
+
+    def on_connect(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.opened += 1
+
+    def on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self.lock:
+            self.invalidated += 1
+
+
+class InstrumentedQueuePool(QueuePool):
+    """记录取连接耗时的 QueuePool，统计保存在连接池自身的 stats 上"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 监听器挂在连接池实例上；engine.dispose() 重建连接池时旧池的监听器会随 dispatch 复制过来，
+        # 但它们只更新旧池已不再使用的 stats，不影响新池的统计
+        self.stats = PoolStats()
+        event.listen(self, 'connect', self.stats.on_connect)
+        event.listen(self, 'invalidate', self.stats.on_invalidate)
+        _pools.add(self)
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with self.stats.lock:
+                self.stats.timeouts += 1
+            raise
+        elapsed = time.perf_counter() - start
+        with self.stats.lock:
+            self.stats.acquired += 1
+            self.stats.total_seconds += elapsed
+            self.stats.max_seconds = max(self.stats.max_seconds, elapsed)
+            self.stats.samples.append(elapsed)
+        return connection
+
+
+def reset_pool_stats():
+    """清零当前进程中所有连接池的统计（gunicorn 的 post_fork 中调用，worker 不继承主进程的统计）"""
+    for pool in list(_pools):
+        pool.stats.reset()
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(len(sorted_values) * pct / 100), len(sorted_values) - 1)]
+
+
+def get_pool_stats(pool):
+    """获取连接池当前状态和取连接统计（耗时单位：毫秒）"""
+    def ms(seconds):
+        return round(seconds * 1000, 3) if seconds is not None else None
+
+    result = {'class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        result.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # QueuePool 内部的 overflow 在连接数未达到 pool_size 时为负数
+            'overflow': max(pool.overflow(), 0),
+            'timeout': pool.timeout(),
+        })
+
+    stats = getattr(pool, 'stats', None)
+    if stats is None:
+        return result
+
+    with stats.lock:
+        acquired, timeouts = stats.acquired, stats.timeouts
+        total_seconds, max_seconds = stats.total_seconds, stats.max_seconds
+        samples = sorted(stats.samples)
+        opened, invalidated = stats.opened, stats.invalidated
+
+    result['acquire'] = {
+        'count': acquired,
+        'timeouts': timeouts,
+        'avg_ms': ms(total_seconds / acquired) if acquired else None,
+        'p50_ms': ms(_percentile(samples, 50)),
+        'p95_ms': ms(_percentile(samples, 95)),
+        'p99_ms': ms(_percentile(samples, 99)),
+        'max_ms': ms(max_seconds),
+        'sample_size': len(samples),
+    }
+    result['connections'] = {
+        'opened': opened,
+        'invalidated': invalidated,
+    }
+    return result
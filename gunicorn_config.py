@@ -1,17 +1,64 @@
 # Gunicorn 配置文件
+import os
 import multiprocessing
 
+cpu_count = multiprocessing.cpu_count()
+
+# 工作模式（GUNICORN_PROFILE 选择，默认 sync）
+# 请求大多在等 git / npm 子进程和 MySQL，sync 模式下每个 worker 同时只能处理一个请求，大部分时间在阻塞；
+# gthread 每个 worker 开多个线程；gevent 用协程，需要 pip install gevent，
+# pymysql 是纯 Python 驱动，gevent worker 启动时打过 monkey patch 后即可协作式让出。
+# gevent 的限制：fsync（协议写入日志、预览库）不会让出协程，执行期间整个 worker 停顿；
+# 文件锁（utils/file_lock.py）在 gevent 下改为轮询获取，不会卡住其他协程。
+# gthread / gevent 尚未在生产负载下压测对比，默认保持 sync，切换前先用 scripts/load_test.py 测量。
+# 每种模式下数据库连接池大小与单个 worker 的并发数匹配（多出的 2 个留给日志写入等后台线程）。
+PROFILES = {
+    'sync': {
+        'worker_class': 'sync',
+        'workers': cpu_count * 2 + 1,
+        'threads': 1,
+        'worker_connections': 1,
+    },
+    'gthread': {
+        'worker_class': 'gthread',
+        'workers': cpu_count + 1,
+        'threads': 8,
+        'worker_connections': 8,
+    },
+    'gevent': {
+        'worker_class': 'gevent',
+        'workers': cpu_count,
+        'threads': 1,
+        'worker_connections': 200,
+    },
+}
+
+profile_name = os.environ.get('GUNICORN_PROFILE') or 'sync'
+if profile_name not in PROFILES:
+    raise ValueError(f'不支持的 GUNICORN_PROFILE: {profile_name}（可选 {", ".join(PROFILES)}）')
+profile = PROFILES[profile_name]
+
 # 绑定地址和端口
-bind = "0.0.0.0:5000"
+bind = os.environ.get('GUNICORN_BIND') or "0.0.0.0:5000"
 
-# 工作进程数（推荐：CPU核心数 * 2 + 1）
-workers = multiprocessing.cpu_count() * 2 + 1
+# 工作进程数、每个进程的线程数（gthread）和协程数（gevent），均可用环境变量覆盖
+worker_class = profile['worker_class']
+workers = int(os.environ.get('GUNICORN_WORKERS') or profile['workers'])
+threads = int(os.environ.get('GUNICORN_THREADS') or profile['threads'])
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS') or profile['worker_connections'])
 
-# 工作模式
-worker_class = "sync"
+# 单个 worker 的并发请求数；gevent 下协程很多，但同时查询数据库的不多，连接池封顶 20，其余请求排队等连接
+concurrency = {'sync': 1, 'gthread': threads, 'gevent': min(worker_connections, 20)}[profile_name]
+
+# 数据库连接池：通过环境变量传给 worker 进程（config.py 读取），已设置的环境变量优先
+os.environ.setdefault('DB_POOL_SIZE', str(concurrency + 2))
+os.environ.setdefault('DB_MAX_OVERFLOW', str(max(concurrency // 2, 2)))
 
 # 超时时间（秒）
-timeout = 120
+timeout = int(os.environ.get('GUNICORN_TIMEOUT') or 120)
+
+# 长连接保持时间（秒），前面有 Nginx 时减少反复建连
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE') or 5)
 
 # 日志
 accesslog = "logs/access.log"
@@ -20,3 +67,30 @@ loglevel = "info"
 
 # 进程名称
 proc_name = "h5_protocol_server"
+
+
+def on_starting(server):
+    """启动时打印实际生效的 worker 配置"""
+    server.log.info(
+        f"worker 配置: profile={profile_name} worker_class={worker_class} workers={workers} "
+        f"threads={threads} worker_connections={worker_connections} "
+        f"db_pool_size={os.environ['DB_POOL_SIZE']} db_max_overflow={os.environ['DB_MAX_OVERFLOW']}"
+    )
+    if worker_class == 'gevent':
+        server.log.warning('gevent 模式下 fsync 不会让出协程，协议写入较多时可设置 PROTOCOL_FSYNC=0 或改用 gthread')
+
+
+def post_fork(server, worker):
+    """worker 启动后清零继承自主进程的连接池统计，并开启后台日志清理（LOG_RETENTION_DAYS 为 0 时不清理）"""
+    from db.pool import reset_pool_stats
+    reset_pool_stats()
+
+    from app import app
+    from services.log_service import start_log_retention
+    start_log_retention(app)
+
+
+def worker_exit(server, worker):
+    """worker 退出前把队列中的操作日志写入数据库"""
+    from services.log_service import flush_operation_logs
+    flush_operation_logs()
@@ -1,9 +1,13 @@
 """
 认证相关路由
 """
+import math
 from flask import Blueprint, request, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
 from services.auth_service import authenticate_user, register_user
+from services.token_service import issue_token, revoke_token, TokenUser
+from config import LOGIN_USER_BURST, LOGIN_USER_RATE, LOGIN_IP_BURST, LOGIN_IP_RATE
+from utils.rate_limit import TokenBucketLimiter
 
 # 在函数内部使用db，避免在模块级别导入导致的循环依赖
 def get_db():
@@ -12,6 +16,26 @@ def get_db():
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+# 登录限流：在计算密码哈希之前拒绝高频请求，避免撞库把所有 worker 占满
+_login_user_limiter = TokenBucketLimiter(LOGIN_USER_BURST, LOGIN_USER_RATE)
+_login_ip_limiter = TokenBucketLimiter(LOGIN_IP_BURST, LOGIN_IP_RATE)
+
+
+def _check_login_rate(username):
+    """检查登录频率，超限时返回建议的重试等待秒数，否则返回 None
+
+    一个限流器拒绝时退还另一个已消耗的令牌；用户名的令牌在登录成功后由调用方退还，
+    只有失败的尝试计入用户名限流。
+    """
+    ip_allowed, ip_retry = _login_ip_limiter.acquire(request.remote_addr)
+    if not ip_allowed:
+        return ip_retry
+    user_allowed, user_retry = _login_user_limiter.acquire(username)
+    if not user_allowed:
+        _login_ip_limiter.refund(request.remote_addr)
+        return user_retry
+    return None
+
 
 @auth_bp.route('/register', methods=['POST'])
 def register():
@@ -50,12 +74,30 @@ def login():
         if not username or not password:
             return jsonify({'error': '用户名和密码不能为空'}), 400
 
+        retry_after = _check_login_rate(username)
+        if retry_after is not None:
+            response = jsonify({'error': '登录尝试过于频繁，请稍后再试'})
+            response.headers['Retry-After'] = str(math.ceil(retry_after))
+            return response, 429
+
         result = authenticate_user(username, password)
         user = result['user']
         error = result['error']
 
         if error:
             return jsonify({'error': error}), 401
+        _login_user_limiter.refund(username)
+
+        # 脚本类客户端可以申请令牌代替 Cookie 会话
+        if data.get('issue_token'):
+            token, expires_in = issue_token(user)
+            return jsonify({
+                'message': '登录成功',
+                'user': user.to_dict(),
+                'token': token,
+                'token_type': 'Bearer',
+                'expires_in': expires_in
+            }), 200
 
         login_user(user)
 
@@ -70,8 +112,11 @@ def login():
 @auth_bp.route('/logout', methods=['POST'])
 @login_required
 def logout():
-    """用户登出"""
-    logout_user()
+    """用户登出（令牌认证时撤销当前令牌）"""
+    if isinstance(current_user._get_current_object(), TokenUser):
+        revoke_token(current_user._get_current_object())
+    else:
+        logout_user()
     return jsonify({'message': '登出成功'}), 200
 
 
@@ -1,11 +1,19 @@
 """
 Git 相关路由
 """
-from flask import Blueprint, request, jsonify
+import json
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from services.git_service import get_git_status, pull_latest, deploy, get_git_log, get_branch_status
+from config import DEPLOY_EVENTS_MAX_SECONDS
+from services.git_service import (
+    get_git_status, pull_latest, get_git_log, iter_git_log, get_branch_status, GIT_LOG_MAX_LIMIT,
+    parse_log_cursor, make_log_cursor
+)
+from services.deploy_service import (
+    submit_deploy, get_deploy_job, read_deploy_events, iter_deploy_events, DeployInProgressError
+)
 from utils.auth import require_login, require_role
-from db.models import OperationLog
+from services.log_service import record_operation
 from db.database import db
 
 def get_db():
@@ -32,11 +40,36 @@ def status():
 @git_bp.route('/log', methods=['GET'])
 @require_login
 def log():
-    """获取 Git 提交历史"""
+    """获取 Git 提交历史
+
+    支持 after（游标，取上一页响应头 X-Next-Cursor 的值）和 path（只看修改过该路径的提交）；
+    format=ndjson 或 Accept: application/x-ndjson 时以 NDJSON 流式返回，
+    此时响应头 X-Log-Tip 为本次遍历的起点，下一页的游标为 <X-Log-Tip>:<最后一条的 full_hash>。
+    """
     try:
-        limit = request.args.get('limit', 15, type=int)
-        commits = get_git_log(limit)
-        return jsonify(commits), 200
+        limit = min(max(request.args.get('limit', 15, type=int), 1), GIT_LOG_MAX_LIMIT)
+        tip, after = parse_log_cursor(request.args.get('after'))
+        path = request.args.get('path') or None
+
+        if request.args.get('format') == 'ndjson' or \
+                request.accept_mimetypes.best == 'application/x-ndjson':
+            commits = iter_git_log(limit, after=after, path=path, tip=tip)
+            response = Response(
+                stream_with_context(json.dumps(c, ensure_ascii=False) + '\n' for c in commits),
+                mimetype='application/x-ndjson'
+            )
+            if tip:
+                response.headers['X-Log-Tip'] = tip
+            return response
+
+        commits = get_git_log(limit, after=after, path=path, tip=tip)
+        response = jsonify(commits)
+        if len(commits) == limit:
+            # 可能还有更早的提交；游标带上第一页的起点，翻页时始终从同一起点遍历
+            response.headers['X-Next-Cursor'] = make_log_cursor(tip, commits[-1]['full_hash'])
+        return response, 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except FileNotFoundError as e:
         return jsonify({'error': str(e)}), 404
     except RuntimeError as e:
@@ -68,16 +101,13 @@ def pull():
         data = pull_latest()
 
         # 记录操作日志
-        log = OperationLog(
+        record_operation(
             user_id=current_user.id,
             action='git_pull',
             resource_type='git',
             resource_name='repository',
             details=f'执行了git pull操作，获取了最新代码'
         )
-        database = get_db()
-        database.session.add(log)
-        database.session.commit()
 
         return jsonify(data), 200
     except FileNotFoundError as e:
@@ -95,37 +125,67 @@ def pull():
 @git_bp.route('/deploy', methods=['POST'])
 @require_role('admin', 'editor')
 def deploy_route():
-    """执行部署流程"""
+    """提交部署任务，立即返回任务 ID，通过任务状态和事件接口查看进度"""
     try:
         data = request.json
         commit_message = data.get('commit_message', '')
 
-        result = deploy(commit_message)
-
-        # 记录操作日志
-        log = OperationLog(
-            user_id=current_user.id,
-            action='git_deploy',
-            resource_type='git',
-            resource_name='repository',
-            details=f'执行了部署操作，提交信息: {commit_message}'
-        )
-        database = get_db()
-        database.session.add(log)
-        database.session.commit()
-
-        return jsonify(result), 200
+        job = submit_deploy(commit_message, current_user.id)
+        job['status_url'] = f"/api/git/deploy/{job['id']}"
+        job['events_url'] = f"/api/git/deploy/{job['id']}/events"
+        return jsonify(job), 202
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
+    except DeployInProgressError as e:
+        return jsonify({'error': str(e), 'job_id': e.job_id}), 409
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@git_bp.route('/deploy/<job_id>', methods=['GET'])
+@require_login
+def deploy_status(job_id):
+    """获取部署任务状态和已完成的步骤
+
+    传入 offset 时一并返回该序号之后的进度事件，供轮询使用（不占用 worker 等待）。
+    """
+    try:
+        job = get_deploy_job(job_id)
+        offset = request.args.get('offset', type=int)
+        if offset is not None:
+            job['events'], job['next_offset'] = read_deploy_events(job_id, offset=max(offset, 0))
+        return jsonify(job), 200
     except FileNotFoundError as e:
         return jsonify({'error': str(e)}), 404
-    except RuntimeError as e:
-        # 如果部署失败，返回已执行的步骤
-        error_message = str(e)
-        # 尝试从异常中获取步骤信息（如果有的话）
-        steps = getattr(e, 'steps', [])
-        return jsonify({'error': error_message, 'steps': steps}), 500
     except Exception as e:
-        database = get_db()
-        database.session.rollback()
         return jsonify({'error': str(e)}), 500
+
+
+@git_bp.route('/deploy/<job_id>/events', methods=['GET'])
+@require_login
+def deploy_events(job_id):
+    """以 SSE 推送部署进度
+
+    单次连接最长保持 DEPLOY_EVENTS_MAX_SECONDS 秒，断开后浏览器会带上 Last-Event-ID 自动重连，
+    从断点继续推送；任务结束时推送 done 事件。连接期间占用一个 worker（sync 模式下即一个进程），
+    查看人数多时改用任务状态接口的 offset 参数轮询。
+    """
+    try:
+        get_deploy_job(job_id)
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    offset = request.headers.get('Last-Event-ID', type=int) or request.args.get('offset', 0, type=int)
+
+    def generate():
+        yield 'retry: 2000\n\n'
+        for index, event in iter_deploy_events(job_id, offset=offset, max_seconds=DEPLOY_EVENTS_MAX_SECONDS):
+            yield f"id: {index}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
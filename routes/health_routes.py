@@ -0,0 +1,21 @@
+"""
+健康检查相关路由
+"""
+from flask import Blueprint, jsonify
+from flask_login import login_required
+from services.health_service import check_database
+from utils.auth import require_role
+
+health_bp = Blueprint('health', __name__, url_prefix='/api/health')
+
+
+@health_bp.route('/db', methods=['GET'])
+@login_required
+@require_role('admin')
+def db_health():
+    """数据库连接池状态（统计只针对处理本次请求的 worker 进程）"""
+    try:
+        healthy, result = check_database()
+        return jsonify(result), 200 if healthy else 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,9 +1,10 @@
 """
 操作日志相关路由
 """
+import math
 from flask import Blueprint, request, jsonify
 from flask_login import login_required
-from services.log_service import get_operation_logs
+from services.log_service import get_operation_logs, serialize_operation_logs
 from utils.auth import require_login, require_role
 
 def get_db():
@@ -12,6 +13,9 @@ def get_db():
 
 log_bp = Blueprint('log', __name__, url_prefix='/api/logs')
 
+# 每页条数的上限
+LOG_PAGE_MAX_LIMIT = 200
+
 
 @log_bp.route('', methods=['GET'])
 @login_required
@@ -19,13 +23,16 @@ log_bp = Blueprint('log', __name__, url_prefix='/api/logs')
 def get_logs_api():
     """获取操作日志"""
     try:
-        # 支持分页和筛选
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 15, type=int)
+        # 支持分页和筛选；传入 cursor 时按游标翻页（空字符串表示第一页）
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = min(max(request.args.get('limit', 15, type=int), 1), LOG_PAGE_MAX_LIMIT)
+        cursor = request.args.get('cursor')
         action_filter = request.args.get('action')
         resource_type_filter = request.args.get('resource_type')
         username_filter = request.args.get('username')
         user_id_filter = request.args.get('userId', type=int)
+        # 游标翻页默认不统计总数
+        include_total = cursor is None or request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
 
         logs = get_operation_logs(
             page=page,
@@ -33,17 +40,30 @@ def get_logs_api():
             action_filter=action_filter,
             resource_type_filter=resource_type_filter,
             username_filter=username_filter,
-            user_id_filter=user_id_filter
+            user_id_filter=user_id_filter,
+            cursor=cursor,
+            include_total=include_total
         )
 
-        return jsonify({
-            'logs': [log.to_dict() for log in logs.items],
-            'pagination': {
+        if cursor is not None:
+            pagination = {
+                'limit': limit,
+                'total': logs['total'],
+                'next_cursor': logs['next_cursor']
+            }
+        else:
+            pagination = {
                 'page': page,
                 'limit': limit,
-                'total': logs.total,
-                'pages': logs.pages
+                'total': logs['total'],
+                'pages': math.ceil(logs['total'] / limit)
             }
+
+        return jsonify({
+            'logs': serialize_operation_logs(logs['items']),
+            'pagination': pagination
         }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,19 +1,28 @@
 """
 协议相关路由
 """
-from flask import Blueprint, request, jsonify
+from datetime import datetime
+from flask import Blueprint, request, jsonify, Response
 from flask_login import login_required, current_user
+from werkzeug.exceptions import RequestEntityTooLarge
+from config import PROTOCOL_IMPORT_MAX_BYTES
 from services.protocol_service import (
-    get_protocol_list,
+    search_protocol_list,
+    get_protocol_list_etag,
+    get_protocol_etag,
     get_protocol,
     create_protocol,
     update_protocol,
     delete_protocol,
     create_preview,
-    get_preview_content
+    get_preview_content,
+    export_protocols,
+    import_protocols,
+    ImportTooLargeError
 )
+from services.git_service import get_protocol_history, get_protocol_diff
 from utils.auth import require_login, require_role
-from db.models import OperationLog
+from services.log_service import record_operation
 
 def get_db():
     from db.database import db
@@ -21,19 +30,135 @@ def get_db():
 
 protocol_bp = Blueprint('protocol', __name__, url_prefix='/api/protocols')
 
+# 分页时每页条数的上限
+MAX_PAGE_LIMIT = 500
+
+
+def _is_not_modified(etag):
+    """判断客户端缓存是否仍然有效
+
+    只认 If-None-Match：Last-Modified 是文件的修改时间，只改数据库属性（描述、应用类型）时不会变化，
+    按 If-Modified-Since 返回 304 会让客户端继续使用旧属性。
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return False
+
+
+def _set_validators(response, etag, last_modified=None):
+    """设置缓存校验头，要求客户端每次使用前重新验证"""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def _not_modified_response(etag, last_modified=None):
+    """返回 304 响应"""
+    return _set_validators(Response(status=304), etag, last_modified)
+
 
 @protocol_bp.route('', methods=['GET'])
 @require_login
 def list_protocols():
-    """获取协议列表"""
+    """获取协议列表
+
+    支持 sort/order/app_type/app_name/q 筛选排序；传入 page 或 limit 时分页返回，
+    否则保持原有格式返回完整数组。
+    """
     try:
-        files = get_protocol_list()
+        etag = get_protocol_list_etag(request.query_string.decode('utf-8'))
+        if _is_not_modified(etag):
+            return _not_modified_response(etag)
+
+        paginated = 'page' in request.args or 'limit' in request.args
+        page = request.args.get('page', 1, type=int) if paginated else None
+        limit = request.args.get('limit', 20, type=int) if paginated else None
+        if paginated:
+            page = max(page, 1)
+            limit = min(max(limit, 1), MAX_PAGE_LIMIT)
+
+        files, total = search_protocol_list(
+            sort=request.args.get('sort', 'updateTime'),
+            order=request.args.get('order', 'desc'),
+            app_type=request.args.get('app_type'),
+            app_name=request.args.get('app_name'),
+            q=request.args.get('q'),
+            page=page,
+            limit=limit
+        )
+
+        if paginated:
+            files = {
+                'protocols': files,
+                'pagination': {
+                    'page': page,
+                    'limit': limit,
+                    'total': total,
+                    'pages': (total + limit - 1) // limit
+                }
+            }
+
         from flask import current_app
-        return current_app.response_class(
+        response = current_app.response_class(
             response=current_app.json.dumps(files, ensure_ascii=False),
             status=200,
             mimetype='application/json; charset=utf-8'
         )
+        return _set_validators(response, etag)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@protocol_bp.route('/export', methods=['GET'])
+@require_login
+def export_route():
+    """批量导出协议：format=tar（默认，tar.gz）或 ndjson，流式返回"""
+    try:
+        fmt = request.args.get('format', 'tar')
+        chunks = export_protocols(fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    if fmt == 'ndjson':
+        mimetype, download_name = 'application/x-ndjson', f'protocols_{timestamp}.ndjson'
+    else:
+        mimetype, download_name = 'application/gzip', f'protocols_{timestamp}.tar.gz'
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={download_name}'
+    })
+
+
+@protocol_bp.route('/import', methods=['POST'])
+@require_role('admin', 'editor')
+def import_route():
+    """批量导入协议：请求体为 tar 包（可压缩）或 NDJSON，也可以用 multipart 的 file 字段上传"""
+    try:
+        # 必须在读取 request.files 之前检查：werkzeug 解析 multipart 时会先把整个请求体读完并写入临时文件。
+        # 没有 Content-Length 的分块上传由 MAX_CONTENT_LENGTH 在读取过程中中止
+        if request.content_length is not None and request.content_length > PROTOCOL_IMPORT_MAX_BYTES:
+            raise ImportTooLargeError()
+        upload = request.files.get('file')
+        stream = upload.stream if upload else request.stream
+        mimetype = upload.mimetype if upload else request.mimetype
+        fmt = request.args.get('format') or ('ndjson' if mimetype == 'application/x-ndjson' else 'tar')
+        overwrite = request.args.get('overwrite', '').lower() in ('1', 'true', 'yes')
+
+        # 操作日志在导入事务中批量写入
+        result = import_protocols(stream, current_user.id, fmt, overwrite)
+        return jsonify({'message': '导入成功', **result}), 200
+    except ImportTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    except RequestEntityTooLarge:
+        return jsonify({'error': str(ImportTooLargeError())}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -43,8 +168,43 @@ def list_protocols():
 def retrieve_protocol(filename):
     """获取协议内容"""
     try:
+        etag, last_modified = get_protocol_etag(filename)
+        if etag and _is_not_modified(etag):
+            return _not_modified_response(etag, last_modified)
+
         data = get_protocol(filename)
+        response = jsonify(data)
+        if etag:
+            _set_validators(response, etag, last_modified)
+        return response, 200
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@protocol_bp.route('/<path:filename>/history', methods=['GET'])
+@require_login
+def protocol_history(filename):
+    """获取协议文件的 Git 修改历史"""
+    try:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        return jsonify(get_protocol_history(filename, limit)), 200
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@protocol_bp.route('/<path:filename>/diff', methods=['GET'])
+@require_login
+def protocol_diff(filename):
+    """比较协议文件两个版本的差异（from 必填，to 默认为 HEAD）"""
+    try:
+        data = get_protocol_diff(filename, request.args.get('from'), request.args.get('to') or 'HEAD')
         return jsonify(data), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except FileNotFoundError as e:
         return jsonify({'error': str(e)}), 404
     except Exception as e:
@@ -65,16 +225,13 @@ def create():
 
         created_filename = create_protocol(filename, content, description, app_type, app_name)
 
-        log = OperationLog(
+        record_operation(
             user_id=current_user.id,
             action='create_protocol',
             resource_type='protocol',
             resource_name=created_filename,
             details=f'创建了协议文件: {created_filename}'
         )
-        db = get_db()
-        db.session.add(log)
-        db.session.commit()
 
         return jsonify({'message': '创建成功', 'filename': created_filename}), 201
     except ValueError as e:
@@ -100,16 +257,13 @@ def update(filename):
 
         update_protocol(filename, content, description, app_type, app_name)
 
-        log = OperationLog(
+        record_operation(
             user_id=current_user.id,
             action='update_protocol',
             resource_type='protocol',
             resource_name=filename,
             details=f'更新了协议文件: {filename}'
         )
-        db = get_db()
-        db.session.add(log)
-        db.session.commit()
 
         return jsonify({'message': '更新成功'}), 200
     except FileNotFoundError as e:
@@ -128,16 +282,13 @@ def delete(filename):
         delete_protocol(filename)
 
         # 记录操作日志
-        log = OperationLog(
+        record_operation(
             user_id=current_user.id,
             action='delete_protocol',
             resource_type='protocol',
             resource_name=filename,
             details=f'删除了协议文件: {filename}'
         )
-        db = get_db()
-        db.session.add(log)
-        db.session.commit()
 
         return jsonify({'message': '删除成功'}), 200
     except FileNotFoundError as e:
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+接口压测脚本（只依赖标准库）
+
+用于比较不同 gunicorn worker 配置（GUNICORN_PROFILE）下的吞吐和延迟：
+先用账号登录申请 API 令牌，再由多个并发客户端在指定时长内循环请求 GET 接口，
+最后输出每秒请求数、延迟分位数和错误数。
+
+示例：
+    python3 scripts/load_test.py --url http://127.0.0.1:5000 \\
+        --username admin --password xxx --concurrency 50 --duration 30
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+DEFAULT_PATHS = [
+    '/api/protocols',
+    '/api/git/status',
+    '/api/git/log',
+    '/api/logs?limit=20&include_total=0',
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='H5 协议管理服务接口压测')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='服务地址')
+    parser.add_argument('--username', required=True, help='登录用户名')
+    parser.add_argument('--password', required=True, help='登录密码')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发客户端数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--timeout', type=float, default=30, help='单个请求超时（秒）')
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='要请求的 GET 接口路径，可重复指定，默认为常用的列表接口')
+    return parser.parse_args()
+
+
+def new_connection(base, timeout):
+    """创建到服务的 HTTP 长连接"""
+    conn_class = http.client.HTTPSConnection if base.scheme == 'https' else http.client.HTTPConnection
+    return conn_class(base.netloc, timeout=timeout)
+
+
+def login(base, username, password, timeout):
+    """登录并申请 API 令牌"""
+    conn = new_connection(base, timeout)
+    try:
+        body = json.dumps({'username': username, 'password': password, 'issue_token': True})
+        conn.request('POST', '/api/auth/login', body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        data = json.loads(response.read() or b'{}')
+        if response.status != 200:
+            raise RuntimeError(f"登录失败（HTTP {response.status}）: {data.get('error')}")
+        return data['token']
+    finally:
+        conn.close()
+
+
+class Stats:
+    """汇总所有客户端的请求结果"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}  # 路径 -> 成功请求的延迟列表（秒）
+        self.errors = {}     # 路径 -> 失败次数
+        self.error_samples = {}  # 错误描述 -> 次数
+
+    def add(self, path, latency, error=None):
+        with self.lock:
+            if error is None:
+                self.latencies.setdefault(path, []).append(latency)
+            else:
+                self.errors[path] = self.errors.get(path, 0) + 1
+                self.error_samples[error] = self.error_samples.get(error, 0) + 1
+
+
+def run_client(index, base, token, paths, deadline, timeout, stats):
+    """单个客户端：保持一条长连接，轮流请求各接口直到截止时间"""
+    headers = {'Authorization': f'Bearer {token}'}
+    conn = None
+    i = index
+    while time.monotonic() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.monotonic()
+        try:
+            if conn is None:
+                conn = new_connection(base, timeout)
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latency = time.monotonic() - start
+            if response.status >= 400:
+                stats.add(path, latency, f'HTTP {response.status}')
+            else:
+                stats.add(path, latency)
+            if response.will_close:
+                conn.close()
+                conn = None
+        except Exception as e:
+            stats.add(path, time.monotonic() - start, type(e).__name__)
+            if conn is not None:
+                conn.close()
+                conn = None
+    if conn is not None:
+        conn.close()
+
+
+def percentile(sorted_values, pct):
+    """取已排序列表的分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(len(sorted_values) * pct / 100), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def format_row(name, latencies, errors, elapsed):
+    values = sorted(latencies)
+    return (f"{name:<40} {len(values) + errors:>8} {errors:>6} {len(values) / elapsed:>9.1f} "
+            f"{percentile(values, 50) * 1000:>8.1f} {percentile(values, 95) * 1000:>8.1f} "
+            f"{percentile(values, 99) * 1000:>8.1f} {(values[-1] if values else 0) * 1000:>8.1f}")
+
+
+def main():
+    args = parse_args()
+    base = urlsplit(args.url)
+    paths = args.paths or DEFAULT_PATHS
+
+    token = login(base, args.username, args.password, args.timeout)
+    stats = Stats()
+
+    print(f"压测 {args.url}：并发 {args.concurrency}，时长 {args.duration} 秒，接口 {len(paths)} 个")
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(i, base, token, paths, deadline, args.timeout, stats),
+            daemon=True
+        )
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    print(f"\n{'接口':<40} {'请求数':>8} {'错误':>6} {'每秒请求':>9} "
+          f"{'p50(ms)':>8} {'p95(ms)':>8} {'p99(ms)':>8} {'max(ms)':>8}")
+    all_latencies = []
+    total_errors = 0
+    for path in paths:
+        latencies = stats.latencies.get(path, [])
+        errors = stats.errors.get(path, 0)
+        all_latencies.extend(latencies)
+        total_errors += errors
+        print(format_row(path, latencies, errors, elapsed))
+    print(format_row('合计', all_latencies, total_errors, elapsed))
+
+    if stats.error_samples:
+        print('\n错误：')
+        for error, count in sorted(stats.error_samples.items(), key=lambda item: -item[1]):
+            print(f"  {error}: {count}")
+
+    return 1 if total_errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,21 @@
 """
 认证服务
 """
+import time
+import threading
+from sqlalchemy.orm import make_transient_to_detached
+from config import USER_CACHE_TTL
 from db.database import db
 from db.models import User
-from werkzeug.security import check_password_hash
+from utils.version_stamp import bump_stamp, read_stamp
+
+# 登录用户缓存（每个 worker 一份）：user_id -> (过期时间, 版本戳, 字段值)
+# 每个用户有独立的共享版本戳，角色或状态变化时更新，所有 worker 在下一个请求就能感知。
+# 密码哈希不放进缓存，只在 authenticate_user 中从数据库读取
+_USER_CACHE_EXCLUDED = ('password_hash',)
+_user_cache_lock = threading.Lock()
+_user_cache = {}
+_USER_CACHE_SIZE = 1024
 
 
 def authenticate_user(username, password):
@@ -25,7 +37,15 @@ def authenticate_user(username, password):
         # 密码错误
         return {'user': None, 'error': '密码错误'}
     else:
-        # 认证成功
+        # 认证成功；哈希参数已调整过的，借此机会用明文密码重新计算
+        if user.needs_rehash():
+            try:
+                user.set_password(password)
+                db.session.commit()
+                invalidate_user_cache(user.id)
+            except Exception as e:
+                db.session.rollback()
+                print(f"更新密码哈希失败 {username}: {str(e)}")
         return {'user': user, 'error': None}
 
 
@@ -72,3 +92,48 @@ def get_user_by_username(username):
     :return: 用户对象
     """
     return User.query.filter_by(username=username).first()
+
+
+def _user_stamp_name(user_id):
+    """用户版本戳名称"""
+    return f'user_{user_id}'
+
+
+def invalidate_user_cache(user_id):
+    """通知所有 worker 该用户的缓存已失效（修改角色、状态等之后调用）"""
+    bump_stamp(_user_stamp_name(user_id))
+
+
+def load_session_user(user_id):
+    """加载当前会话的登录用户，禁用或不存在的用户返回 None
+
+    缓存命中时只需一次版本戳 stat，不查询数据库；返回的对象通过 merge(load=False)
+    挂到当前 session 上，和查询得到的对象用法相同（未缓存的密码哈希在访问时才从数据库加载）。
+    """
+    stamp = read_stamp(_user_stamp_name(user_id))
+    now = time.monotonic()
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+
+    if cached is None or cached[0] <= now or cached[1] != stamp:
+        user = db.session.get(User, user_id)
+        with _user_cache_lock:
+            if user is None or not user.is_active:
+                _user_cache.pop(user_id, None)
+                return None
+            if len(_user_cache) >= _USER_CACHE_SIZE:
+                _user_cache.clear()
+            # 版本戳在查询之前读取，期间若有更新，下次请求会因版本戳不一致重新加载
+            _user_cache[user_id] = (
+                now + USER_CACHE_TTL,
+                stamp,
+                {
+                    attr.key: getattr(user, attr.key)
+                    for attr in User.__mapper__.column_attrs if attr.key not in _USER_CACHE_EXCLUDED
+                }
+            )
+        return user
+
+    user = User(**cached[2])
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
@@ -0,0 +1,23 @@
+"""
+部署任务 runner
+
+由 deploy_service 以独立进程启动，与 Web worker 的生命周期无关：
+python -m services.deploy_runner <任务 ID> [部署锁的文件描述符]
+"""
+import sys
+from app import app
+from services.deploy_service import run_job_in_runner
+from services.log_service import flush_operation_logs
+
+
+def main(argv):
+    job_id = argv[1]
+    lock_fd = int(argv[2]) if len(argv) > 2 else None
+    ran = run_job_in_runner(app, job_id, lock_fd)
+    # 进程马上退出，等操作日志写入数据库
+    flush_operation_logs()
+    return 0 if ran else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
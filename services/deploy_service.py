@@ -0,0 +1,344 @@
+"""
+部署任务服务
+
+部署流程耗时数分钟，不能占用 Web worker，因此以后台任务方式执行：
+提交后立即返回任务 ID，任务在独立的 runner 子进程（services/deploy_runner.py）中运行，
+worker 重启、超时被杀不会中断正在进行的部署。
+任务状态和进度事件写入 RUNTIME_DIR 下的文件，任何 worker 都能查询；
+同一仓库同一时间只允许一个部署任务（跨进程文件锁，提交时获取，随文件描述符交给 runner 持有）。
+runner 在任务文件中记录自己的 pid，并定期更新心跳文件，据此判断任务是否仍在运行。
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from config import FRONTEND_DIR, RUNTIME_DIR
+from services.git_service import deploy
+from services.log_service import record_operation
+from utils.file_lock import FileLock
+
+# runner 更新心跳的间隔，以及判定 runner 已退出的心跳超时（秒）
+DEPLOY_HEARTBEAT_INTERVAL = 5
+DEPLOY_HEARTBEAT_TIMEOUT = 30
+
+# 项目根目录，runner 以 python -m services.deploy_runner 方式在这里启动
+_PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+class DeployInProgressError(Exception):
+    """已有部署任务正在执行"""
+
+    def __init__(self, job_id=None):
+        super().__init__('已有部署任务正在执行，请稍后再试')
+        self.job_id = job_id
+
+
+def _jobs_dir():
+    """获取部署任务目录"""
+    jobs_dir = Path(RUNTIME_DIR) / 'deploy_jobs'
+    jobs_dir.mkdir(parents=True, exist_ok=True)
+    return jobs_dir
+
+
+def _repo_lock_path():
+    """获取当前仓库的部署锁文件路径"""
+    repo_key = hashlib.sha1(str(FRONTEND_DIR).encode('utf-8')).hexdigest()[:12]
+    return Path(RUNTIME_DIR) / f'deploy_{repo_key}.lock'
+
+
+def _repo_lock():
+    """获取当前仓库的部署锁"""
+    return FileLock(_repo_lock_path())
+
+
+def _job_dir(job_id):
+    """获取任务目录，任务 ID 非法或不存在时抛出 FileNotFoundError"""
+    if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+        raise FileNotFoundError(f'部署任务不存在: {job_id}')
+    job_dir = _jobs_dir() / job_id
+    if not job_dir.exists():
+        raise FileNotFoundError(f'部署任务不存在: {job_id}')
+    return job_dir
+
+
+def _write_job(job_dir, job):
+    """原子写入任务状态"""
+    tmp_path = job_dir / 'job.json.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f, ensure_ascii=False)
+    tmp_path.replace(job_dir / 'job.json')
+
+
+def _read_job(job_dir):
+    """读取任务状态"""
+    with open(job_dir / 'job.json', 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _append_event(job_dir, event):
+    """追加一条进度事件"""
+    with open(job_dir / 'events.ndjson', 'a', encoding='utf-8') as f:
+        f.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+
+def _touch_heartbeat(job_dir):
+    """更新任务心跳"""
+    (job_dir / 'heartbeat').touch()
+
+
+def _current_job_id():
+    """读取当前持有部署锁的任务 ID"""
+    try:
+        return (Path(RUNTIME_DIR) / 'deploy_current').read_text(encoding='utf-8').strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _pid_alive(pid):
+    """检查进程是否存在（Windows 上无法安全探测，视为存在，只依赖心跳）"""
+    if os.name == 'nt':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _runner_alive(job_dir, job):
+    """根据任务文件中 runner 的 pid 和心跳判断任务是否仍在执行"""
+    if job.get('pid') is not None and not _pid_alive(job['pid']):
+        return False
+    try:
+        heartbeat = (job_dir / 'heartbeat').stat().st_mtime
+    except FileNotFoundError:
+        return False
+    return time.time() - heartbeat < DEPLOY_HEARTBEAT_TIMEOUT
+
+
+def _run_job(app, job_id, lock):
+    """执行部署任务，结束后释放部署锁"""
+    job_dir = _jobs_dir() / job_id
+    job = _read_job(job_dir)
+    job['pid'] = os.getpid()
+    _write_job(job_dir, job)
+
+    stop = threading.Event()
+
+    def heartbeat_loop():
+        while not stop.wait(DEPLOY_HEARTBEAT_INTERVAL):
+            _touch_heartbeat(job_dir)
+
+    heartbeat = threading.Thread(target=heartbeat_loop, name='deploy-heartbeat', daemon=True)
+    heartbeat.start()
+
+    def on_step(step):
+        job['steps'].append(step)
+        _write_job(job_dir, job)
+        _append_event(job_dir, {'type': 'step', **step})
+
+    try:
+        with app.app_context():
+            deploy(job['commit_message'], on_step=on_step)
+        job['status'] = 'success'
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+    finally:
+        stop.set()
+        job['finished_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        # 先写结束事件再更新状态，读取方看到任务结束时结束事件一定已经可读
+        _append_event(job_dir, {'type': 'done', 'status': job['status'], 'error': job.get('error')})
+        _write_job(job_dir, job)
+        lock.release()
+
+    if job['status'] == 'success':
+        # 记录操作日志
+        with app.app_context():
+            record_operation(
+                user_id=job['user_id'],
+                action='git_deploy',
+                resource_type='git',
+                resource_name='repository',
+                details=f"执行了部署操作，提交信息: {job['commit_message']}"
+            )
+
+
+def run_job_in_runner(app, job_id, lock_fd=None):
+    """runner 进程入口：接管部署锁并执行任务
+
+    Args:
+        lock_fd: 从提交方继承的、已持有部署锁的文件描述符；为 None 时（Windows）自己获取锁
+
+    Returns:
+        是否执行了任务
+    """
+    if lock_fd is not None:
+        lock = FileLock.adopt(_repo_lock_path(), lock_fd)
+    else:
+        lock = _repo_lock()
+        if not lock.acquire(blocking=False):
+            # 提交方释放锁后又有任务抢先开始
+            job_dir = _jobs_dir() / job_id
+            job = _read_job(job_dir)
+            job['status'] = 'failed'
+            job['error'] = '已有部署任务正在执行，请稍后再试'
+            _append_event(job_dir, {'type': 'done', 'status': job['status'], 'error': job['error']})
+            _write_job(job_dir, job)
+            return False
+
+    _run_job(app, job_id, lock)
+    return True
+
+
+def _spawn_runner(job_id, lock):
+    """启动独立的 runner 进程执行任务，并把部署锁交给它"""
+    command = [sys.executable, '-m', 'services.deploy_runner', job_id]
+    pass_fds = ()
+    if os.name != 'nt':
+        # runner 继承锁的文件描述符，提交方关闭自己的副本后锁由 runner 持有，直到 runner 退出
+        command.append(str(lock.fileno()))
+        pass_fds = (lock.fileno(),)
+
+    job_dir = _jobs_dir() / job_id
+    with open(job_dir / 'runner.log', 'ab') as log_file:
+        process = subprocess.Popen(
+            command,
+            cwd=str(_PROJECT_DIR),
+            stdin=subprocess.DEVNULL,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            pass_fds=pass_fds,
+            # 独立的会话：worker 被 gunicorn 终止时不会连带终止 runner
+            start_new_session=os.name != 'nt'
+        )
+
+    if os.name != 'nt':
+        lock.detach()
+    else:
+        # Windows 不支持传递描述符，由 runner 自己重新获取锁
+        lock.release()
+
+    # 回收子进程，避免 worker 中留下僵尸进程；worker 先退出时由 init 回收
+    threading.Thread(target=process.wait, name=f'deploy-wait-{job_id[:8]}', daemon=True).start()
+    return process
+
+
+def submit_deploy(commit_message, user_id):
+    """提交部署任务，返回任务信息
+
+    Raises:
+        ValueError: 提交信息为空
+        DeployInProgressError: 同一仓库已有部署任务在执行
+    """
+    if not commit_message:
+        raise ValueError('提交信息不能为空')
+
+    lock = _repo_lock()
+    if not lock.acquire(blocking=False):
+        raise DeployInProgressError(_current_job_id())
+
+    try:
+        job_id = uuid.uuid4().hex
+        job_dir = _jobs_dir() / job_id
+        job_dir.mkdir()
+        job = {
+            'id': job_id,
+            'status': 'running',
+            'commit_message': commit_message,
+            'user_id': user_id,
+            'pid': None,
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'finished_at': None,
+            'error': None,
+            'steps': []
+        }
+        _write_job(job_dir, job)
+        (job_dir / 'events.ndjson').touch()
+        # runner 启动前的心跳，启动期间不会被误判为已退出
+        _touch_heartbeat(job_dir)
+        (Path(RUNTIME_DIR) / 'deploy_current').write_text(job_id, encoding='utf-8')
+
+        _spawn_runner(job_id, lock)
+    except Exception:
+        lock.release()
+        raise
+
+    return {k: v for k, v in job.items() if k != 'steps'}
+
+
+def get_deploy_job(job_id):
+    """获取部署任务状态"""
+    job_dir = _job_dir(job_id)
+    job = _read_job(job_dir)
+
+    # runner 异常退出（被杀、机器重启）时任务不可能再完成
+    if job['status'] == 'running' and not _runner_alive(job_dir, job):
+        job['status'] = 'interrupted'
+        job['error'] = '部署进程已退出，任务中断'
+    return job
+
+
+def read_deploy_events(job_id, offset=0):
+    """读取 offset 之后已产生的进度事件，不等待
+
+    Returns:
+        (事件列表, 下次读取的 offset)
+    """
+    job_dir = _job_dir(job_id)
+    events = []
+    index = 0
+    with open(job_dir / 'events.ndjson', 'rb') as f:
+        for line in f:
+            # 半行是正在写入的事件，下次再读
+            if not line.endswith(b'\n'):
+                break
+            index += 1
+            if index > offset:
+                events.append(json.loads(line.decode('utf-8')))
+    return events, max(index, offset)
+
+
+def iter_deploy_events(job_id, offset=0, max_seconds=None):
+    """按顺序读取部署进度事件，任务未结束时持续等待新事件
+
+    Yields:
+        (事件序号, 事件字典)；序号可作为下次读取的 offset
+    """
+    job_dir = _job_dir(job_id)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    index = 0
+    finished = False
+    with open(job_dir / 'events.ndjson', 'rb') as f:
+        while True:
+            line = f.readline()
+            if line.endswith(b'\n'):
+                index += 1
+                if index <= offset:
+                    continue
+                event = json.loads(line.decode('utf-8'))
+                yield index, event
+                if event.get('type') == 'done':
+                    return
+                continue
+
+            # 没有新的完整行：半行先退回去，等待后重读
+            if line:
+                f.seek(-len(line), os.SEEK_CUR)
+            if finished:
+                return
+            if get_deploy_job(job_id)['status'] != 'running':
+                # 任务已结束，再读一遍把剩余事件读完
+                finished = True
+                continue
+            if deadline is not None and time.monotonic() > deadline:
+                return
+            time.sleep(0.5)
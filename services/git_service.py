@@ -4,13 +4,71 @@ Git 操作服务
 import subprocess
 import shutil
 import platform
+import select
+import atexit
+import hashlib
+import tempfile
+import threading
+import json
+from collections import OrderedDict
+import heapq
+import time
 import os
+from functools import wraps
 from pathlib import Path
-from config import FRONTEND_DIR
+from datetime import datetime, timezone, timedelta
+from config import (
+    FRONTEND_DIR, ALPHA_WORKTREE_DIR, RUNTIME_DIR,
+    GIT_FETCH_INTERVAL, GIT_FETCH_TIMEOUT, GIT_FETCH_MAX_BACKOFF, GIT_STATUS_CACHE_TTL
+)
+from services.protocol_service import PROTOCOL_CATALOG_STAMP
+from utils.file_lock import FileLock
+from utils.version_stamp import read_stamp
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# 可选依赖：安装了 pygit2 时分支状态在进程内计算，不需要启动 git 子进程
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
 
 # Windows 系统需要使用 shell=True 来执行命令
 USE_SHELL = platform.system() == 'Windows'
 
+# Git 查询结果缓存（每个 worker 一份）：仓库状态没有变化时直接返回上次的结果
+# 游标、路径、文件名等参数来自客户端，缓存按 LRU 限制条数
+_GIT_CACHE_SIZE = 256
+_git_cache = OrderedDict()
+_git_cache_lock = threading.Lock()
+
+# 提交、暂存、切换分支、fetch 等操作至少会更新其中一个文件（或目录）的 mtime
+_REPO_STATE_PATHS = (
+    'HEAD', 'index', 'packed-refs', 'FETCH_HEAD', 'logs/HEAD', 'refs/heads', 'refs/remotes/origin'
+)
+
+# 单次查询提交历史的条数上限
+GIT_LOG_MAX_LIMIT = 200
+
+# 协议文件 diff 缓存：(旧 blob, 新 blob) -> diff 文本；blob 内容不可变，缓存无需失效
+_DIFF_CACHE_SIZE = 256
+_diff_cache = OrderedDict()
+_diff_cache_lock = threading.Lock()
+
+# 常驻的 git cat-file 进程池：(进程号, 仓库路径, 模式) -> _GitBatchProcess
+_batch_processes = {}
+_batch_processes_lock = threading.Lock()
+
+# 后台 fetch 线程（每个 worker 一个，通过锁文件保证同一时间只有一个 worker 在 fetch）
+_fetcher_thread = None
+_fetcher_lock = threading.Lock()
+
+# Linux FICLONE ioctl：在支持 reflink 的文件系统（btrfs、xfs 等）上共享数据块，不复制数据
+_FICLONE = 0x40049409
+
 
 def _check_git_repo():
     """检查前端项目目录和 Git 仓库"""
@@ -79,6 +137,134 @@ def _run_git_command(cmd, cwd=None, timeout=None, force_no_shell=False, env=None
     return result
 
 
+class _GitBatchProcess:
+    """常驻的 git cat-file --batch / --batch-check 进程
+
+    通过管道逐条查询对象，避免每次查询都启动新的 git 进程；
+    读取超时或进程异常退出时杀掉进程，下次查询自动重启。
+    """
+
+    def __init__(self, repo_path, mode):
+        self.repo_path = Path(repo_path)
+        self.mode = mode  # 'batch'（返回内容）或 'batch-check'（只返回对象信息）
+        self._proc = None
+        self._buffer = b''
+        self._lock = threading.Lock()
+
+    def _start(self):
+        try:
+            self._proc = subprocess.Popen(
+                ['git', 'cat-file', f'--{self.mode}'],
+                cwd=str(self.repo_path),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError as e:
+            raise RuntimeError(f'Git 命令未找到，请确保 Git 已安装并添加到 PATH 环境变量中: {str(e)}')
+        self._buffer = b''
+
+    def stop(self):
+        """结束进程"""
+        if self._proc is None:
+            return
+        try:
+            self._proc.kill()
+            self._proc.wait(timeout=1)
+        except Exception:
+            pass
+        self._proc = None
+
+    def _fill(self, deadline):
+        """从管道读取更多数据，超时抛出 TimeoutError，进程退出抛出 EOFError"""
+        fd = self._proc.stdout.fileno()
+        # Windows 的 select 不支持管道，只能不带超时地阻塞读取
+        if platform.system() != 'Windows':
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                raise TimeoutError('读取 git cat-file 输出超时')
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            raise EOFError('git cat-file 进程已退出')
+        self._buffer += chunk
+
+    def _read_line(self, deadline):
+        while b'\n' not in self._buffer:
+            self._fill(deadline)
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line
+
+    def _read_exact(self, size, deadline):
+        while len(self._buffer) < size:
+            self._fill(deadline)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def query(self, rev, timeout=10):
+        """查询对象，返回 {'sha', 'type', 'size', 'content'}，对象不存在时返回 None
+
+        content 只有 batch 模式才有（bytes），batch-check 模式为 None。
+        """
+        if '\n' in rev or not rev:
+            raise ValueError(f'无效的版本号: {rev!r}')
+
+        with self._lock:
+            for attempt in range(2):
+                if self._proc is None or self._proc.poll() is not None:
+                    self._start()
+                try:
+                    deadline = time.monotonic() + timeout
+                    self._proc.stdin.write(rev.encode('utf-8') + b'\n')
+                    self._proc.stdin.flush()
+                    header = self._read_line(deadline).decode('utf-8')
+                    if header.endswith((' missing', ' ambiguous')):
+                        return None
+                    sha, obj_type, size = header.split()
+                    content = None
+                    if self.mode == 'batch':
+                        # 内容后面还有一个换行符
+                        content = self._read_exact(int(size) + 1, deadline)[:-1]
+                    return {'sha': sha, 'type': obj_type, 'size': int(size), 'content': content}
+                except TimeoutError as e:
+                    self.stop()
+                    raise RuntimeError(f'Git 命令执行超时: {str(e)}')
+                except (OSError, EOFError, ValueError) as e:
+                    # 进程可能已经退出（如仓库被重新克隆），重启后重试一次
+                    self.stop()
+                    if attempt == 1:
+                        raise RuntimeError(f'执行 git cat-file 时发生异常: {str(e)}')
+
+
+def _stop_batch_processes():
+    """进程退出时结束所有常驻 git 进程"""
+    with _batch_processes_lock:
+        for process in _batch_processes.values():
+            process.stop()
+        _batch_processes.clear()
+
+
+atexit.register(_stop_batch_processes)
+
+
+def git_cat_file(rev, with_content=False, repo_path=None, timeout=10):
+    """通过常驻的 git cat-file 进程查询对象（提交、树、文件内容等）
+
+    Args:
+        rev: 任意 git 版本表达式，如 'HEAD'、'origin/master'、'<commit>:<path>'
+        with_content: 是否同时返回对象内容
+        repo_path: 仓库路径，默认为前端项目目录
+    """
+    repo_path = Path(repo_path) if repo_path else _check_git_repo()
+    mode = 'batch' if with_content else 'batch-check'
+    # 进程号作为键的一部分：fork 出的 worker 不能复用父进程的管道
+    key = (os.getpid(), str(repo_path), mode)
+    with _batch_processes_lock:
+        process = _batch_processes.get(key)
+        if process is None:
+            process = _batch_processes[key] = _GitBatchProcess(repo_path, mode)
+    return process.query(rev, timeout=timeout)
+
+
 def _get_command_output(result):
     """获取命令输出，合并 stdout 和 stderr"""
     if result.stderr:
@@ -99,12 +285,167 @@ def _format_error(result, default_msg='未知错误'):
     return ' | '.join(error_details) if error_details else default_msg
 
 
+def _file_digest(path):
+    """计算文件内容哈希"""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _same_content(src, dst, src_stat):
+    """判断两个文件内容是否相同
+
+    大小不同直接判定不同；大小和 mtime 都相同判定相同（与 filecmp 的浅比较一致，复制时保留了 mtime）；
+    只有大小相同而 mtime 不同时才读取内容比较哈希，内容相同时把目标的 mtime 对齐，下次不用再读。
+    """
+    try:
+        dst_stat = dst.stat()
+    except FileNotFoundError:
+        return False
+    if src_stat.st_size != dst_stat.st_size:
+        return False
+    if src_stat.st_mtime_ns == dst_stat.st_mtime_ns:
+        return True
+    if _file_digest(src) != _file_digest(dst):
+        return False
+    os.utime(dst, ns=(dst_stat.st_atime_ns, src_stat.st_mtime_ns))
+    return True
+
+
+def _clone_or_copy(src, dst):
+    """复制文件：优先使用 reflink，不支持时退回普通复制；先写临时文件再替换，避免留下半个文件"""
+    tmp_path = dst.with_name(f'.{dst.name}.sync-tmp')
+    cloned = False
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as fsrc, open(tmp_path, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+            cloned = True
+        except OSError:
+            cloned = False
+    if not cloned:
+        shutil.copyfile(src, tmp_path)
+    # 保留权限和 mtime，下次同步时大小和 mtime 相同即可判定未变
+    shutil.copystat(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def _format_sync_stats(stats):
+    """格式化目录同步的统计信息"""
+    return (
+        f"替换完成：复制 {stats['copied_files']} 个文件（{stats['copied_bytes']} 字节），"
+        f"未变 {stats['unchanged_files']} 个，删除 {stats['deleted_files']} 个"
+    )
+
+
+def sync_directory(src_dir, dst_dir):
+    """增量同步目录：只复制内容有变化的文件，删除目标中多余的文件
+
+    Returns:
+        统计信息：复制/未变/删除的文件数和复制的字节数
+    """
+    src_dir = Path(src_dir)
+    dst_dir = Path(dst_dir)
+    stats = {'copied_files': 0, 'copied_bytes': 0, 'unchanged_files': 0, 'deleted_files': 0}
+    seen_dirs = set()
+    seen_files = set()
+
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    for root, _, files in os.walk(src_dir):
+        rel_root = Path(root).relative_to(src_dir)
+        target_root = dst_dir / rel_root
+        seen_dirs.add(rel_root)
+        if target_root.exists() and not target_root.is_dir():
+            target_root.unlink()
+        target_root.mkdir(parents=True, exist_ok=True)
+
+        for name in files:
+            src = Path(root) / name
+            dst = target_root / name
+            seen_files.add(rel_root / name)
+            src_stat = src.stat()
+            if dst.is_dir():
+                shutil.rmtree(dst)
+            if _same_content(src, dst, src_stat):
+                stats['unchanged_files'] += 1
+                continue
+            _clone_or_copy(src, dst)
+            stats['copied_files'] += 1
+            stats['copied_bytes'] += src_stat.st_size
+
+    # 自底向上删除源目录中已不存在的文件和目录
+    for root, _, files in os.walk(dst_dir, topdown=False):
+        rel_root = Path(root).relative_to(dst_dir)
+        for name in files:
+            if rel_root / name not in seen_files:
+                (Path(root) / name).unlink()
+                stats['deleted_files'] += 1
+        if rel_root not in seen_dirs:
+            Path(root).rmdir()
+
+    return stats
+
+
+def _repo_state_key(frontend_path):
+    """获取仓库状态指纹：.git 下关键文件的 mtime，加上工作区根目录、协议目录的 mtime 和协议版本戳"""
+    git_dir = frontend_path / '.git'
+    state = []
+    for name in _REPO_STATE_PATHS:
+        try:
+            state.append(os.stat(git_dir / name).st_mtime_ns)
+        except FileNotFoundError:
+            state.append(None)
+    for path in (frontend_path, frontend_path / 'public' / 'static' / 'notice'):
+        try:
+            state.append(path.stat().st_mtime_ns)
+        except FileNotFoundError:
+            state.append(None)
+    # 通过接口原地修改协议文件不会改变目录 mtime，但会更新协议版本戳
+    state.append(read_stamp(PROTOCOL_CATALOG_STAMP))
+    return tuple(state)
+
+
+def _cached_by_repo_state(max_age=None):
+    """按仓库状态缓存查询结果，仓库没有变化时不再执行 git 命令
+
+    状态指纹在执行命令之前获取：执行期间仓库发生的变化会使下次请求的指纹不同，
+    不会把旧结果存到新状态下。
+    max_age 为结果的最长有效期（秒），兜底指纹覆盖不到的变化（如直接修改工作区中的文件）。
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            frontend_path = _check_git_repo()
+            cache_key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            state = _repo_state_key(frontend_path)
+            now = time.monotonic()
+            with _git_cache_lock:
+                cached = _git_cache.get(cache_key)
+                if cached is not None:
+                    _git_cache.move_to_end(cache_key)
+            if cached is not None and cached[0] == state and (max_age is None or now - cached[1] < max_age):
+                return cached[2]
+
+            result = func(*args, **kwargs)
+            with _git_cache_lock:
+                _git_cache[cache_key] = (state, now, result)
+                _git_cache.move_to_end(cache_key)
+                while len(_git_cache) > _GIT_CACHE_SIZE:
+                    _git_cache.popitem(last=False)
+            return result
+        return wrapper
+    return decorator
+
+
+@_cached_by_repo_state(max_age=GIT_STATUS_CACHE_TTL)
 def get_git_status():
     """获取 Git 状态和变更文件"""
     frontend_path = _check_git_repo()
 
-    # 检查工作区是否干净
-    result = _run_git_command(['git', 'status', '--porcelain'], cwd=frontend_path)
+    # 检查工作区是否干净；--no-optional-locks 使 status 不回写 index，否则每次查询都会改变状态指纹
+    result = _run_git_command(['git', '--no-optional-locks', 'status', '--porcelain'], cwd=frontend_path)
 
     if result.returncode != 0:
         error_msg = _format_error(result)
@@ -140,10 +481,9 @@ def get_git_status():
 
     is_clean = len(changed_files) == 0
 
-    # 获取当前分支
+    # 获取当前分支（直接读取 HEAD，不启动子进程）
     try:
-        branch_result = _run_git_command(['git', 'branch', '--show-current'], cwd=frontend_path)
-        current_branch = branch_result.stdout.strip() if branch_result.returncode == 0 else 'unknown'
+        current_branch = _read_head_branch(frontend_path / '.git')
     except Exception:
         current_branch = 'unknown'
 
@@ -154,87 +494,533 @@ def get_git_status():
     }
 
 
-def get_git_log(limit=15):
+def _resolve_commit(rev, name):
+    """把提交哈希（可以是缩写）解析为完整哈希，不存在时报错"""
+    if not (4 <= len(rev) <= 40) or any(c not in '0123456789abcdef' for c in rev.lower()):
+        raise ValueError(f'无效的{name}: {rev}')
+    commit = git_cat_file(f'{rev}^{{commit}}')
+    if commit is None:
+        raise ValueError(f'{name}对应的提交不存在: {rev}')
+    return commit['sha']
+
+
+def _validate_log_args(after=None, path=None, tip=None):
+    """校验提交历史的游标和路径参数
+
+    Returns:
+        (tip, after) 的完整哈希；未指定 tip 时为当前 HEAD
+    """
+    if path is not None:
+        normalized = Path(path)
+        if normalized.is_absolute() or '..' in normalized.parts:
+            raise ValueError(f'无效的路径: {path}')
+    if tip is None:
+        # 仓库还没有提交时 tip 为 None
+        head = git_cat_file('HEAD^{commit}')
+        tip = head['sha'] if head else None
+    else:
+        tip = _resolve_commit(tip, '游标')
+    if after is not None:
+        after = _resolve_commit(after, '游标')
+    return tip, after
+
+
+def parse_log_cursor(cursor=None):
+    """解析提交历史的翻页游标
+
+    游标格式为 <tip>:<提交>：tip 是第一页开始遍历的提交，之后每一页都从 tip 遍历并跳过游标及之前的提交，
+    HEAD 移动不影响翻页。只有 <提交> 时（上一页最后一条的 full_hash）从当前 HEAD 遍历。
+
+    Returns:
+        (tip, after) 的完整哈希；没有游标时 tip 为当前 HEAD，after 为 None
+    """
+    if not cursor:
+        return _validate_log_args()
+    tip, _, after = cursor.rpartition(':')
+    return _validate_log_args(after, tip=tip or None)
+
+
+def make_log_cursor(tip, commit_hash):
+    """生成下一页的游标"""
+    return f'{tip}:{commit_hash}'
+
+
+def _format_git_date(timestamp, offset):
+    """按 git log --date=iso 的格式输出时间，如 2024-01-02 03:04:05 +0800"""
+    sign = -1 if offset.startswith('-') else 1
+    minutes = sign * (int(offset[1:3]) * 60 + int(offset[3:5]))
+    tz = timezone(timedelta(minutes=minutes))
+    return datetime.fromtimestamp(int(timestamp), tz).strftime('%Y-%m-%d %H:%M:%S ') + offset
+
+
+def _parse_commit_object(sha, content):
+    """解析 git cat-file 返回的提交对象"""
+    header, _, message = content.partition(b'\n\n')
+    parents = []
+    author = committer = None
+    encoding = 'utf-8'
+    for line in header.split(b'\n'):
+        # 以空格开头的是多行字段（如 gpgsig）的续行
+        if line.startswith(b' '):
+            continue
+        key, _, value = line.partition(b' ')
+        if key == b'parent':
+            parents.append(value.decode('ascii'))
+        elif key == b'author':
+            author = value
+        elif key == b'committer':
+            committer = value
+        elif key == b'encoding':
+            encoding = value.decode('ascii', errors='replace')
+
+    def decode(data):
+        try:
+            return data.decode(encoding, errors='replace')
+        except LookupError:
+            return data.decode('utf-8', errors='replace')
+
+    # 身份行格式：Name <email> 时间戳 时区
+    ident, timestamp, offset = decode(author).rsplit(' ', 2)
+    name, _, email = ident.partition(' <')
+    commit_time = int(committer.rsplit(b' ', 2)[1])
+    # 与 %s 一致：标题为第一段，段内换行替换为空格
+    subject = ' '.join(decode(message).strip().split('\n\n', 1)[0].split())
+    return {
+        'sha': sha,
+        'parents': parents,
+        'commit_time': commit_time,
+        'entry': {
+            'hash': sha[:8],  # 只显示前8位
+            'full_hash': sha,
+            'author': name,
+            'email': email.rstrip('>'),
+            'date': _format_git_date(timestamp, offset),
+            'message': subject
+        }
+    }
+
+
+def _iter_log_from_objects(limit, after, tip):
+    """通过常驻的 git cat-file 进程遍历提交历史，不启动 git log 子进程
+
+    与 git log 的默认顺序一致：按提交时间从新到旧，每个提交只出现一次。
+    翻页时仍从 tip 开始遍历，跳过游标及之前的提交：若从游标提交开始遍历，
+    合并进来的另一条分支上比游标旧的提交只能从游标之前的合并提交到达，会被漏掉。
+    """
+    heap = []
+    seen = set()
+    counter = 0
+
+    def push(sha):
+        nonlocal counter
+        if sha in seen:
+            return
+        seen.add(sha)
+        obj = git_cat_file(sha, with_content=True)
+        if obj is None or obj['type'] != 'commit':
+            return
+        commit = _parse_commit_object(sha, obj['content'])
+        heapq.heappush(heap, (-commit['commit_time'], counter, commit))
+        counter += 1
+
+    push(tip)
+    # 游标及之前的提交已在前面的页返回
+    skipping = after is not None
+    returned = 0
+    while heap and returned < limit:
+        _, _, commit = heapq.heappop(heap)
+        for parent in commit['parents']:
+            push(parent)
+        if skipping:
+            skipping = commit['sha'] != after
+            continue
+        returned += 1
+        yield commit['entry']
+
+
+def iter_git_log(limit=15, after=None, path=None, tip=None):
+    """逐条读取 Git 提交历史
+
+    使用 -z 以 NUL 分隔提交、以 \\x1f 分隔字段，提交信息中包含 | 等字符也能正确解析。
+    参数在调用时立即校验，返回的生成器边读 git 输出边产出提交，不会一次性读入全部输出。
+
+    Args:
+        limit: 最多返回的提交数
+        after: 游标提交，返回遍历顺序中该提交之后（更早）的提交，不包含该提交本身
+        path: 只返回修改过该路径的提交（相对仓库根目录）
+        tip: 开始遍历的提交，默认为 HEAD；翻页时应与第一页相同（见 parse_log_cursor）
+    """
+    frontend_path = _check_git_repo()
+    tip, after = _validate_log_args(after, path, tip)
+    if tip is None:
+        return iter(())
+
+    # 不按路径筛选时直接读取提交对象，省去每次启动 git log 进程；按路径筛选需要比较树，仍由 git log 完成
+    if path is None:
+        return _iter_log_from_objects(limit, after, tip)
+
+    # 从 tip 遍历并跳过游标及之前的提交，与上一页的顺序保持一致；从游标提交开始遍历会漏掉
+    # 合并进来的另一条分支上的提交。需要跳过的条数未知，因此翻页时不限制条数，读够 limit 条后结束进程
+    cmd = ['git', 'log', '-z', '--pretty=format:%H%x1f%an%x1f%ae%x1f%ad%x1f%s', '--date=iso']
+    if after is None:
+        cmd.append(f'-{limit}')
+    cmd.extend([tip, '--', path])
+
+    def generate():
+        # stderr 写入临时文件：用管道时 git 的错误输出填满管道缓冲区后会阻塞，而这里要先读完 stdout
+        stderr_file = tempfile.TemporaryFile()
+        try:
+            # 包含 % 的参数必须不经过 shell
+            proc = subprocess.Popen(cmd, cwd=str(frontend_path), stdout=subprocess.PIPE, stderr=stderr_file)
+        except FileNotFoundError as e:
+            stderr_file.close()
+            raise RuntimeError(f'Git 命令未找到，请确保 Git 已安装并添加到 PATH 环境变量中: {str(e)}')
+
+        try:
+            buffer = b''
+            skipping = after is not None
+            returned = 0
+            while True:
+                chunk = proc.stdout.read(65536)
+                if chunk:
+                    buffer += chunk
+                    records = buffer.split(b'\0')
+                    buffer = records.pop()
+                else:
+                    # 最后一条记录后面没有 NUL
+                    records = [buffer] if buffer else []
+                for record in records:
+                    parts = record.decode('utf-8', errors='replace').split('\x1f', 4)
+                    if len(parts) != 5:
+                        continue
+                    if skipping:
+                        skipping = parts[0] != after
+                        continue
+                    returned += 1
+                    yield {
+                        'hash': parts[0][:8],  # 只显示前8位
+                        'full_hash': parts[0],
+                        'author': parts[1],
+                        'email': parts[2],
+                        'date': parts[3],
+                        'message': parts[4]
+                    }
+                    if returned >= limit:
+                        return
+                if not chunk:
+                    break
+
+            if proc.wait() != 0:
+                stderr_file.seek(0)
+                stderr = stderr_file.read().decode('utf-8', errors='replace')
+                raise RuntimeError(f"Git log 命令执行失败: {stderr}")
+        finally:
+            # 调用方提前结束读取时结束 git 进程
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            stderr_file.close()
+
+    return generate()
+
+
+@_cached_by_repo_state()
+def get_git_log(limit=15, after=None, path=None, tip=None):
     """获取 Git 提交历史"""
+    return list(iter_git_log(limit, after=after, path=path, tip=tip))
+
+
+def _protocol_repo_path(filename):
+    """协议文件在前端仓库中的相对路径"""
+    return f'public/static/notice/{os.path.basename(filename)}'
+
+
+@_cached_by_repo_state()
+def get_protocol_history(filename, limit=20):
+    """获取协议文件的修改历史（跟踪重命名），每条记录附带该版本的文件路径和 blob"""
     frontend_path = _check_git_repo()
+    repo_path = _protocol_repo_path(filename)
 
-    # 获取提交历史
-    # 使用列表方式传递参数，并强制不使用 shell，避免 Windows 命令行解析 % 符号的问题
     result = _run_git_command(
-        ['git', 'log', f'-{limit}', '--pretty=format:%H|%an|%ae|%ad|%s', '--date=iso'],
+        ['git', 'log', '--follow', '-z', '--name-only', f'-{limit}',
+         '--pretty=format:%x1e%H%x1f%an%x1f%ae%x1f%ad%x1f%s', '--date=iso', '--', repo_path],
         cwd=frontend_path,
         timeout=30,
         force_no_shell=True  # 强制不使用 shell，避免 % 符号被解析
     )
-
     if result.returncode != 0:
         error_msg = _format_error(result)
         raise RuntimeError(f'Git log 命令执行失败: {error_msg}')
 
-    commits = []
-    if result.stdout:
-        for line in result.stdout.strip().split('\n'):
-            if line.strip():
-                parts = line.split('|', 4)
-                if len(parts) == 5:
-                    commits.append({
-                        'hash': parts[0][:8],  # 只显示前8位
-                        'full_hash': parts[0],
-                        'author': parts[1],
-                        'email': parts[2],
-                        'date': parts[3],
-                        'message': parts[4]
-                    })
+    history = []
+    # 每条记录的格式：\x1e<字段>\n<该版本的路径>\0（%s 是单行标题，不含换行）
+    for record in result.stdout.split('\x1e'):
+        if not record:
+            continue
+        header, _, rest = record.partition('\n')
+        parts = header.split('\x1f', 4)
+        if len(parts) != 5:
+            continue
+        path = rest.strip('\n\0') or repo_path
+        blob = git_cat_file(f'{parts[0]}:{path}', repo_path=frontend_path)
+        history.append({
+            'hash': parts[0][:8],  # 只显示前8位
+            'full_hash': parts[0],
+            'author': parts[1],
+            'email': parts[2],
+            'date': parts[3],
+            'message': parts[4],
+            'path': path,
+            'blob': blob['sha'] if blob else None  # 删除文件的提交中没有对应的 blob
+        })
+
+    return history
+
+
+def _resolve_protocol_blob(filename, rev, history):
+    """解析协议文件在指定版本中的 blob；文件被重命名过时使用该版本中的旧路径"""
+    if not rev:
+        raise ValueError('版本号不能为空')
+    commit = git_cat_file(f'{rev}^{{commit}}')
+    if commit is None:
+        raise ValueError(f'版本不存在: {rev}')
+
+    paths = {entry['full_hash']: entry['path'] for entry in history}
+    path = paths.get(commit['sha'], _protocol_repo_path(filename))
+    blob = git_cat_file(f"{commit['sha']}:{path}")
+    if blob is None:
+        raise FileNotFoundError(f'版本 {rev} 中不存在协议文件: {path}')
+    return {'commit': commit['sha'], 'path': path, 'blob': blob['sha']}
+
+
+def get_protocol_diff(filename, from_rev, to_rev='HEAD'):
+    """比较协议文件在两个版本之间的差异，结果按 (blob, blob) 缓存"""
+    frontend_path = _check_git_repo()
+    # --follow 最多只跟踪这么多条历史来确定旧路径，更早的版本按当前路径查找
+    history = get_protocol_history(filename, limit=GIT_LOG_MAX_LIMIT)
+    source = _resolve_protocol_blob(filename, from_rev, history)
+    target = _resolve_protocol_blob(filename, to_rev, history)
+
+    cache_key = (source['blob'], target['blob'])
+    with _diff_cache_lock:
+        diff = _diff_cache.get(cache_key)
+        if diff is not None:
+            _diff_cache.move_to_end(cache_key)
+
+    if diff is None:
+        if source['blob'] == target['blob']:
+            diff = ''
+        else:
+            result = _run_git_command(
+                ['git', 'diff', '--no-color', '--no-ext-diff', source['blob'], target['blob']],
+                cwd=frontend_path,
+                timeout=30
+            )
+            if result.returncode != 0:
+                error_msg = _format_error(result)
+                raise RuntimeError(f'Git diff 命令执行失败: {error_msg}')
+            diff = result.stdout
+        with _diff_cache_lock:
+            _diff_cache[cache_key] = diff
+            while len(_diff_cache) > _DIFF_CACHE_SIZE:
+                _diff_cache.popitem(last=False)
 
-    return commits
+    return {
+        'filename': os.path.basename(filename),
+        'from': source,
+        'to': target,
+        'diff': diff
+    }
 
 
-def get_branch_status():
-    """获取分支的领先和落后状态"""
-    frontend_path = _check_git_repo()
+def _fetch_state_paths():
+    """获取后台 fetch 的状态文件和锁文件路径（按仓库区分）"""
+    repo_key = hashlib.sha1(str(FRONTEND_DIR).encode('utf-8')).hexdigest()[:12]
+    runtime_dir = Path(RUNTIME_DIR)
+    return runtime_dir / f'git_fetch_{repo_key}.json', runtime_dir / f'git_fetch_{repo_key}.lock'
 
-    # 获取当前分支
-    branch_result = _run_git_command(['git', 'branch', '--show-current'], cwd=frontend_path)
 
-    if branch_result.returncode != 0:
-        error_msg = _format_error(branch_result)
-        raise RuntimeError(f'无法获取当前分支: {error_msg}')
+def _read_fetch_state():
+    """读取后台 fetch 状态"""
+    state_path, _ = _fetch_state_paths()
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'last_success': None, 'last_attempt': None, 'failures': 0, 'error': None}
+
+
+def _write_fetch_state(state):
+    """原子写入后台 fetch 状态"""
+    state_path, _ = _fetch_state_paths()
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_name(f'{state_path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+def _fetch_due(state, now):
+    """判断是否需要 fetch：失败后按指数退避延长间隔"""
+    if state['last_attempt'] is None:
+        return True
+    delay = min(GIT_FETCH_INTERVAL * (2 ** state['failures']), max(GIT_FETCH_MAX_BACKOFF, GIT_FETCH_INTERVAL))
+    return now - state['last_attempt'] >= delay
+
+
+def fetch_remote_if_due():
+    """到期时执行一次 git fetch；其他 worker 正在 fetch 时直接跳过"""
+    if not _fetch_due(_read_fetch_state(), time.time()):
+        return False
+
+    _, lock_path = _fetch_state_paths()
+    lock = FileLock(lock_path)
+    if not lock.acquire(blocking=False):
+        return False
+    try:
+        # 拿到锁后再检查一次，可能刚有其他 worker 完成了 fetch
+        state = _read_fetch_state()
+        now = time.time()
+        if not _fetch_due(state, now):
+            return False
 
-    current_branch = branch_result.stdout.strip()
+        state['last_attempt'] = now
+        try:
+            frontend_path = _check_git_repo()
+            result = _run_git_command(
+                ['git', 'fetch', '--quiet'],
+                cwd=frontend_path,
+                timeout=GIT_FETCH_TIMEOUT,
+                env={'GIT_TERMINAL_PROMPT': '0'}  # 不允许交互式输入凭据
+            )
+            if result.returncode != 0:
+                raise RuntimeError(_format_error(result))
+            state['last_success'] = time.time()
+            state['failures'] = 0
+            state['error'] = None
+        except Exception as e:
+            state['failures'] += 1
+            state['error'] = str(e)
+        _write_fetch_state(state)
+        return True
+    finally:
+        lock.release()
+
+
+def _fetch_loop():
+    """后台 fetch 循环"""
+    while True:
+        try:
+            fetch_remote_if_due()
+        except Exception as e:
+            print(f"后台 git fetch 出错: {str(e)}")
+        time.sleep(max(min(GIT_FETCH_INTERVAL, 30), 1))
 
-    # 先执行 git fetch 更新远程分支信息（但不合并）
-    _run_git_command(['git', 'fetch'], cwd=frontend_path)
 
-    # 获取本地和远程的提交数差异
-    # ahead: 本地领先远程的提交数 (origin/branch..branch)
-    ahead_result = _run_git_command(
-        ['git', 'rev-list', f'origin/{current_branch}..{current_branch}', '--count'],
-        cwd=frontend_path
-    )
+def _ensure_fetcher_started():
+    """启动后台 fetch 线程（每个进程一个）"""
+    global _fetcher_thread
+    if GIT_FETCH_INTERVAL <= 0:
+        return
+    with _fetcher_lock:
+        if _fetcher_thread is None or not _fetcher_thread.is_alive():
+            _fetcher_thread = threading.Thread(target=_fetch_loop, name='git-fetcher', daemon=True)
+            _fetcher_thread.start()
 
-    # behind: 本地落后远程的提交数 (branch..origin/branch)
-    behind_result = _run_git_command(
-        ['git', 'rev-list', f'{current_branch}..origin/{current_branch}', '--count'],
-        cwd=frontend_path
+
+def get_branch_status():
+    """获取分支的领先和落后状态
+
+    只读取本地的远程跟踪分支，远程信息由后台线程定期 fetch 更新，
+    返回结果中附带最近一次 fetch 的时间和距今秒数。
+    """
+    _ensure_fetcher_started()
+    data = dict(_get_local_branch_status())
+
+    state = _read_fetch_state()
+    last_success = state['last_success']
+    data['last_fetch_at'] = (
+        datetime.fromtimestamp(last_success).strftime('%Y-%m-%d %H:%M:%S') if last_success else None
     )
+    data['last_fetch_age'] = int(time.time() - last_success) if last_success else None
+    data['fetch_error'] = state['error']
+    return data
+
+
+def _read_head_branch(git_dir):
+    """直接读取 HEAD 文件获取当前分支，分离头指针时返回空字符串（与 git branch --show-current 一致）"""
+    head = (git_dir / 'HEAD').read_text(encoding='utf-8').strip()
+    if head.startswith('ref: refs/heads/'):
+        return head[len('ref: refs/heads/'):]
+    return ''
 
-    # 检查远程分支是否存在
-    remote_branch_check = _run_git_command(
-        ['git', 'ls-remote', '--heads', 'origin', current_branch],
+
+def _read_ref(git_dir, refname):
+    """直接从 .git 读取引用指向的提交，依次查找松散引用和 packed-refs，不存在时返回 None"""
+    if (git_dir / 'reftable').exists():
+        # reftable 格式的引用无法直接读取文件，交给常驻的 cat-file 进程解析
+        obj = git_cat_file(refname, repo_path=git_dir.parent)
+        return obj['sha'] if obj else None
+    try:
+        return (git_dir / refname).read_text(encoding='utf-8').strip() or None
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        pass
+    try:
+        with open(git_dir / 'packed-refs', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == refname:
+                    return parts[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def _count_ahead_behind(frontend_path, local_sha, remote_sha):
+    """计算本地相对远程领先和落后的提交数"""
+    if local_sha == remote_sha:
+        return 0, 0
+
+    if pygit2 is not None:
+        repo = pygit2.Repository(str(frontend_path))
+        return repo.ahead_behind(local_sha, remote_sha)
+
+    # 一次 rev-list 同时得到两个方向的计数：左侧为本地独有（领先），右侧为远程独有（落后）
+    result = _run_git_command(
+        ['git', 'rev-list', '--left-right', '--count', f'{local_sha}...{remote_sha}'],
         cwd=frontend_path
     )
+    if result.returncode != 0:
+        error_msg = _format_error(result)
+        raise RuntimeError(f'无法计算分支差异: {error_msg}')
+    ahead, behind = result.stdout.split()
+    return int(ahead), int(behind)
+
+
+@_cached_by_repo_state()
+def _get_local_branch_status():
+    """根据本地引用计算分支的领先和落后状态
+
+    当前分支和引用直接从 .git 读取；两端提交相同时不启动任何子进程，
+    否则最多执行一次 git rev-list（安装了 pygit2 时不启动子进程）。
+    """
+    frontend_path = _check_git_repo()
+    git_dir = frontend_path / '.git'
+
+    current_branch = _read_head_branch(git_dir)
+    local_sha = _read_ref(git_dir, f'refs/heads/{current_branch}') if current_branch else None
+    remote_sha = _read_ref(git_dir, f'refs/remotes/origin/{current_branch}') if current_branch else None
 
-    has_remote = remote_branch_check.returncode == 0 and remote_branch_check.stdout.strip() != ''
+    has_remote = remote_sha is not None
 
     ahead = 0
     behind = 0
 
-    if has_remote:
-        try:
-            ahead = int(ahead_result.stdout.strip()) if ahead_result.returncode == 0 else 0
-            behind = int(behind_result.stdout.strip()) if behind_result.returncode == 0 else 0
-        except ValueError:
-            pass
+    if has_remote and local_sha is not None:
+        ahead, behind = _count_ahead_behind(frontend_path, local_sha, remote_sha)
 
     return {
         'current_branch': current_branch,
@@ -267,21 +1053,72 @@ def pull_latest():
     }
 
 
-def deploy(commit_message):
-    """执行部署流程"""
+def _ensure_alpha_worktree(frontend_path):
+    """确保 alpha 分支的独立工作树存在且干净，返回 (工作树路径, 输出信息)
+
+    工作树在多次部署之间复用，只有首次部署时需要检出全部文件。
+    """
+    if not ALPHA_WORKTREE_DIR:
+        raise RuntimeError('未配置 alpha 工作树目录')
+    worktree_path = Path(ALPHA_WORKTREE_DIR)
+
+    if (worktree_path / '.git').exists():
+        # 丢弃上次失败的部署可能遗留的未提交修改
+        result = _run_git_command(['git', 'reset', '--hard', 'HEAD'], cwd=worktree_path)
+        if result.returncode != 0:
+            error_msg = _format_error(result)
+            raise RuntimeError(f'重置 alpha 工作树失败: {error_msg}')
+        return worktree_path, f'复用工作树: {worktree_path}'
+
+    # 清理已被删除的工作树登记，再创建新的工作树
+    _run_git_command(['git', 'worktree', 'prune'], cwd=frontend_path)
+    result = _run_git_command(['git', 'worktree', 'add', str(worktree_path), 'alpha'], cwd=frontend_path)
+    if result.returncode != 0:
+        error_msg = _format_error(result)
+        raise RuntimeError(f'创建 alpha 工作树失败: {error_msg}')
+    return worktree_path, _get_command_output(result) or f'创建工作树: {worktree_path}'
+
+
+def deploy(commit_message, on_step=None):
+    """执行部署流程
+
+    Args:
+        commit_message: 提交信息
+        on_step: 每完成一个步骤时的回调，参数为步骤字典，用于上报进度
+    """
     if not commit_message:
         raise ValueError('提交信息不能为空')
 
     frontend_path = _check_git_repo()
     steps = []
 
+    def add_step(step):
+        steps.append(step)
+        if on_step is not None:
+            on_step(step)
+
+    try:
+        _run_deploy_steps(commit_message, frontend_path, add_step)
+    except RuntimeError as e:
+        # 附带已执行的步骤，便于调用方展示失败前的进度
+        e.steps = steps
+        raise
+
+    return {
+        'message': '部署成功',
+        'steps': steps
+    }
+
+
+def _run_deploy_steps(commit_message, frontend_path, add_step):
+    """依次执行部署的各个步骤"""
     # 1. git add .
     result = _run_git_command(['git', 'add', '.'], cwd=frontend_path)
     if result.returncode != 0:
         error_msg = _format_error(result)
         raise RuntimeError(f'git add 失败: {error_msg}')
     output = _get_command_output(result)
-    steps.append({'step': 'git add', 'status': 'success', 'output': output or '执行成功'})
+    add_step({'step': 'git add', 'status': 'success', 'output': output or '执行成功'})
 
     # 2. git commit
     result = _run_git_command(['git', 'commit', '-m', commit_message], cwd=frontend_path)
@@ -289,7 +1126,7 @@ def deploy(commit_message):
         error_msg = _format_error(result)
         raise RuntimeError(f'git commit 失败: {error_msg}')
     output = _get_command_output(result)
-    steps.append({'step': 'git commit', 'status': 'success', 'output': output or '执行成功'})
+    add_step({'step': 'git commit', 'status': 'success', 'output': output or '执行成功'})
 
     # 3. git push origin master
     result = _run_git_command(['git', 'push', 'origin', 'master'], cwd=frontend_path)
@@ -297,7 +1134,7 @@ def deploy(commit_message):
         error_msg = _format_error(result)
         raise RuntimeError(f'git push origin master 失败: {error_msg}')
     output = _get_command_output(result)
-    steps.append({'step': 'git push origin master', 'status': 'success', 'output': output or '推送成功'})
+    add_step({'step': 'git push origin master', 'status': 'success', 'output': output or '推送成功'})
 
     # 4. npm run build
     # 设置 NODE_OPTIONS 环境变量以解决 Node.js 17+ 的 OpenSSL 兼容性问题
@@ -311,82 +1148,50 @@ def deploy(commit_message):
         raise RuntimeError(f'npm run build 失败: {full_output}')
     output = _get_command_output(result)
     full_output = f"{command_info}\n\n{output or '构建成功'}"
-    steps.append({'step': 'npm run build', 'status': 'success', 'output': full_output})
+    add_step({'step': 'npm run build', 'status': 'success', 'output': full_output})
 
-    # 5. 备份 dist 目录
+    # 5. 准备 alpha 分支的独立工作树，发布过程不切换主工作区的分支
     dist_path = frontend_path / 'dist'
-    dist_backup_path = frontend_path / 'dist_backup'
-
-    if dist_path.exists():
-        if dist_backup_path.exists():
-            shutil.rmtree(dist_backup_path)
-        shutil.copytree(dist_path, dist_backup_path)
-        steps.append({'step': '备份 dist 目录', 'status': 'success', 'output': 'dist_backup'})
-    else:
+    if not dist_path.exists():
         raise RuntimeError('dist 目录不存在，构建可能失败')
 
-    # 6. 切换到 alpha 分支
-    result = _run_git_command(['git', 'checkout', 'alpha'], cwd=frontend_path)
-    if result.returncode != 0:
-        error_msg = _format_error(result)
-        raise RuntimeError(f'切换到 alpha 分支失败: {error_msg}')
-    output = _get_command_output(result)
-    steps.append({'step': '切换到 alpha 分支', 'status': 'success', 'output': output or '切换成功'})
+    worktree_path, output = _ensure_alpha_worktree(frontend_path)
+    add_step({'step': '准备 alpha 工作树', 'status': 'success', 'output': output})
 
-    # 7. git pull
-    result = _run_git_command(['git', 'pull'], cwd=frontend_path)
+    # 6. git pull
+    result = _run_git_command(['git', 'pull'], cwd=worktree_path)
     if result.returncode != 0:
         error_msg = _format_error(result)
         raise RuntimeError(f'git pull 失败: {error_msg}')
     output = _get_command_output(result)
-    steps.append({'step': 'git pull', 'status': 'success', 'output': output or '拉取成功'})
+    add_step({'step': 'git pull', 'status': 'success', 'output': output or '拉取成功'})
 
-    # 8. 替换 alpha 分支的 dist 目录
-    if dist_path.exists():
-        shutil.rmtree(dist_path)
-    shutil.copytree(dist_backup_path, dist_path)
-    steps.append({'step': '替换 dist 目录', 'status': 'success', 'output': '替换完成'})
+    # 7. 增量同步 alpha 分支的 dist 目录，只写入有变化的文件
+    sync_stats = sync_directory(dist_path, worktree_path / 'dist')
+    add_step({'step': '替换 dist 目录', 'status': 'success', 'output': _format_sync_stats(sync_stats)})
 
-    # 9. git add dist
-    result = _run_git_command(['git', 'add', 'dist'], cwd=frontend_path)
+    # 8. git add dist
+    result = _run_git_command(['git', 'add', 'dist'], cwd=worktree_path)
     if result.returncode != 0:
         error_msg = _format_error(result)
         raise RuntimeError(f'git add dist 失败: {error_msg}')
     output = _get_command_output(result)
-    steps.append({'step': 'git add dist', 'status': 'success', 'output': output or '执行成功'})
+    add_step({'step': 'git add dist', 'status': 'success', 'output': output or '执行成功'})
 
-    # 10. git commit (alpha 分支)
-    result = _run_git_command(['git', 'commit', '-m', commit_message], cwd=frontend_path)
+    # 9. git commit (alpha 分支)
+    result = _run_git_command(['git', 'commit', '-m', commit_message], cwd=worktree_path)
     # commit 可能失败（如果没有变更），不算错误
     if result.returncode == 0:
         output = _get_command_output(result)
-        steps.append({'step': 'git commit (alpha)', 'status': 'success', 'output': output or '提交成功'})
+        add_step({'step': 'git commit (alpha)', 'status': 'success', 'output': output or '提交成功'})
     else:
         output = result.stderr or result.stdout or '无变更，跳过提交'
-        steps.append({'step': 'git commit (alpha)', 'status': 'warning', 'output': output})
+        add_step({'step': 'git commit (alpha)', 'status': 'warning', 'output': output})
 
-    # 11. git push origin alpha
-    result = _run_git_command(['git', 'push', 'origin', 'alpha'], cwd=frontend_path)
+    # 10. git push origin alpha
+    result = _run_git_command(['git', 'push', 'origin', 'alpha'], cwd=worktree_path)
     if result.returncode != 0:
         error_msg = _format_error(result)
         raise RuntimeError(f'git push origin alpha 失败: {error_msg}')
     output = _get_command_output(result)
-    steps.append({'step': 'git push origin alpha', 'status': 'success', 'output': output or '推送成功'})
-
-    # 12. 切换回 master 分支
-    result = _run_git_command(['git', 'checkout', 'master'], cwd=frontend_path)
-    if result.returncode != 0:
-        output = _format_error(result, default_msg='切换失败')
-        steps.append({'step': '切换回 master', 'status': 'warning', 'output': output})
-    else:
-        output = _get_command_output(result)
-        steps.append({'step': '切换回 master', 'status': 'success', 'output': output or '切换成功'})
-
-    # 清理备份目录
-    if dist_backup_path.exists():
-        shutil.rmtree(dist_backup_path)
-
-    return {
-        'message': '部署成功',
-        'steps': steps
-    }
+    add_step({'step': 'git push origin alpha', 'status': 'success', 'output': output or '推送成功'})
@@ -0,0 +1,40 @@
+"""
+健康检查服务
+"""
+import os
+import time
+from sqlalchemy import text
+from db.database import db
+from db.pool import get_pool_stats
+
+
+def check_database():
+    """检查数据库连接并汇总当前 worker 的连接池状态
+
+    用独立连接执行一次 SELECT 1（不经过请求的会话），测量取连接和往返的耗时。
+
+    Returns:
+        (是否正常, 结果字典)
+    """
+    engine = db.engine
+    result = {'pid': os.getpid()}
+
+    start = time.perf_counter()
+    try:
+        with engine.connect() as conn:
+            acquired = time.perf_counter()
+            conn.execute(text('SELECT 1'))
+        finished = time.perf_counter()
+        result['status'] = 'ok'
+        result['probe'] = {
+            'acquire_ms': round((acquired - start) * 1000, 3),
+            'query_ms': round((finished - acquired) * 1000, 3)
+        }
+        healthy = True
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+        healthy = False
+
+    result['pool'] = get_pool_stats(engine.pool)
+    return healthy, result
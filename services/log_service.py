@@ -1,30 +1,160 @@
 """
 日志管理服务
+
+操作日志不阻塞业务请求：record_operation() 只把日志放入进程内队列，
+后台线程按条数或时间阈值攒批，用一条多行 INSERT 写入。
+进程退出时（atexit、gunicorn 的 worker_exit 钩子）把队列中剩余的日志写完。
+
+过期日志由后台线程定期清理：普通表按主键范围分批删除；
+执行过 db/partition_operation_logs.sql 的按月分区表直接删除过期分区。
 """
+import os
+import time
+import base64
+import queue
+import atexit
+import threading
+from pathlib import Path
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import insert
+from config import (
+    RUNTIME_DIR, OPERATION_LOG_BATCH_SIZE, OPERATION_LOG_FLUSH_INTERVAL, OPERATION_LOG_COUNT_TTL,
+    LOG_RETENTION_DAYS, LOG_RETENTION_MODE, LOG_RETENTION_INTERVAL, LOG_RETENTION_BATCH_SIZE,
+    LOG_RETENTION_PAUSE, LOG_PARTITION_MONTHS_AHEAD
+)
 from db.database import db
-from db.models import OperationLog
+from db.models import OperationLog, User, format_local_time
+from utils.file_lock import FileLock
+
+# 后台写入线程的状态（每个进程一份，fork 出的子进程重新创建）
+_writer_lock = threading.Lock()
+_writer = {
+    'pid': None,
+    'app': None,
+    'queue': None,
+    'thread': None,
+    'stop': None,
+}
+
+# 日志总数缓存：筛选条件 -> (过期时间, 总数)，避免每次翻页都 COUNT(*) 整张表
+_COUNT_CACHE_SIZE = 256
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+# 日志列表只查询需要的列，用户名通过同一个 JOIN 取出
+_LOG_COLUMNS = (
+    OperationLog.id,
+    OperationLog.user_id,
+    User.username,
+    OperationLog.action,
+    OperationLog.resource_type,
+    OperationLog.resource_name,
+    OperationLog.details,
+    OperationLog.created_at,
+)
+
+
+def _encode_log_cursor(log):
+    """把最后一条日志行的 (created_at, id) 编码为游标，created_at 为空时只记录 id"""
+    created_at = log.created_at.isoformat() if log.created_at is not None else ''
+    raw = f"{created_at}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def _decode_log_cursor(cursor):
+    """解析游标，返回 (created_at, id)；created_at 为空的行返回 (None, id)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, log_id = raw.split('|')
+        return (datetime.fromisoformat(created_at) if created_at else None), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('无效的游标')
+
+
+def _after_log_cursor(created_at, log_id):
+    """游标之后的行的筛选条件
+
+    created_at 为空的行（手工导入的旧数据）在倒序中排在最后（MySQL 和 SQLite 都是如此），按 id 继续翻页。
+    """
+    if created_at is None:
+        return db.and_(OperationLog.created_at.is_(None), OperationLog.id < log_id)
+    return db.or_(
+        OperationLog.created_at < created_at,
+        db.and_(OperationLog.created_at == created_at, OperationLog.id < log_id),
+        OperationLog.created_at.is_(None)
+    )
+
+
+def _count_logs(query, cache_key):
+    """统计筛选后的日志总数，结果按筛选条件缓存 OPERATION_LOG_COUNT_TTL 秒"""
+    now = time.monotonic()
+    with _count_cache_lock:
+        cached = _count_cache.get(cache_key)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+    total = query.order_by(None).count()
+    with _count_cache_lock:
+        if len(_count_cache) >= _COUNT_CACHE_SIZE:
+            _count_cache.clear()
+        _count_cache[cache_key] = (now + OPERATION_LOG_COUNT_TTL, total)
+    return total
+
 
+def get_operation_logs(page=1, limit=15, action_filter=None, resource_type_filter=None, username_filter=None,
+                       user_id_filter=None, cursor=None, include_total=True):
+    """获取操作日志，按 (created_at, id) 倒序
 
-def get_operation_logs(page=1, limit=15, action_filter=None, resource_type_filter=None, username_filter=None, user_id_filter=None):
-    """获取操作日志"""
-    query = OperationLog.query.join(OperationLog.user).order_by(OperationLog.created_at.desc())
+    cursor 为 None 时按页码翻页；否则按游标翻页（空字符串表示第一页），
+    翻到深处也只需沿索引读取 limit 条。总数是缓存值，可能略有滞后。
+
+    Returns:
+        {'items': 日志行列表, 'total': 总数（include_total 为 False 时为 None）, 'next_cursor': 下一页游标}
+    """
+    query = db.session.query(*_LOG_COLUMNS).join(User, OperationLog.user_id == User.id)
 
     if action_filter:
         query = query.filter(OperationLog.action == action_filter)
     if resource_type_filter:
         query = query.filter(OperationLog.resource_type == resource_type_filter)
     if username_filter:
-        query = query.filter(OperationLog.user.has(username=username_filter))
+        query = query.filter(User.username == username_filter)
     if user_id_filter:
         query = query.filter(OperationLog.user_id == user_id_filter)
 
-    logs = query.paginate(
-        page=page,
-        per_page=limit,
-        error_out=False
-    )
+    total = None
+    if include_total:
+        total = _count_logs(query, (action_filter, resource_type_filter, username_filter, user_id_filter))
+
+    query = query.order_by(OperationLog.created_at.desc(), OperationLog.id.desc())
+    if cursor is None:
+        items = query.offset((page - 1) * limit).limit(limit).all()
+        return {'items': items, 'total': total, 'next_cursor': None}
+
+    if cursor:
+        query = query.filter(_after_log_cursor(*_decode_log_cursor(cursor)))
+    # 多取一条判断是否还有下一页
+    items = query.limit(limit + 1).all()
+    next_cursor = _encode_log_cursor(items[limit - 1]) if len(items) > limit else None
+    return {'items': items[:limit], 'total': total, 'next_cursor': next_cursor}
 
-    return logs
+
+def serialize_operation_logs(rows):
+    """把 get_operation_logs 返回的日志行转换为字典列表"""
+    return [
+        {
+            'id': row.id,
+            'user_id': row.user_id,
+            'username': row.username,
+            'action': row.action,
+            'resource_type': row.resource_type,
+            'resource_name': row.resource_name,
+            'details': row.details,
+            'created_at': format_local_time(row.created_at)
+        }
+        for row in rows
+    ]
 
 
 def create_operation_log(user_id, action, resource_type, resource_name, details):
@@ -42,14 +172,260 @@ def create_operation_log(user_id, action, resource_type, resource_name, details)
     return log
 
 
-def delete_old_logs(older_than_days=30):
-    """删除指定天数前的日志"""
-    from datetime import datetime, timedelta
-    cutoff_date = datetime.now() - timedelta(days=older_than_days)
+def _expired_id_range(cutoff_date):
+    """获取过期日志的主键范围，没有过期日志时返回 None"""
+    # created_at 上的 (created_at, id) 索引覆盖了这个查询，只读索引不回表
+    low, high = db.session.query(
+        db.func.min(OperationLog.id), db.func.max(OperationLog.id)
+    ).filter(OperationLog.created_at < cutoff_date).one()
+    return None if low is None else (low, high)
 
-    deleted_count = db.session.query(OperationLog)\
-        .filter(OperationLog.created_at < cutoff_date)\
-        .delete()
 
-    db.session.commit()
+def delete_old_logs(older_than_days=30, batch_size=LOG_RETENTION_BATCH_SIZE,
+                    pause=LOG_RETENTION_PAUSE):
+    """删除指定天数前的日志
+
+    按主键范围分批删除，每批单独提交并暂停 pause 秒，
+    避免一个大事务长时间持锁、撑大 undo log 并拖慢复制。
+
+    Returns:
+        删除的条数
+    """
+    # 日志时间以 UTC 存储
+    cutoff_date = datetime.utcnow() - timedelta(days=older_than_days)
+    id_range = _expired_id_range(cutoff_date)
+    if id_range is None:
+        return 0
+
+    deleted_count = 0
+    low, high = id_range
+    while low <= high:
+        try:
+            deleted_count += db.session.query(OperationLog).filter(
+                OperationLog.id >= low,
+                OperationLog.id < low + batch_size,
+                OperationLog.created_at < cutoff_date
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        low += batch_size
+        if pause and low <= high:
+            time.sleep(pause)
     return deleted_count
+
+
+def _log_partitions():
+    """获取 operation_logs 的分区列表 [(分区名, LESS THAN 的 TO_DAYS 值或 MAXVALUE)]（仅 MySQL）"""
+    return db.session.execute(db.text(
+        "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'operation_logs' AND PARTITION_NAME IS NOT NULL "
+        "ORDER BY PARTITION_ORDINAL_POSITION"
+    )).all()
+
+
+def _to_days(value):
+    """MySQL 的 TO_DAYS()"""
+    return db.session.execute(db.text('SELECT TO_DAYS(:value)'), {'value': value}).scalar()
+
+
+def _month_start(year, month):
+    """某月第一天，month 可以超过 12"""
+    return datetime(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def _add_future_partitions(partitions, months_ahead=LOG_PARTITION_MONTHS_AHEAD):
+    """从 pmax 中拆出未来几个月的分区，保证新日志不会都落进 pmax"""
+    bounds = [int(desc) for _, desc in partitions if desc != 'MAXVALUE']
+    now = datetime.utcnow()
+    new_partitions = []
+    for offset in range(months_ahead + 1):
+        start = _month_start(now.year, now.month + offset)
+        end = _month_start(start.year, start.month + 1)
+        end_days = _to_days(end)
+        if bounds and end_days <= max(bounds):
+            continue
+        new_partitions.append(
+            f"PARTITION p{start.strftime('%Y%m')} VALUES LESS THAN ({end_days})"
+        )
+        bounds.append(end_days)
+
+    if new_partitions:
+        db.session.execute(db.text(
+            f"ALTER TABLE operation_logs REORGANIZE PARTITION pmax INTO "
+            f"({', '.join(new_partitions)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+        ))
+    return len(new_partitions)
+
+
+def drop_expired_log_partitions(older_than_days=30):
+    """按月分区表的日志清理：整个分区都已过期时直接 DROP PARTITION，并预建未来的分区
+
+    Returns:
+        删除的分区名列表
+    """
+    partitions = _log_partitions()
+    if not partitions:
+        raise RuntimeError('operation_logs 没有分区，请先执行 db/partition_operation_logs.sql')
+
+    cutoff_days = _to_days(datetime.utcnow() - timedelta(days=older_than_days))
+    # 分区中的日志都早于 LESS THAN 的边界，边界不晚于截止日期时整个分区都已过期
+    expired = [name for name, desc in partitions if desc != 'MAXVALUE' and int(desc) <= cutoff_days]
+    if expired:
+        db.session.execute(db.text(f"ALTER TABLE operation_logs DROP PARTITION {', '.join(expired)}"))
+    _add_future_partitions(partitions)
+    return expired
+
+
+def run_log_retention():
+    """执行一次日志清理（需要应用上下文）"""
+    if LOG_RETENTION_MODE == 'partition':
+        expired = drop_expired_log_partitions(LOG_RETENTION_DAYS)
+        print(f"日志清理完成，删除分区: {', '.join(expired) or '无'}")
+    else:
+        deleted_count = delete_old_logs(LOG_RETENTION_DAYS)
+        print(f"日志清理完成，删除 {deleted_count} 条")
+
+
+def _retention_due():
+    """距离上次清理是否已超过 LOG_RETENTION_INTERVAL"""
+    try:
+        last_run = (Path(RUNTIME_DIR) / 'log_retention.last').stat().st_mtime
+    except FileNotFoundError:
+        return True
+    return time.time() - last_run >= LOG_RETENTION_INTERVAL
+
+
+def _retention_loop(app):
+    """后台清理线程：所有 worker 都会启动，由文件锁保证同一时间只有一个在清理"""
+    lock = FileLock(Path(RUNTIME_DIR) / 'log_retention.lock')
+    # 启动时先等一会，避开 worker 启动时的负载
+    time.sleep(60)
+    while True:
+        if _retention_due() and lock.acquire(blocking=False):
+            try:
+                # 拿到锁后再检查一次，其他 worker 可能刚清理完
+                if _retention_due():
+                    with app.app_context():
+                        run_log_retention()
+                    (Path(RUNTIME_DIR) / 'log_retention.last').touch()
+            except Exception as e:
+                print(f"日志清理失败: {str(e)}")
+            finally:
+                lock.release()
+        time.sleep(min(LOG_RETENTION_INTERVAL, 600))
+
+
+def start_log_retention(app):
+    """启动后台日志清理线程（LOG_RETENTION_DAYS 为 0 时不清理）
+
+    由 gunicorn 的 post_fork 钩子在每个 worker 中调用，导入应用（脚本、部署 runner）时不会启动。
+    """
+    if LOG_RETENTION_DAYS <= 0:
+        return
+    thread = threading.Thread(target=_retention_loop, args=(app,), name='log-retention', daemon=True)
+    thread.start()
+
+
+def _insert_logs(app, batch):
+    """用一条多行 INSERT 写入一批日志"""
+    with app.app_context():
+        try:
+            db.session.execute(insert(OperationLog), batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def _writer_loop(log_queue, stop, app):
+    """后台写入线程：攒够 OPERATION_LOG_BATCH_SIZE 条或等待 OPERATION_LOG_FLUSH_INTERVAL 秒后写入一批"""
+    while not stop.is_set():
+        try:
+            batch = [log_queue.get(timeout=1)]
+        except queue.Empty:
+            continue
+        deadline = time.monotonic() + OPERATION_LOG_FLUSH_INTERVAL
+        while len(batch) < OPERATION_LOG_BATCH_SIZE and not stop.is_set():
+            try:
+                batch.append(log_queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+
+        # 数据库暂时不可用时带退避重试，日志留在本线程中不丢弃；进程退出时只再尝试一次
+        delay = 1
+        while True:
+            try:
+                _insert_logs(app, batch)
+                break
+            except Exception as e:
+                print(f"写入操作日志失败（{len(batch)} 条）: {str(e)}")
+                if stop.wait(delay):
+                    _insert_logs_quietly(app, batch)
+                    break
+                delay = min(delay * 2, 30)
+
+
+def _insert_logs_quietly(app, batch):
+    """写入日志，失败时只打印错误"""
+    try:
+        _insert_logs(app, batch)
+    except Exception as e:
+        print(f"写入操作日志失败，丢弃 {len(batch)} 条: {str(e)}")
+
+
+def _get_writer():
+    """获取当前进程的日志队列，必要时启动后台写入线程"""
+    with _writer_lock:
+        if _writer['pid'] != os.getpid():
+            _writer['pid'] = os.getpid()
+            _writer['app'] = current_app._get_current_object()
+            _writer['queue'] = queue.Queue()
+            _writer['stop'] = threading.Event()
+            _writer['thread'] = threading.Thread(
+                target=_writer_loop,
+                args=(_writer['queue'], _writer['stop'], _writer['app']),
+                name='operation-log-writer',
+                daemon=True
+            )
+            _writer['thread'].start()
+        return _writer['queue']
+
+
+def record_operation(user_id, action, resource_type, resource_name, details):
+    """记录操作日志（异步写入，需要应用上下文）"""
+    _get_writer().put({
+        'user_id': user_id,
+        'action': action,
+        'resource_type': resource_type,
+        'resource_name': resource_name,
+        'details': details,
+        'created_at': datetime.utcnow()  # 入队时间，而不是写入时间
+    })
+
+
+def flush_operation_logs(timeout=10):
+    """停止后台写入线程并把队列中剩余的日志写入数据库，进程退出前调用"""
+    with _writer_lock:
+        if _writer['pid'] != os.getpid() or _writer['thread'] is None:
+            return
+        app, log_queue, thread = _writer['app'], _writer['queue'], _writer['thread']
+        _writer['stop'].set()
+        _writer['thread'] = None
+        _writer['pid'] = None  # 之后再有日志时重新启动写入线程
+
+    # 等待写入线程写完手上的一批
+    thread.join(timeout)
+
+    batch = []
+    while True:
+        try:
+            batch.append(log_queue.get_nowait())
+        except queue.Empty:
+            break
+    for start in range(0, len(batch), OPERATION_LOG_BATCH_SIZE):
+        _insert_logs_quietly(app, batch[start:start + OPERATION_LOG_BATCH_SIZE])
+
+
+atexit.register(flush_operation_logs)
@@ -0,0 +1,330 @@
+"""
+预览内容存储
+
+预览由一个 worker 创建、可能由另一个 worker 读取，因此默认使用 SQLite 文件存储，
+所有 worker 共享；内存存储只适合单进程调试。
+
+内容按 SHA-256 去重存储：同一份 HTML 反复预览只保存一次，每个预览 ID 引用一份内容，
+引用数降为 0 时内容随之删除。两种存储都有总大小上限（超出时按 LRU 淘汰内容）和过期时间，
+过期预览由后台线程按到期时间顺序清理，不在请求路径上扫描。
+"""
+import os
+import time
+import heapq
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from config import (
+    PREVIEW_BACKEND, PREVIEW_STORE_PATH, PREVIEW_TTL, PREVIEW_MAX_BYTES, PREVIEW_REAP_INTERVAL
+)
+from utils.file_lock import FileLock
+
+# SQLite 存储中读取预览时更新内容访问时间的最短间隔（秒）
+PREVIEW_TOUCH_INTERVAL = 60
+
+
+def _content_hash(content):
+    """计算内容哈希"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class PreviewStore:
+    """预览存储接口"""
+
+    def __init__(self, max_bytes=PREVIEW_MAX_BYTES, ttl=PREVIEW_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._reaper = None
+
+    def _check_size(self, size):
+        """单个预览不能超过总大小上限"""
+        if size > self.max_bytes:
+            raise ValueError(f'预览内容过大，不能超过 {self.max_bytes} 字节')
+
+    def put(self, preview_id, content):
+        """保存预览内容"""
+        raise NotImplementedError
+
+    def get(self, preview_id):
+        """获取预览内容，不存在或已过期时返回 None"""
+        raise NotImplementedError
+
+    def reap_expired(self):
+        """删除已过期的预览，返回下一个预览的到期时间（没有预览时返回 None）"""
+        raise NotImplementedError
+
+    def _reap_lock(self):
+        """多个进程共享存储时返回清理锁，同一时间只有一个进程清理；进程内存储返回 None"""
+        return None
+
+    def _reap_loop(self):
+        """后台清理线程：睡到最早的到期时间再清理，最长间隔 PREVIEW_REAP_INTERVAL"""
+        lock = self._reap_lock()
+        while True:
+            next_expiry = None
+            if lock is None or lock.acquire(blocking=False):
+                try:
+                    next_expiry = self.reap_expired()
+                except Exception as e:
+                    print(f"清理过期预览时出错: {str(e)}")
+                finally:
+                    if lock is not None:
+                        lock.release()
+            delay = PREVIEW_REAP_INTERVAL
+            if next_expiry is not None:
+                delay = min(max(next_expiry - time.time(), 1), PREVIEW_REAP_INTERVAL)
+            time.sleep(delay)
+
+    def start_reaper(self):
+        """启动后台清理线程（每个进程一个）"""
+        if self._reaper is None or not self._reaper.is_alive():
+            self._reaper = threading.Thread(target=self._reap_loop, name='preview-reaper', daemon=True)
+            self._reaper.start()
+
+
+class MemoryPreviewStore(PreviewStore):
+    """进程内存储，仅适合单 worker 部署"""
+
+    def __init__(self, max_bytes=PREVIEW_MAX_BYTES, ttl=PREVIEW_TTL):
+        super().__init__(max_bytes, ttl)
+        self._lock = threading.Lock()
+        self._blobs = OrderedDict()  # 内容哈希 -> {'content', 'size', 'ids'}，按访问顺序排列
+        self._previews = {}          # preview_id -> (内容哈希, 到期时间)
+        self._expiry_heap = []       # (到期时间, preview_id)，可能包含已删除预览的旧条目
+        self._total_bytes = 0
+
+    def _remove_preview(self, preview_id):
+        content_hash, _ = self._previews.pop(preview_id)
+        blob = self._blobs[content_hash]
+        blob['ids'].discard(preview_id)
+        if not blob['ids']:
+            del self._blobs[content_hash]
+            self._total_bytes -= blob['size']
+
+    def put(self, preview_id, content):
+        size = len(content.encode('utf-8'))
+        self._check_size(size)
+        content_hash = _content_hash(content)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            if preview_id in self._previews:
+                self._remove_preview(preview_id)
+            blob = self._blobs.get(content_hash)
+            if blob is None:
+                blob = self._blobs[content_hash] = {'content': content, 'size': size, 'ids': set()}
+                self._total_bytes += size
+            self._blobs.move_to_end(content_hash)
+            blob['ids'].add(preview_id)
+            self._previews[preview_id] = (content_hash, expires_at)
+            heapq.heappush(self._expiry_heap, (expires_at, preview_id))
+
+            # 超出上限时淘汰最久未访问的内容及引用它的预览
+            while self._total_bytes > self.max_bytes:
+                evict_hash = next(iter(self._blobs))
+                for evict_id in list(self._blobs[evict_hash]['ids']):
+                    self._remove_preview(evict_id)
+
+    def get(self, preview_id):
+        with self._lock:
+            item = self._previews.get(preview_id)
+            if item is None:
+                return None
+            content_hash, expires_at = item
+            if expires_at < time.time():
+                self._remove_preview(preview_id)
+                return None
+            self._blobs.move_to_end(content_hash)
+            return self._blobs[content_hash]['content']
+
+    def reap_expired(self):
+        now = time.time()
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] < now:
+                expires_at, preview_id = heapq.heappop(self._expiry_heap)
+                item = self._previews.get(preview_id)
+                if item is not None and item[1] == expires_at:
+                    self._remove_preview(preview_id)
+            return self._expiry_heap[0][0] if self._expiry_heap else None
+
+
+class SQLitePreviewStore(PreviewStore):
+    """SQLite 文件存储，同一台机器上的所有 worker 共享"""
+
+    SCHEMA_VERSION = 1
+
+    SCHEMA = (
+        '''CREATE TABLE preview_blobs (
+            hash TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            last_access REAL NOT NULL
+        )''',
+        'CREATE INDEX idx_preview_blobs_last_access ON preview_blobs (last_access)',
+        '''CREATE TABLE previews (
+            id TEXT PRIMARY KEY,
+            hash TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )''',
+        'CREATE INDEX idx_previews_expires_at ON previews (expires_at)',
+        'CREATE INDEX idx_previews_hash ON previews (hash)',
+        '''CREATE TABLE preview_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_bytes INTEGER NOT NULL
+        )''',
+        'INSERT INTO preview_meta (id, total_bytes) VALUES (1, 0)',
+        '''CREATE TRIGGER trg_preview_blobs_insert AFTER INSERT ON preview_blobs BEGIN
+            UPDATE preview_meta SET total_bytes = total_bytes + NEW.size WHERE id = 1;
+        END''',
+        '''CREATE TRIGGER trg_preview_blobs_delete AFTER DELETE ON preview_blobs BEGIN
+            UPDATE preview_meta SET total_bytes = total_bytes - OLD.size WHERE id = 1;
+        END''',
+        '''CREATE TRIGGER trg_previews_insert AFTER INSERT ON previews BEGIN
+            UPDATE preview_blobs SET refcount = refcount + 1 WHERE hash = NEW.hash;
+        END''',
+        '''CREATE TRIGGER trg_previews_delete AFTER DELETE ON previews BEGIN
+            UPDATE preview_blobs SET refcount = refcount - 1 WHERE hash = OLD.hash;
+            DELETE FROM preview_blobs WHERE hash = OLD.hash AND refcount <= 0;
+        END''',
+    )
+
+    def __init__(self, path=PREVIEW_STORE_PATH, max_bytes=PREVIEW_MAX_BYTES, ttl=PREVIEW_TTL):
+        super().__init__(max_bytes, ttl)
+        self.path = Path(path)
+        self._local = threading.local()
+
+    def _reap_lock(self):
+        # 所有 worker 共享同一个文件，同一时间只需一个 worker 清理
+        return FileLock(self.path.with_name(f'{self.path.name}.reaper.lock'))
+
+    def _create_schema(self, conn):
+        """创建表结构，版本与程序不一致时报错，不删除已有的预览"""
+        if conn.execute('PRAGMA user_version').fetchone()[0] == self.SCHEMA_VERSION:
+            return
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后再检查一次，避免多个连接同时建表
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version == 0:
+                for statement in self.SCHEMA:
+                    conn.execute(statement)
+                conn.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            elif version != self.SCHEMA_VERSION:
+                raise RuntimeError(f'预览存储的版本（{version}）与当前程序支持的版本不一致: {self.path}')
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _connect(self):
+        """获取当前线程的连接；fork 出的子进程不能复用父进程的连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema(conn)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def put(self, preview_id, content):
+        size = len(content.encode('utf-8'))
+        self._check_size(size)
+        content_hash = _content_hash(content)
+        now = time.time()
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM previews WHERE id = ?', (preview_id,))
+            conn.execute(
+                'INSERT OR IGNORE INTO preview_blobs (hash, content, size, last_access) VALUES (?, ?, ?, ?)',
+                (content_hash, content, size, now)
+            )
+            conn.execute('UPDATE preview_blobs SET last_access = ? WHERE hash = ?', (now, content_hash))
+            conn.execute(
+                'INSERT INTO previews (id, hash, expires_at) VALUES (?, ?, ?)',
+                (preview_id, content_hash, now + self.ttl)
+            )
+
+            # 超出上限时淘汰最久未访问的内容及引用它的预览
+            while True:
+                total_bytes = conn.execute('SELECT total_bytes FROM preview_meta WHERE id = 1').fetchone()[0]
+                excess = total_bytes - self.max_bytes
+                if excess <= 0:
+                    break
+                rows = conn.execute(
+                    'SELECT hash, size FROM preview_blobs WHERE hash != ? ORDER BY last_access LIMIT 64',
+                    (content_hash,)
+                ).fetchall()
+                if not rows:
+                    # 计数与实际内容不一致（没有可淘汰的内容却仍超出上限）：按实际大小校正后退出
+                    conn.execute(
+                        'UPDATE preview_meta SET total_bytes = '
+                        '(SELECT COALESCE(SUM(size), 0) FROM preview_blobs) WHERE id = 1'
+                    )
+                    break
+                evict_hashes = []
+                for evict_hash, evict_size in rows:
+                    if excess <= 0:
+                        break
+                    evict_hashes.append((evict_hash,))
+                    excess -= evict_size
+                conn.executemany('DELETE FROM previews WHERE hash = ?', evict_hashes)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def get(self, preview_id):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute('''
+            SELECT b.hash, b.content, b.last_access, p.expires_at
+            FROM previews p JOIN preview_blobs b ON b.hash = p.hash
+            WHERE p.id = ?
+        ''', (preview_id,)).fetchone()
+        if row is None:
+            return None
+        content_hash, content, last_access, expires_at = row
+        # 过期的预览留给后台线程删除，读取路径上不写库
+        if expires_at < now:
+            return None
+        # 访问时间只用于淘汰排序，不需要精确：距上次记录超过 PREVIEW_TOUCH_INTERVAL 才更新，
+        # 频繁读取同一份内容时不会每次都去抢 SQLite 的写锁
+        if now - last_access > PREVIEW_TOUCH_INTERVAL:
+            conn.execute('UPDATE preview_blobs SET last_access = ? WHERE hash = ?', (now, content_hash))
+        return content
+
+    def reap_expired(self):
+        now = time.time()
+        conn = self._connect()
+        # 按 expires_at 索引做范围删除，只触及已过期的行
+        conn.execute('DELETE FROM previews WHERE expires_at < ?', (now,))
+        return conn.execute('SELECT MIN(expires_at) FROM previews').fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_preview_store():
+    """获取配置的预览存储（每个进程一个实例），并确保后台清理线程已启动"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if PREVIEW_BACKEND == 'memory':
+                    store = MemoryPreviewStore()
+                elif PREVIEW_BACKEND == 'sqlite':
+                    store = SQLitePreviewStore()
+                else:
+                    raise RuntimeError(f'不支持的预览存储类型: {PREVIEW_BACKEND}')
+                store.start_reaper()
+                _store = store
+    return _store
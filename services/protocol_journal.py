@@ -0,0 +1,358 @@
+"""
+协议写入意图日志
+
+协议内容写在静态目录的文件里，属性写在 protocols 表里，两者无法放进同一个事务。
+每次写入前先在日志中记录意图，意图落盘后才提交数据库：
+- create / update 的意图带上新内容和内容哈希，日志落盘即内容落盘，
+  协议文件本身的写入和改名不再逐次 fsync，由检查点统一落盘
+- update 的意图带上写入后的属性和旧内容的哈希，delete 的意图带上被删文件的哈希
+- import：导入的文件先写入协议目录下的暂存目录，数据库提交后追加 committed 标记；
+  有标记则把暂存目录中的文件移入协议目录，最后删除暂存目录
+
+因此一次编辑只需一次日志 fsync（同一进程内并发的写入由 GroupSync 合并为一次）。
+
+对账时每个文件只看日志中最后一个意图，进程中途崩溃的意图按数据库的结果修正文件：
+- create：有记录时文件丢失则用日志中的内容补写；没有记录时只删除内容与意图一致的文件，
+  同名的其他文件（例如 git 跟踪的文件）不会被误删
+- update：记录的属性与意图一致说明数据库已提交（或只改了内容），文件仍是旧内容时用日志中的内容补写；
+  不一致说明数据库未提交，文件保持原样
+- delete：没有记录时只删除内容与意图记录一致的文件
+正常完成的意图（同一次开机内）只需把文件 fsync 落盘。修正完成后 fsync 协议目录并清空日志。
+
+写入方持有日志的共享锁，对账持有排他锁，因此对账时日志中未完成的意图一定属于已退出的进程。
+每个进程第一次写入时启动后台线程对账，等待排他锁直到成功一次为止；日志超过 JOURNAL_COMPACT_BYTES 时，
+写入结束后若没有其他写入在进行，顺便做一次检查点：对账、落盘并清空日志。
+"""
+import os
+import json
+import uuid
+import shutil
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from flask import current_app
+from config import PROTOCOL_JOURNAL_PATH, PROTOCOL_FSYNC
+from db.database import db
+from db.models import Protocol
+from utils.atomic_file import GroupSync, temp_path_for, write_temp_file, fsync_directory
+from utils.file_lock import FileLock
+
+# 日志超过该大小时做检查点（日志中带有协议内容）
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+# 启动对账失败后的重试间隔（秒）
+JOURNAL_RECONCILE_RETRY_SECONDS = 5
+
+# update 意图记录的属性
+PROTOCOL_ATTR_FIELDS = ('description', 'app_type', 'app_name')
+
+_journal_lock = threading.Lock()
+_journal = {
+    'fd': None,          # 当前进程追加写入日志的文件描述符（O_APPEND）
+    'pid': None,         # 打开 fd 的进程，fork 出的子进程需要重新打开
+    'reconciled': None,  # 已启动对账线程的进程
+}
+_journal_sync = GroupSync(lambda: os.fsync(_journal_fd()))
+
+
+def _journal_path():
+    """获取日志文件路径"""
+    if not PROTOCOL_JOURNAL_PATH:
+        raise RuntimeError('未配置 PROTOCOL_JOURNAL_PATH 或 FRONTEND_DIR 环境变量')
+    path = Path(PROTOCOL_JOURNAL_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _lock(shared):
+    """获取日志锁"""
+    path = _journal_path()
+    return FileLock(path.with_name(f'{path.name}.lock'), shared=shared)
+
+
+def _journal_fd():
+    """获取当前进程的日志文件描述符"""
+    with _journal_lock:
+        if _journal['fd'] is None or _journal['pid'] != os.getpid():
+            _journal['fd'] = os.open(str(_journal_path()), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            _journal['pid'] = os.getpid()
+        return _journal['fd']
+
+
+def _boot_id():
+    """当前开机的标识（仅 Linux），用于判断意图之后是否发生过断电重启"""
+    try:
+        with open('/proc/sys/kernel/random/boot_id', 'r', encoding='ascii') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _content_hash(content):
+    """计算协议内容的哈希"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _file_hash(path):
+    """计算文件内容的哈希，文件不存在时返回 None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+
+def _append(record, durable=False):
+    """追加一条日志记录；durable 时等待记录落盘"""
+    # O_APPEND 下普通文件的单次 write 原子地追加到末尾，不会与其他进程的记录交错
+    os.write(_journal_fd(), (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8'))
+    if durable and PROTOCOL_FSYNC:
+        _journal_sync.sync()
+
+
+def _read_intents():
+    """按开始顺序读取日志中未撤销的意图"""
+    intents = {}
+    try:
+        with open(_journal_path(), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                if record['state'] == 'begin':
+                    intents[record['id']] = record
+                elif record['id'] in intents:
+                    if record['state'] == 'abort':
+                        del intents[record['id']]
+                    else:
+                        intents[record['id']][record['state']] = True
+    except FileNotFoundError:
+        pass
+    return list(intents.values())
+
+
+def _restore_content(intent, path):
+    """用日志中的内容补写协议文件"""
+    tmp_path = temp_path_for(path)
+    write_temp_file(tmp_path, intent['content'], PROTOCOL_FSYNC)
+    os.replace(tmp_path, path)
+
+
+def _repair_import(intent):
+    """按 committed 标记完成或丢弃一次导入"""
+    path = Path(intent['path'])
+    if path.is_dir():
+        if intent.get('committed'):
+            for item in path.iterdir():
+                os.replace(item, path.parent / item.name)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _repair(intent):
+    """按数据库的结果修正一个中途崩溃的意图"""
+    path = Path(intent['path'])
+    row = db.session.query(*[getattr(Protocol, f) for f in PROTOCOL_ATTR_FIELDS]) \
+        .filter(Protocol.filename == path.name).first()
+    current_hash = _file_hash(path)
+
+    if intent['op'] == 'create':
+        if row is not None:
+            if current_hash is None or path.stat().st_size == 0:
+                _restore_content(intent, path)
+        elif current_hash is not None and current_hash == intent['hash']:
+            # 只删除本次意图写入的文件
+            path.unlink()
+        return
+
+    if intent['op'] == 'update':
+        if row is None or dict(zip(PROTOCOL_ATTR_FIELDS, row)) != intent['attrs']:
+            return  # 数据库未提交（或已被删除），文件保持原样
+        if current_hash in (None, intent['old_hash']) or path.stat().st_size == 0:
+            if current_hash != intent['hash']:
+                _restore_content(intent, path)
+        return
+
+    if intent['op'] == 'delete':
+        if row is None and current_hash is not None and current_hash == intent['old_hash']:
+            path.unlink()
+
+
+def _reconcile_locked():
+    """检查点：修正中途崩溃的意图，把文件落盘后清空日志，调用方需持有排他锁
+
+    Returns:
+        修正的意图数量
+    """
+    intents = _read_intents()
+    boot_id = _boot_id()
+    latest = {}
+    repaired = 0
+    for intent in intents:
+        if intent.get('tmp'):
+            Path(intent['tmp']).unlink(missing_ok=True)
+        if intent['op'] == 'import':
+            if not intent.get('done'):
+                print(f"修正未完成的协议导入: {intent['path']}")
+                _repair_import(intent)
+                repaired += 1
+            continue
+        # 同一文件后开始的意图覆盖之前的意图
+        latest[intent['path']] = intent
+
+    for path, intent in latest.items():
+        # 同一次开机内正常完成的意图，文件已在页缓存中，只需落盘；
+        # 中途崩溃或之后断电重启过的意图，按数据库的结果修正
+        if not intent.get('done') or boot_id is None or intent.get('boot_id') != boot_id:
+            _repair(intent)
+            repaired += 1
+
+    if PROTOCOL_FSYNC:
+        dirs = set()
+        for path in latest:
+            path = Path(path)
+            dirs.add(path.parent)
+            try:
+                fd = os.open(str(path), os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        for dir_path in dirs:
+            fsync_directory(dir_path)
+
+    # 原地截断而不是替换文件，其他进程持有的 O_APPEND 描述符仍然有效
+    fd = _journal_fd()
+    os.ftruncate(fd, 0)
+    if PROTOCOL_FSYNC:
+        os.fsync(fd)
+    return repaired
+
+
+def reconcile_journal(blocking=True):
+    """对账并清空日志（需要应用上下文）
+
+    Returns:
+        修正的意图数量；非阻塞模式下有写入在进行时返回 None
+    """
+    lock = _lock(shared=False)
+    if not lock.acquire(blocking=blocking):
+        return None
+    try:
+        return _reconcile_locked()
+    finally:
+        lock.release()
+
+
+def _reconcile_loop(app):
+    """后台对账：阻塞等待排他锁，失败时隔一段时间重试，直到成功一次"""
+    while True:
+        try:
+            with app.app_context():
+                reconcile_journal(blocking=True)
+            return
+        except Exception as e:
+            print(f"协议写入日志对账失败，{JOURNAL_RECONCILE_RETRY_SECONDS} 秒后重试: {str(e)}")
+            time.sleep(JOURNAL_RECONCILE_RETRY_SECONDS)
+
+
+def _ensure_reconciled():
+    """每个进程第一次写入时启动后台对账线程
+
+    对账在后台线程中等待排他锁：批量导入会长时间持有共享锁，写入请求不应被它阻塞，
+    而写入一直在进行时对账也不会被跳过，等到锁就执行。
+    """
+    with _journal_lock:
+        if _journal['reconciled'] == os.getpid():
+            return
+        _journal['reconciled'] = os.getpid()
+    threading.Thread(
+        target=_reconcile_loop,
+        args=(current_app._get_current_object(),),
+        name='protocol-journal-reconcile',
+        daemon=True
+    ).start()
+
+
+def _maybe_compact():
+    """日志过大且没有其他写入在进行时做检查点"""
+    try:
+        if os.fstat(_journal_fd()).st_size > JOURNAL_COMPACT_BYTES:
+            reconcile_journal(blocking=False)
+    except Exception as e:
+        print(f"压缩协议写入日志失败: {str(e)}")
+
+
+class ProtocolIntent:
+    """一次协议写入的意图"""
+
+    def __init__(self, op, path, tmp_path=None):
+        self.id = uuid.uuid4().hex
+        self.op = op
+        self.path = Path(path)
+        self.tmp_path = Path(tmp_path) if tmp_path else None
+        self.finished = False
+
+    def commit(self):
+        """记录数据库已提交（import 时在移入文件前调用）"""
+        _append({'id': self.id, 'state': 'committed'}, durable=True)
+
+    def finish(self):
+        """记录意图已完成，文件和数据库已一致"""
+        if not self.finished:
+            # 丢失 done 记录只会让对账重复一次幂等的修正，不需要落盘
+            _append({'id': self.id, 'state': 'done'})
+            self.finished = True
+
+    def abort(self):
+        """记录意图已撤销：数据库未提交，块内已做的文件操作已由调用方回退"""
+        if not self.finished:
+            _append({'id': self.id, 'state': 'abort'})
+            self.finished = True
+
+
+@contextmanager
+def protocol_intent(op, path, tmp_path=None, content=None, attrs=None):
+    """记录一次协议写入意图
+
+    path 为协议文件路径；op 为 import 时为暂存目录路径。
+    content 为 create / update 写入的新内容，attrs 为 update 提交后的属性。
+    意图记录落盘后才执行块内的操作。块正常结束时意图标记为完成；
+    抛出异常时除非调用方已调用 abort()，意图保留给对账处理。
+    """
+    _ensure_reconciled()
+
+    intent = ProtocolIntent(op, path, tmp_path)
+    record = {
+        'id': intent.id,
+        'state': 'begin',
+        'op': op,
+        'path': str(intent.path),
+        'tmp': str(intent.tmp_path) if intent.tmp_path else None,
+        'boot_id': _boot_id()
+    }
+    if content is not None:
+        record['content'] = content
+        record['hash'] = _content_hash(content)
+    if attrs is not None:
+        record['attrs'] = {f: attrs.get(f) for f in PROTOCOL_ATTR_FIELDS}
+    if op in ('update', 'delete'):
+        record['old_hash'] = _file_hash(intent.path)
+
+    lock = _lock(shared=True)
+    lock.acquire()
+    try:
+        _append(record, durable=True)
+        yield intent
+        intent.finish()
+    finally:
+        lock.release()
+
+    _maybe_compact()
@@ -1,20 +1,50 @@
 """
 协议文件操作服务
 """
+import io
 import os
 import re
+import json
 import uuid
 import time
+import shutil
+import hashlib
+import tarfile
+import threading
 from pathlib import Path
-from datetime import datetime, timedelta
-from config import FRONTEND_DIR
+from datetime import datetime, timezone
+from config import FRONTEND_DIR, PROTOCOL_CATALOG_MAX_AGE, PROTOCOL_FSYNC, PROTOCOL_IMPORT_MAX_BYTES
 from db.database import db
-from db.models import Protocol
+from db.models import Protocol, OperationLog
+from utils.atomic_file import (
+    temp_path_for, write_temp_file, replace_file, publish_new_file, remove_file, fsync_directory
+)
+from utils.version_stamp import bump_stamp, read_stamp
+from services.preview_store import get_preview_store
+from services.protocol_journal import protocol_intent
 
-# 内存存储预览内容
-_preview_storage = {}
-_CLEANUP_INTERVAL = 300
-_last_cleanup = time.time()
+# 协议列表缓存（每个 worker 一份）
+# 文件侧用协议目录的 mtime 判断是否变化，数据库侧用共享版本戳判断是否变化，
+# 两者都没变时列表请求只需一次目录 stat 和一次版本戳 stat
+PROTOCOL_CATALOG_STAMP = 'protocol_catalog'
+_catalog_lock = threading.Lock()
+_catalog = {
+    'dir_mtime': None,   # 上次扫描时协议目录的 mtime_ns
+    'db_stamp': None,    # 上次加载数据库属性时的版本戳
+    'loaded_at': 0.0,    # 上次扫描的时间（monotonic）
+    'attrs': {},         # 文件名 -> 数据库属性
+    'entries': [],       # 组装好的列表，按修改时间倒序
+    'sorted': {},        # (排序字段, 是否倒序) -> 预排序列表，随缓存刷新清空
+    'etag': None,        # 列表内容的指纹，各 worker 对同一份数据计算结果一致
+}
+
+# 列表接口支持的排序字段
+PROTOCOL_SORT_FIELDS = ('updateTime', 'filename', 'size')
+
+# 批量导入导出：支持的格式、tar 包中的元数据文件名和随文件一起导出的属性
+PROTOCOL_TRANSFER_FORMATS = ('tar', 'ndjson')
+PROTOCOL_MANIFEST_NAME = 'manifest.json'
+PROTOCOL_EXPORT_FIELDS = ('description', 'app_type', 'app_name')
 
 
 def _get_protocol_dir():
@@ -62,43 +92,203 @@ def ensure_valid_protocol_entry(entry):
     }
 
 
-def get_protocol_list():
-    """获取协议文件列表"""
-    protocol_dir = _get_protocol_dir()
-    files = []
-    
-    # 获取所有数据库中的协议记录，建立文件名到协议对象的映射
+def _load_protocol_attrs():
+    """从数据库加载所有协议属性，建立文件名到属性的映射"""
     all_protocols = Protocol.query.all()
     print(f"数据库中查询到 {len(all_protocols)} 条协议记录")
-    db_protocols = {p.filename: p for p in all_protocols}
-    
-    for file_path in protocol_dir.glob('*.html'):
-        try:
-            stat = file_path.stat()
-            filename = file_path.name
-            # title = extract_title_from_html(file_path)
-            formatted_time = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-            
-            # 从数据库获取协议属性
-            protocol = db_protocols.get(filename)
-            
-            files.append({
-                'id': protocol.id if protocol else None,
-                'filename': filename,
-                'size': int(stat.st_size),
-                'updateTime': formatted_time,
-                # 'title': title,
-                'description': protocol.description if protocol else None,
-                'app_type': protocol.app_type if protocol else None,
-                'app_name': protocol.app_name if protocol else None
-            })
-        except Exception as e:
-            print(f"处理协议文件时出错 {file_path}: {str(e)}")
-            continue
-    
+    return {
+        p.filename: {
+            'id': p.id,
+            'description': p.description,
+            'app_type': p.app_type,
+            'app_name': p.app_name
+        }
+        for p in all_protocols
+    }
+
+
+def _make_etag(*parts):
+    """根据若干状态值生成强 ETag"""
+    return hashlib.sha1('\0'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+
+def _scan_protocol_files(protocol_dir, attrs):
+    """扫描协议目录，生成按修改时间倒序排列的列表
+
+    Returns:
+        (列表, 列表指纹)
+    """
+    files = []
+    fingerprint = []
+    with os.scandir(protocol_dir) as it:
+        for entry in it:
+            if not entry.name.endswith('.html'):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                filename = entry.name
+                formatted_time = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+                # 从数据库获取协议属性
+                protocol = attrs.get(filename) or {}
+
+                files.append({
+                    'id': protocol.get('id'),
+                    'filename': filename,
+                    'size': int(stat.st_size),
+                    'updateTime': formatted_time,
+                    'description': protocol.get('description'),
+                    'app_type': protocol.get('app_type'),
+                    'app_name': protocol.get('app_name')
+                })
+                fingerprint.append((filename, stat.st_size, stat.st_mtime_ns, sorted(protocol.items())))
+            except Exception as e:
+                print(f"处理协议文件时出错 {entry.path}: {str(e)}")
+                continue
+
     # 按修改时间排序
     files.sort(key=lambda x: x['updateTime'], reverse=True)
-    return files
+    fingerprint.sort()
+    return files, _make_etag(*fingerprint)
+
+
+def _refresh_catalog(protocol_dir):
+    """按需刷新协议列表缓存，调用方不能持有 _catalog_lock
+
+    数据库查询在锁外进行，慢查询不会阻塞其他线程读取缓存。
+    版本戳在查询前读取，查询期间发生的更新会在下次请求时被发现。
+    """
+    dir_mtime = protocol_dir.stat().st_mtime_ns
+    db_stamp = read_stamp(PROTOCOL_CATALOG_STAMP)
+    with _catalog_lock:
+        expired = time.monotonic() - _catalog['loaded_at'] > PROTOCOL_CATALOG_MAX_AGE
+        # 数据库侧变化：重新加载属性；写入方可能原地改写了文件内容，因此同时重新扫描目录
+        db_changed = expired or db_stamp != _catalog['db_stamp']
+        if not db_changed and dir_mtime == _catalog['dir_mtime']:
+            return
+
+    attrs = _load_protocol_attrs() if db_changed else None
+
+    with _catalog_lock:
+        if attrs is not None:
+            _catalog['attrs'] = attrs
+            _catalog['db_stamp'] = db_stamp
+        _catalog['entries'], _catalog['etag'] = _scan_protocol_files(protocol_dir, _catalog['attrs'])
+        _catalog['sorted'] = {('updateTime', True): _catalog['entries']}
+        _catalog['dir_mtime'] = dir_mtime
+        _catalog['loaded_at'] = time.monotonic()
+
+
+def invalidate_protocol_catalog():
+    """通知所有 worker 协议列表缓存已失效"""
+    bump_stamp(PROTOCOL_CATALOG_STAMP)
+
+
+def get_protocol_list():
+    """获取协议文件列表
+
+    返回的是缓存中的列表，调用方不要修改。
+    """
+    protocol_dir = _get_protocol_dir()
+    _refresh_catalog(protocol_dir)
+    with _catalog_lock:
+        return _catalog['entries']
+
+
+def get_protocol_list_etag(query_string=''):
+    """获取协议列表的 ETag，不同的查询参数对应不同的 ETag"""
+    protocol_dir = _get_protocol_dir()
+    _refresh_catalog(protocol_dir)
+    with _catalog_lock:
+        return _make_etag(_catalog['etag'], query_string)
+
+
+def get_protocol_etag(filename):
+    """根据文件 mtime、大小和数据库属性获取单个协议的 ETag，不读取文件内容
+
+    Returns:
+        (ETag, 文件修改时间（UTC）)；协议不存在时返回 (None, None)
+    """
+    safe_filename = os.path.basename(filename)
+    protocol_dir = _get_protocol_dir()
+    _refresh_catalog(protocol_dir)
+    with _catalog_lock:
+        attrs = _catalog['attrs'].get(safe_filename)
+    if attrs is None:
+        return None, None
+
+    try:
+        stat = (protocol_dir / safe_filename).stat()
+    except FileNotFoundError:
+        return None, None
+
+    etag = _make_etag(safe_filename, stat.st_size, stat.st_mtime_ns, sorted(attrs.items()))
+    return etag, datetime.fromtimestamp(stat.st_mtime, timezone.utc)
+
+
+def _get_sorted_entries(sort, descending):
+    """获取按指定字段预排序的列表，调用方需持有 _catalog_lock"""
+    key = (sort, descending)
+    if key not in _catalog['sorted']:
+        _catalog['sorted'][key] = sorted(_catalog['entries'], key=lambda x: x[sort], reverse=descending)
+    return _catalog['sorted'][key]
+
+
+def _query_matching_filenames(app_type=None, app_name=None, q=None):
+    """在数据库中按条件筛选协议，返回匹配的文件名集合"""
+    query = db.session.query(Protocol.filename)
+    if app_type:
+        query = query.filter(Protocol.app_type == app_type)
+    if app_name:
+        query = query.filter(Protocol.app_name == app_name)
+    if q:
+        query = query.filter(db.or_(
+            Protocol.filename.contains(q, autoescape=True),
+            Protocol.description.contains(q, autoescape=True)
+        ))
+    return {row.filename for row in query}
+
+
+def search_protocol_list(sort='updateTime', order='desc', app_type=None, app_name=None, q=None,
+                         page=None, limit=None):
+    """筛选、排序并分页获取协议文件列表
+
+    筛选条件下推到 protocols 表查询，排序使用缓存中的预排序列表。
+    page 为 None 时返回全部结果。
+
+    Returns:
+        (当前页列表, 筛选后的总数)
+    """
+    if sort not in PROTOCOL_SORT_FIELDS:
+        raise ValueError(f'不支持的排序字段: {sort}')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'不支持的排序方式: {order}')
+
+    matched = None
+    if app_type or app_name or q:
+        matched = _query_matching_filenames(app_type, app_name, q)
+
+    protocol_dir = _get_protocol_dir()
+    _refresh_catalog(protocol_dir)
+    with _catalog_lock:
+        entries = _get_sorted_entries(sort, order == 'desc')
+
+        if matched is not None:
+            # 没有数据库记录的文件只能按文件名匹配关键字，与 MySQL 的默认排序规则一致，不区分大小写
+            q_lower = q.lower() if q else None
+            entries = [
+                e for e in entries
+                if e['filename'] in matched
+                or (q and not app_type and not app_name and e['id'] is None and q_lower in e['filename'].lower())
+            ]
+
+    total = len(entries)
+    if page is not None:
+        start = (page - 1) * limit
+        entries = entries[start:start + limit]
+    return entries, total
 
 
 def get_protocol(filename):
@@ -134,17 +324,32 @@ def create_protocol(filename, content, description=None, app_type=None, app_name
     if file_path.exists():
         raise FileExistsError(f'协议文件已存在: {safe_filename}')
     
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
-    
-    protocol = Protocol(
-        filename=safe_filename,
-        description=description,
-        app_type=app_type,
-        app_name=app_name
-    )
-    db.session.add(protocol)
-    db.session.commit()
+    # 内容随意图日志落盘，文件不再逐次 fsync；先发布文件再提交数据库，
+    # 数据库失败时删除文件，中途崩溃由意图日志对账删除
+    tmp_path = temp_path_for(file_path)
+    with protocol_intent('create', file_path, tmp_path, content=content) as intent:
+        write_temp_file(tmp_path, content, durable=False)
+        try:
+            publish_new_file(tmp_path, file_path, durable=False)
+        except FileExistsError:
+            intent.abort()
+            raise FileExistsError(f'协议文件已存在: {safe_filename}')
+
+        protocol = Protocol(
+            filename=safe_filename,
+            description=description,
+            app_type=app_type,
+            app_name=app_name
+        )
+        try:
+            db.session.add(protocol)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            remove_file(file_path, durable=False)
+            intent.abort()
+            raise
+    invalidate_protocol_catalog()
     
     return safe_filename
 
@@ -156,21 +361,37 @@ def update_protocol(filename, content=None, description=None, app_type=None, app
     if not protocol:
         raise FileNotFoundError(f'协议文件不存在: {safe_filename}')
     
-    if content is not None:
-        file_path = _get_protocol_dir() / safe_filename
-        if not file_path.exists():
-            raise FileNotFoundError(f'协议文件不存在: {safe_filename}')
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write(content)
-    
     if description is not None:
         protocol.description = description
     if app_type is not None:
         protocol.app_type = app_type
     if app_name is not None:
         protocol.app_name = app_name
-    
-    db.session.commit()
+
+    if content is None:
+        db.session.commit()
+        invalidate_protocol_catalog()
+        return
+
+    file_path = _get_protocol_dir() / safe_filename
+    if not file_path.exists():
+        raise FileNotFoundError(f'协议文件不存在: {safe_filename}')
+
+    # 新内容和提交后的属性随意图日志落盘后才提交数据库；
+    # 新内容先完整写入临时文件，数据库提交后再原子替换，读取方不会看到写了一半的文件
+    tmp_path = temp_path_for(file_path)
+    attrs = {'description': protocol.description, 'app_type': protocol.app_type, 'app_name': protocol.app_name}
+    with protocol_intent('update', file_path, tmp_path, content=content, attrs=attrs) as intent:
+        write_temp_file(tmp_path, content, durable=False)
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            tmp_path.unlink(missing_ok=True)
+            intent.abort()
+            raise
+        replace_file(tmp_path, file_path, durable=False)
+    invalidate_protocol_catalog()
 
 
 def delete_protocol(filename):
@@ -180,30 +401,243 @@ def delete_protocol(filename):
     if not protocol:
         raise FileNotFoundError(f'协议文件不存在: {safe_filename}')
     
+    # 先删除数据库记录再删除文件，中途崩溃时由意图日志对账删除残留的文件
     file_path = _get_protocol_dir() / safe_filename
-    if file_path.exists():
-        file_path.unlink()
-    
-    db.session.delete(protocol)
-    db.session.commit()
+    with protocol_intent('delete', file_path) as intent:
+        try:
+            db.session.delete(protocol)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            intent.abort()
+            raise
+        remove_file(file_path, durable=False)
+    invalidate_protocol_catalog()
 
 
-def _cleanup_expired_previews():
-    """清理过期的预览内容"""
-    global _last_cleanup
-    current_time = time.time()
-    
-    if current_time - _last_cleanup < _CLEANUP_INTERVAL:
-        return
-    
-    _last_cleanup = current_time
-    now = datetime.now()
-    expired_ids = [
-        preview_id for preview_id, data in _preview_storage.items()
-        if data['expires_at'] < now
+class _StreamBuffer:
+    """tarfile 的输出目标：把写入的数据攒起来，由生成器分块取走"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _iter_export_tar(protocol_dir, protocols):
+    """逐个文件生成 tar.gz 数据块，内存中最多只有一个文件的内容"""
+    buffer = _StreamBuffer()
+    with tarfile.open(fileobj=buffer, mode='w|gz') as tar:
+        # 元数据放在最前面，导入方读到文件之前就能拿到属性
+        manifest = json.dumps({'protocols': protocols}, ensure_ascii=False).encode('utf-8')
+        info = tarfile.TarInfo(PROTOCOL_MANIFEST_NAME)
+        info.size = len(manifest)
+        info.mtime = int(time.time())
+        tar.addfile(info, io.BytesIO(manifest))
+        yield buffer.drain()
+
+        for protocol in protocols:
+            try:
+                f = open(protocol_dir / protocol['filename'], 'rb')
+            except FileNotFoundError:
+                continue  # 导出过程中被删除
+            with f:
+                stat = os.fstat(f.fileno())
+                info = tarfile.TarInfo(protocol['filename'])
+                info.size = stat.st_size
+                info.mtime = int(stat.st_mtime)
+                info.mode = 0o644
+                tar.addfile(info, f)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def _iter_export_ndjson(protocol_dir, protocols):
+    """逐行生成 NDJSON，每行一个协议（属性和内容）"""
+    for protocol in protocols:
+        try:
+            with open(protocol_dir / protocol['filename'], 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            continue
+        yield (json.dumps({**protocol, 'content': content}, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+def export_protocols(fmt='tar'):
+    """批量导出所有协议，返回数据块生成器
+
+    协议列表在调用时确定，文件内容在迭代时逐个读取，生成器不需要应用上下文。
+    """
+    if fmt not in PROTOCOL_TRANSFER_FORMATS:
+        raise ValueError(f'不支持的导出格式: {fmt}')
+
+    # 没有数据库记录的文件只导出文件名，重新导入时不会用空值覆盖已有的属性
+    protocols = [
+        {
+            'filename': entry['filename'],
+            **({field: entry[field] for field in PROTOCOL_EXPORT_FIELDS} if entry['id'] is not None else {})
+        }
+        for entry in get_protocol_list()
     ]
-    for preview_id in expired_ids:
-        del _preview_storage[preview_id]
+    protocol_dir = _get_protocol_dir()
+    if fmt == 'ndjson':
+        return _iter_export_ndjson(protocol_dir, protocols)
+    return _iter_export_tar(protocol_dir, protocols)
+
+
+class ImportTooLargeError(ValueError):
+    """导入文件超过 PROTOCOL_IMPORT_MAX_BYTES"""
+
+    def __init__(self):
+        super().__init__(f'导入文件超过大小限制（{PROTOCOL_IMPORT_MAX_BYTES} 字节）')
+
+
+class _LimitedReader:
+    """限制读取总量的输入流包装，超过上限时抛出 ImportTooLargeError"""
+
+    def __init__(self, stream, max_bytes):
+        self._stream = stream
+        self._remaining = max_bytes
+
+    def _count(self, data):
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ImportTooLargeError()
+        return data
+
+    def read(self, size=-1):
+        return self._count(self._stream.read(size))
+
+    def readline(self, size=-1):
+        return self._count(self._stream.readline(size))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+
+def _import_filename(name):
+    """校验导入条目的文件名，不是协议文件时返回 None"""
+    filename = os.path.basename(name or '')
+    if not filename.endswith('.html') or filename.startswith('.'):
+        return None
+    return filename
+
+
+def _iter_import_tar(stream):
+    """顺序读取 tar 包（支持 gz / bz2 / xz 压缩），逐个返回 (文件名, 内容, 属性)"""
+    try:
+        with tarfile.open(fileobj=stream, mode='r|*') as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                data = tar.extractfile(member).read()
+                if os.path.basename(member.name) == PROTOCOL_MANIFEST_NAME:
+                    for protocol in json.loads(data.decode('utf-8')).get('protocols', []):
+                        yield protocol.get('filename'), None, protocol
+                    continue
+                yield member.name, data.decode('utf-8'), None
+    except tarfile.TarError as e:
+        raise ValueError(f'导入文件格式错误: {str(e)}')
+
+
+def _iter_import_ndjson(stream):
+    """逐行读取 NDJSON，每行一个协议"""
+    for line in stream:
+        if not line.strip():
+            continue
+        protocol = json.loads(line)
+        content = protocol.get('content')
+        if content is None:
+            raise ValueError(f"协议缺少内容: {protocol.get('filename')}")
+        yield protocol.get('filename'), content, protocol
+
+
+def import_protocols(stream, user_id, fmt='tar', overwrite=False):
+    """批量导入协议
+
+    文件边读边写入协议目录下的暂存目录，读完后在一个事务中批量写入协议记录和操作日志，
+    提交后再把暂存的文件移入协议目录。已存在的协议在 overwrite 为 False 时跳过。
+
+    Returns:
+        {'created': [...], 'updated': [...], 'skipped': [...]}
+    """
+    if fmt not in PROTOCOL_TRANSFER_FORMATS:
+        raise ValueError(f'不支持的导入格式: {fmt}')
+
+    stream = _LimitedReader(stream, PROTOCOL_IMPORT_MAX_BYTES)
+    protocol_dir = _get_protocol_dir()
+    existing = dict(db.session.query(Protocol.filename, Protocol.id))
+    staging_dir = protocol_dir / f'.import_{uuid.uuid4().hex}'
+    staged = []
+    skipped = []
+    seen = set()
+    attrs = {}
+
+    with protocol_intent('import', staging_dir) as intent:
+        staging_dir.mkdir()
+        try:
+            entries = _iter_import_ndjson(stream) if fmt == 'ndjson' else _iter_import_tar(stream)
+            for name, content, protocol in entries:
+                filename = _import_filename(name)
+                if filename is None:
+                    continue
+                if protocol is not None:
+                    attrs[filename] = {f: protocol[f] for f in PROTOCOL_EXPORT_FIELDS if f in protocol}
+                if content is None:
+                    continue
+                if filename in seen:
+                    raise ValueError(f'导入文件中存在重复的协议: {filename}')
+                seen.add(filename)
+                if not overwrite and (filename in existing or (protocol_dir / filename).exists()):
+                    skipped.append(filename)
+                    continue
+                write_temp_file(staging_dir / filename, content, PROTOCOL_FSYNC)
+                staged.append(filename)
+
+            created = [f for f in staged if f not in existing]
+            updated = [f for f in staged if f in existing]
+            db.session.bulk_save_objects([
+                Protocol(filename=filename, **attrs.get(filename, {})) for filename in created
+            ])
+            db.session.bulk_update_mappings(Protocol, [
+                {'id': existing[filename], **attrs[filename]}
+                for filename in updated if attrs.get(filename)
+            ])
+            db.session.bulk_save_objects([
+                OperationLog(
+                    user_id=user_id,
+                    action='import_protocol',
+                    resource_type='protocol',
+                    resource_name=filename,
+                    details=f"批量导入了协议文件: {filename}（{'覆盖' if filename in existing else '新建'}）"
+                )
+                for filename in staged
+            ])
+            if PROTOCOL_FSYNC:
+                fsync_directory(staging_dir)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            intent.abort()
+            raise
+
+        intent.commit()
+        for filename in staged:
+            replace_file(staging_dir / filename, protocol_dir / filename, durable=False)
+        if PROTOCOL_FSYNC:
+            fsync_directory(protocol_dir)
+        staging_dir.rmdir()
+    invalidate_protocol_catalog()
+
+    return {'created': created, 'updated': updated, 'skipped': skipped}
 
 
 def create_preview(html_content):
@@ -211,27 +645,16 @@ def create_preview(html_content):
     if not html_content:
         raise ValueError('HTML 内容不能为空')
     
-    _cleanup_expired_previews()
     preview_id = str(uuid.uuid4())
-    expires_at = datetime.now() + timedelta(hours=1)
-    
-    _preview_storage[preview_id] = {
-        'content': html_content,
-        'expires_at': expires_at
-    }
+    get_preview_store().put(preview_id, html_content)
     
     return preview_id
 
 
 def get_preview_content(preview_id):
     """获取预览内容"""
-    if preview_id not in _preview_storage:
+    content = get_preview_store().get(preview_id)
+    if content is None:
         raise ValueError('预览不存在或已过期')
     
-    data = _preview_storage[preview_id]
-    
-    if data['expires_at'] < datetime.now():
-        del _preview_storage[preview_id]
-        raise ValueError('预览已过期')
-    
-    return data['content']
+    return content
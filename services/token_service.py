@@ -0,0 +1,166 @@
+"""
+API 令牌服务
+
+脚本类客户端（如 CI 调用部署接口）不方便维护 Cookie 会话，可以在登录时申请签名令牌，
+之后通过 Authorization: Bearer <token> 访问接口。令牌中带有用户 ID、用户名和角色，
+用 SECRET_KEY 签名并设置有效期，校验时不查询数据库。
+
+令牌无法修改，撤销通过 RUNTIME_DIR 下的小型黑名单实现：
+登出时加入单个令牌，修改用户角色或状态时加入整个用户（此前签发的令牌全部失效）。
+各 worker 缓存黑名单，文件变化时（一次 stat）重新读取。
+"""
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+from flask import current_app
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from config import RUNTIME_DIR, TOKEN_MAX_AGE
+from utils.file_lock import FileLock
+
+TOKEN_SALT = 'h5-protocol-api-token'
+
+# 黑名单缓存（每个 worker 一份）
+_denylist_lock = threading.Lock()
+_denylist = {
+    'file_stat': None,  # 上次读取时黑名单文件的 (inode, mtime_ns)
+    'tokens': {},       # jti -> 令牌过期时间
+    'users': {},        # user_id -> 撤销时间，此前签发的令牌全部无效
+}
+
+
+class TokenUser:
+    """令牌认证的用户，提供 Flask-Login 需要的属性和路由中用到的字段"""
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, claims, issued_at):
+        self.id = claims['uid']
+        self.username = claims['username']
+        self.role = claims['role']
+        self.jti = claims['jti']
+        self.issued_at = issued_at
+
+    def get_id(self):
+        return str(self.id)
+
+    def to_dict(self):
+        """转换为字典格式"""
+        return {
+            'id': self.id,
+            'username': self.username,
+            'role': self.role,
+            'is_active': True,
+            'updated_at': None
+        }
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=TOKEN_SALT)
+
+
+def _denylist_path():
+    """获取黑名单文件路径"""
+    runtime_dir = Path(RUNTIME_DIR)
+    runtime_dir.mkdir(parents=True, exist_ok=True)
+    return runtime_dir / 'token_denylist.json'
+
+
+def _load_denylist():
+    """按需重新读取黑名单，返回 (tokens, users)"""
+    path = _denylist_path()
+    try:
+        stat = path.stat()
+        file_stat = (stat.st_ino, stat.st_mtime_ns)
+    except FileNotFoundError:
+        file_stat = None
+
+    with _denylist_lock:
+        if file_stat != _denylist['file_stat']:
+            data = {}
+            if file_stat is not None:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            _denylist['tokens'] = data.get('tokens', {})
+            _denylist['users'] = {int(k): v for k, v in data.get('users', {}).items()}
+            _denylist['file_stat'] = file_stat
+        return _denylist['tokens'], _denylist['users']
+
+
+def _update_denylist(tokens=None, users=None):
+    """向黑名单追加条目，顺便清理已过期的条目"""
+    path = _denylist_path()
+    with FileLock(path.with_name(f'{path.name}.lock')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+
+        now = time.time()
+        # 令牌过期后不需要再拉黑；撤销时间早于最长有效期的用户条目也不再起作用
+        data['tokens'] = {k: v for k, v in data.get('tokens', {}).items() if v > now}
+        data['users'] = {k: v for k, v in data.get('users', {}).items() if v > now - TOKEN_MAX_AGE}
+        data['tokens'].update(tokens or {})
+        data['users'].update({str(k): v for k, v in (users or {}).items()})
+
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+
+def issue_token(user):
+    """为用户签发令牌
+
+    Returns:
+        (令牌, 有效期秒数)
+    """
+    claims = {
+        'uid': user.id,
+        'username': user.username,
+        'role': user.role,
+        'jti': uuid.uuid4().hex
+    }
+    return _serializer().dumps(claims), TOKEN_MAX_AGE
+
+
+def verify_token(token):
+    """校验令牌，无效、过期或已撤销时返回 None，不查询数据库"""
+    try:
+        claims, signed_at = _serializer().loads(token, max_age=TOKEN_MAX_AGE, return_timestamp=True)
+    except (BadSignature, SignatureExpired):
+        return None
+
+    issued_at = signed_at.timestamp()
+    tokens, users = _load_denylist()
+    if claims.get('jti') in tokens:
+        return None
+    # 签名时间精确到秒，同一秒内签发的令牌按已撤销处理
+    revoked_at = users.get(claims.get('uid'))
+    if revoked_at is not None and issued_at <= revoked_at:
+        return None
+    return TokenUser(claims, issued_at)
+
+
+def load_token_user(request):
+    """从 Authorization: Bearer 请求头中加载令牌用户（Flask-Login 的 request_loader）"""
+    auth_header = request.headers.get('Authorization', '')
+    scheme, _, token = auth_header.partition(' ')
+    if scheme.lower() != 'bearer' or not token.strip():
+        return None
+    return verify_token(token.strip())
+
+
+def revoke_token(token_user):
+    """撤销单个令牌（登出时调用）"""
+    _update_denylist(tokens={token_user.jti: token_user.issued_at + TOKEN_MAX_AGE})
+
+
+def revoke_user_tokens(user_id):
+    """撤销用户此前签发的所有令牌（修改角色、禁用用户时调用）"""
+    _update_denylist(users={user_id: time.time()})
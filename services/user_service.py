@@ -2,8 +2,10 @@
 用户管理服务
 """
 from db.database import db
-from db.models import User, OperationLog
-from werkzeug.security import generate_password_hash
+from db.models import User
+from services.log_service import record_operation
+from services.auth_service import invalidate_user_cache
+from services.token_service import revoke_user_tokens
 from flask_login import current_user
 
 
@@ -28,6 +30,9 @@ def update_user_role(user_id, new_role):
     user = User.query.get_or_404(user_id)
     user.role = new_role
     db.session.commit()
+    invalidate_user_cache(user_id)
+    # 令牌中带有角色，旧令牌全部撤销
+    revoke_user_tokens(user_id)
 
 
 def toggle_user_status(user_id):
@@ -35,6 +40,9 @@ def toggle_user_status(user_id):
     user = User.query.get_or_404(user_id)
     user.is_active = not user.is_active
     db.session.commit()
+    # 禁用立即生效：所有 worker 下一个请求都会重新加载该用户
+    invalidate_user_cache(user_id)
+    revoke_user_tokens(user_id)
     return user.is_active
 
 
@@ -57,12 +65,4 @@ def create_user(username, password, role='viewer'):
 
 def log_user_action(action, resource_type, resource_name, details):
     """记录用户操作日志"""
-    log = OperationLog(
-        user_id=current_user.id,
-        action=action,
-        resource_type=resource_type,
-        resource_name=resource_name,
-        details=details
-    )
-    db.session.add(log)
-    db.session.commit()
+    record_operation(current_user.id, action, resource_type, resource_name, details)
@@ -0,0 +1,76 @@
+"""
+测试公共配置
+
+config.py 在导入时读取环境变量，因此在导入应用之前把前端目录、运行时目录等指向临时目录，
+数据库换成临时的 SQLite 文件。
+"""
+import os
+import sys
+import shutil
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_TMP = Path(tempfile.mkdtemp(prefix='h5_protocol_test_'))
+os.environ['FRONTEND_DIR'] = str(_TMP / 'frontend')
+os.environ['RUNTIME_DIR'] = str(_TMP / 'runtime')
+os.environ['PROTOCOL_JOURNAL_PATH'] = str(_TMP / 'protocol_journal.ndjson')
+os.environ['PREVIEW_STORE_PATH'] = str(_TMP / 'previews.sqlite3')
+os.environ['SECRET_KEY'] = 'test'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ['GIT_FETCH_INTERVAL'] = '0'
+# 测试不需要落盘，也避免慢速文件系统上的 fsync
+os.environ['PROTOCOL_FSYNC'] = '0'
+
+import config  # noqa: E402
+
+config.Config.SQLALCHEMY_DATABASE_URI = f"sqlite:///{_TMP / 'test.sqlite3'}"
+# MySQL 专用的连接参数（connect_timeout 等）不适用于 SQLite
+config.Config.SQLALCHEMY_ENGINE_OPTIONS = {}
+
+from app import app as flask_app  # noqa: E402
+from db.database import db  # noqa: E402
+from db.models import User  # noqa: E402
+
+
+@pytest.fixture
+def app():
+    """每个用例使用空的数据库和协议目录"""
+    protocol_dir = Path(config.FRONTEND_DIR) / 'public' / 'static' / 'notice'
+    shutil.rmtree(protocol_dir, ignore_errors=True)
+    protocol_dir.mkdir(parents=True)
+    # 清空而不是删除日志：进程内缓存的日志文件描述符仍指向同一个文件
+    open(config.PROTOCOL_JOURNAL_PATH, 'w').close()
+
+    with flask_app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(username='admin', role='admin')
+        user.set_password('pw')
+        db.session.add(user)
+        db.session.commit()
+        yield flask_app
+        db.session.remove()
+
+
+@pytest.fixture(autouse=True)
+def no_background_reconcile(monkeypatch):
+    """不启动协议写入日志的后台对账线程，需要对账的用例显式调用 reconcile_journal"""
+    from services import protocol_journal
+    monkeypatch.setitem(protocol_journal._journal, 'reconciled', os.getpid())
+
+
+@pytest.fixture
+def protocol_dir(app):
+    """协议文件目录"""
+    return Path(config.FRONTEND_DIR) / 'public' / 'static' / 'notice'
+
+
+@pytest.fixture
+def admin_id(app):
+    """测试管理员的用户 ID"""
+    return User.query.filter_by(username='admin').one().id
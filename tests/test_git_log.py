@@ -0,0 +1,101 @@
+"""
+Git 提交历史的游标翻页
+"""
+import os
+import subprocess
+
+import pytest
+
+from services import git_service
+from services.git_service import iter_git_log, parse_log_cursor, make_log_cursor
+
+
+def _git(repo, *args, when=None):
+    env = dict(os.environ, GIT_AUTHOR_NAME='t', GIT_AUTHOR_EMAIL='t@example.com',
+               GIT_COMMITTER_NAME='t', GIT_COMMITTER_EMAIL='t@example.com')
+    if when is not None:
+        env['GIT_AUTHOR_DATE'] = env['GIT_COMMITTER_DATE'] = f'{when} +0800'
+    return subprocess.run(['git', *args], cwd=repo, env=env, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def _commit(repo, filename, when):
+    (repo / 'd').mkdir(exist_ok=True)
+    (repo / 'd' / filename).write_text(str(when), encoding='utf-8')
+    _git(repo, 'add', '-A')
+    _git(repo, 'commit', '-q', '-m', filename, when=when)
+    return _git(repo, 'rev-parse', 'HEAD')
+
+
+@pytest.fixture(scope='module')
+def merge_repo(tmp_path_factory):
+    """历史为 M（合并 B）→ A → base，B → base，提交时间 base < B < A < M"""
+    repo = tmp_path_factory.mktemp('frontend')
+    _git(repo, 'init', '-q', '-b', 'master')
+    shas = {'base': _commit(repo, 'base', 1_700_000_000)}
+    _git(repo, 'checkout', '-q', '-b', 'side')
+    shas['B'] = _commit(repo, 'B', 1_700_000_100)
+    _git(repo, 'checkout', '-q', 'master')
+    shas['A'] = _commit(repo, 'A', 1_700_000_200)
+    _git(repo, 'merge', '-q', '--no-ff', '-m', 'M', 'side', when=1_700_000_300)
+    shas['M'] = _git(repo, 'rev-parse', 'HEAD')
+    return repo, shas
+
+
+@pytest.fixture
+def repo(merge_repo, monkeypatch):
+    path, shas = merge_repo
+    monkeypatch.setattr(git_service, 'FRONTEND_DIR', str(path))
+    return path, shas
+
+
+def _pages(limit, path=None):
+    """按路由的方式逐页读取：游标带上第一页的起点"""
+    pages = []
+    tip, after = parse_log_cursor()
+    while True:
+        page = list(iter_git_log(limit, after=after, path=path, tip=tip))
+        pages.append([c['full_hash'] for c in page])
+        if len(page) < limit:
+            return pages
+        tip, after = parse_log_cursor(make_log_cursor(tip, page[-1]['full_hash']))
+
+
+# path=None 走 cat-file 遍历，path='d' 走 git log
+@pytest.mark.parametrize('path', [None, 'd'])
+def test_pages_include_commits_only_reachable_from_merged_parent(repo, path):
+    _, shas = repo
+    pages = _pages(2, path)
+    assert pages[0] == [shas['M'], shas['A']]
+    assert pages[1] == [shas['B'], shas['base']]
+
+
+@pytest.mark.parametrize('path', [None, 'd'])
+@pytest.mark.parametrize('limit', [1, 2, 3])
+def test_pages_match_git_log(repo, limit, path):
+    repo_path, _ = repo
+    expected = _git(repo_path, 'log', '--format=%H', '--', path or '.').split()
+    assert sum(_pages(limit, path), []) == expected
+
+
+@pytest.mark.parametrize('path', [None, 'd'])
+def test_cursor_keeps_walking_from_first_page_tip(repo, path):
+    repo_path, shas = repo
+    first = list(iter_git_log(2, path=path))
+    cursor = make_log_cursor(shas['M'], first[-1]['full_hash'])
+
+    # 第一页之后 HEAD 移动，翻页仍从原来的起点遍历
+    _git(repo_path, 'checkout', '-q', '--detach', shas['base'])
+    try:
+        tip, after = parse_log_cursor(cursor)
+        page = [c['full_hash'] for c in iter_git_log(2, after=after, path=path, tip=tip)]
+    finally:
+        _git(repo_path, 'checkout', '-q', 'master')
+    assert page == [shas['B'], shas['base']]
+
+
+def test_invalid_cursor_rejected(repo):
+    with pytest.raises(ValueError):
+        parse_log_cursor('not-a-hash')
+    with pytest.raises(ValueError):
+        parse_log_cursor(make_log_cursor('0' * 40, '1' * 40))
@@ -0,0 +1,73 @@
+"""
+操作日志的游标分页
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from db.database import db
+from db.models import OperationLog
+from services.log_service import _encode_log_cursor, _decode_log_cursor, get_operation_logs
+
+
+class _Row:
+    def __init__(self, created_at, log_id):
+        self.created_at = created_at
+        self.id = log_id
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, 45, 123456)
+    cursor = _encode_log_cursor(_Row(created_at, 42))
+    assert '=' not in cursor
+    assert _decode_log_cursor(cursor) == (created_at, 42)
+
+
+def test_cursor_without_created_at():
+    assert _decode_log_cursor(_encode_log_cursor(_Row(None, 7))) == (None, 7)
+
+
+@pytest.mark.parametrize('cursor', ['not-base64!', 'YWJj', 'fHg'])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        _decode_log_cursor(cursor)
+
+
+def _add_logs(user_id, created_ats):
+    for i, created_at in enumerate(created_ats):
+        log = OperationLog(user_id=user_id, action='a', resource_type='r', resource_name=str(i), details='')
+        db.session.add(log)
+        db.session.flush()
+        # 显式赋值 None 才能绕过 created_at 的默认值
+        log.created_at = created_at
+    db.session.commit()
+
+
+def _page_all(limit, **filters):
+    names = []
+    cursor = ''
+    while cursor is not None:
+        page = get_operation_logs(limit=limit, cursor=cursor, include_total=False, **filters)
+        assert len(page['items']) <= limit
+        names.extend(row.resource_name for row in page['items'])
+        cursor = page['next_cursor']
+    return names
+
+
+def test_cursor_pages_match_offset_order(admin_id):
+    start = datetime(2026, 1, 1)
+    # 每两条同一时间，检验 (created_at, id) 的并列处理
+    _add_logs(admin_id, [start + timedelta(seconds=i // 2) for i in range(11)])
+
+    expected = [row.resource_name for row in get_operation_logs(limit=100)['items']]
+    assert expected == [str(i) for i in range(10, -1, -1)]
+    for limit in (1, 3, 4, 11, 20):
+        assert _page_all(limit) == expected
+
+
+def test_cursor_reaches_rows_without_created_at(admin_id):
+    start = datetime(2026, 1, 1)
+    _add_logs(admin_id, [start, None, start + timedelta(seconds=1), None])
+
+    assert _page_all(1) == ['2', '0', '3', '1']
+    assert _page_all(3) == ['2', '0', '3', '1']
@@ -0,0 +1,111 @@
+"""
+预览存储的读写、去重、大小上限淘汰和过期清理
+"""
+import sqlite3
+
+import pytest
+
+from services import preview_store
+from services.preview_store import MemoryPreviewStore, SQLitePreviewStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.time"""
+    now = [1_000_000.0]
+    monkeypatch.setattr(preview_store.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def make_store(request, tmp_path):
+    def make(max_bytes=100, ttl=60):
+        if request.param == 'memory':
+            return MemoryPreviewStore(max_bytes=max_bytes, ttl=ttl)
+        return SQLitePreviewStore(tmp_path / 'previews.sqlite3', max_bytes=max_bytes, ttl=ttl)
+    return make
+
+
+def _total_bytes(store):
+    if isinstance(store, MemoryPreviewStore):
+        return store._total_bytes
+    return store._connect().execute('SELECT total_bytes FROM preview_meta WHERE id = 1').fetchone()[0]
+
+
+def test_put_get(make_store, clock):
+    store = make_store()
+    store.put('a', '内容')
+    assert store.get('a') == '内容'
+    assert store.get('missing') is None
+
+
+def test_evicts_least_recently_used(make_store, clock):
+    store = make_store(max_bytes=100)
+    store.put('a', 'a' * 40)
+    clock[0] += 1
+    store.put('b', 'b' * 40)
+    clock[0] += 1
+    store.put('c', 'c' * 40)
+
+    assert store.get('a') is None
+    assert store.get('b') == 'b' * 40
+    assert store.get('c') == 'c' * 40
+    assert _total_bytes(store) == 80
+
+
+def test_too_large_rejected(make_store, clock):
+    store = make_store(max_bytes=10)
+    with pytest.raises(ValueError):
+        store.put('a', 'x' * 11)
+
+
+def test_sqlite_counter_resynced_when_nothing_left_to_evict(tmp_path, clock):
+    store = SQLitePreviewStore(tmp_path / 'previews.sqlite3', max_bytes=100)
+    store.put('a', 'a' * 10)
+    store._connect().execute('UPDATE preview_meta SET total_bytes = 1000 WHERE id = 1')
+
+    store.put('b', 'b' * 10)
+    assert store.get('b') == 'b' * 10
+    assert _total_bytes(store) == 10
+
+
+def test_same_content_stored_once(make_store, clock):
+    store = make_store(max_bytes=100)
+    for i in range(10):
+        store.put(f'p{i}', 'x' * 40)
+    assert _total_bytes(store) == 40
+    assert all(store.get(f'p{i}') == 'x' * 40 for i in range(10))
+
+
+def test_eviction_removes_every_preview_of_the_content(make_store, clock):
+    store = make_store(max_bytes=100)
+    store.put('a1', 'a' * 60)
+    store.put('a2', 'a' * 60)
+    clock[0] += 1
+    store.put('b', 'b' * 60)
+
+    assert store.get('a1') is None and store.get('a2') is None
+    assert _total_bytes(store) == 60
+
+
+def test_expired_hidden_then_reaped(make_store, clock):
+    store = make_store(ttl=60)
+    store.put('a', 'a' * 10)
+    clock[0] += 30
+    store.put('b', 'b' * 10)
+
+    clock[0] += 31
+    assert store.get('a') is None
+    assert store.get('b') == 'b' * 10
+    assert store.reap_expired() == pytest.approx(clock[0] + 29)
+    assert _total_bytes(store) == 10
+
+
+def test_sqlite_refuses_unknown_schema_version(tmp_path):
+    path = tmp_path / 'previews.sqlite3'
+    conn = sqlite3.connect(str(path))
+    conn.execute('PRAGMA user_version = 99')
+    conn.close()
+
+    with pytest.raises(RuntimeError):
+        SQLitePreviewStore(path).get('a')
@@ -0,0 +1,43 @@
+"""
+协议读取接口的缓存校验
+"""
+import pytest
+
+from db.database import db
+from db.models import Protocol
+from services import protocol_service
+
+
+@pytest.fixture
+def client(app, protocol_dir):
+    """已登录的测试客户端，带一个有数据库记录的协议"""
+    db.session.add(Protocol(filename='a.html', description='旧描述', app_type='H5'))
+    db.session.commit()
+    (protocol_dir / 'a.html').write_text('<title>a</title>', encoding='utf-8')
+    protocol_service.invalidate_protocol_catalog()
+
+    client = app.test_client()
+    response = client.post('/api/auth/login', json={'username': 'admin', 'password': 'pw'})
+    assert response.status_code == 200
+    return client
+
+
+def test_if_none_match_returns_304(client):
+    first = client.get('/api/protocols/a.html')
+    assert first.status_code == 200
+    again = client.get('/api/protocols/a.html', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_db_only_change_is_not_masked_by_if_modified_since(client):
+    first = client.get('/api/protocols/a.html')
+    Protocol.query.filter_by(filename='a.html').update({'description': '新描述'})
+    db.session.commit()
+    protocol_service.invalidate_protocol_catalog()
+
+    # 文件未变，Last-Modified 不变，但属性已经变化，不能返回 304
+    by_date = client.get('/api/protocols/a.html', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert by_date.status_code == 200
+    by_etag = client.get('/api/protocols/a.html', headers={'If-None-Match': first.headers['ETag']})
+    assert by_etag.status_code == 200
+    assert by_etag.headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,198 @@
+"""
+协议写入意图日志的对账
+"""
+import os
+import json
+import hashlib
+
+import pytest
+
+import config
+from db.database import db
+from db.models import Protocol
+from services import protocol_journal
+from services.protocol_service import create_protocol, update_protocol, delete_protocol
+
+
+def _hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _write_intents(*records, torn_tail=False):
+    boot_id = protocol_journal._boot_id()
+    with open(config.PROTOCOL_JOURNAL_PATH, 'a', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps({'state': 'begin', 'tmp': None, 'boot_id': boot_id, **record}) + '\n')
+        if torn_tail:
+            f.write('{"id": "torn", "sta')
+
+
+def _journal_records():
+    with open(config.PROTOCOL_JOURNAL_PATH, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def _add_row(filename, description='old'):
+    db.session.add(Protocol(filename=filename, description=description))
+    db.session.commit()
+
+
+def test_writes_record_one_intent_each(protocol_dir):
+    create_protocol('a', '<title>a</title>')
+    update_protocol('a.html', content='<title>b</title>', description='d')
+    delete_protocol('a.html')
+
+    records = _journal_records()
+    assert [(r['state'], r.get('op')) for r in records] == [
+        ('begin', 'create'), ('done', None),
+        ('begin', 'update'), ('done', None),
+        ('begin', 'delete'), ('done', None),
+    ]
+    update = records[2]
+    assert update['content'] == '<title>b</title>'
+    assert update['old_hash'] == _hash('<title>a</title>')
+    assert update['attrs'] == {'description': 'd', 'app_type': None, 'app_name': None}
+    assert not (protocol_dir / 'a.html').exists()
+
+
+def test_failed_commit_aborts_intent(protocol_dir, monkeypatch):
+    create_protocol('a', 'old')
+
+    def fail():
+        raise RuntimeError('db down')
+
+    monkeypatch.setattr(db.session, 'commit', fail)
+    with pytest.raises(RuntimeError):
+        update_protocol('a.html', content='new')
+    assert (protocol_dir / 'a.html').read_text() == 'old'
+    assert _journal_records()[-1]['state'] == 'abort'
+    assert [p.name for p in protocol_dir.iterdir()] == ['a.html']
+
+
+def test_update_rolls_forward_when_db_committed(protocol_dir):
+    _add_row('a.html')
+    (protocol_dir / 'a.html').write_text('OLD')
+    _write_intents({
+        'id': '1', 'op': 'update', 'path': str(protocol_dir / 'a.html'),
+        'content': 'NEW', 'hash': _hash('NEW'), 'old_hash': _hash('OLD'),
+        'attrs': {'description': 'old', 'app_type': None, 'app_name': None},
+    }, torn_tail=True)
+
+    assert protocol_journal.reconcile_journal() == 1
+    assert (protocol_dir / 'a.html').read_text() == 'NEW'
+    assert os.path.getsize(config.PROTOCOL_JOURNAL_PATH) == 0
+
+
+def test_update_kept_when_db_not_committed(protocol_dir):
+    _add_row('a.html')
+    (protocol_dir / 'a.html').write_text('OLD')
+    tmp_path = protocol_dir / '.a.html.0123.tmp'
+    tmp_path.write_text('NEW')
+    _write_intents({
+        'id': '1', 'op': 'update', 'path': str(protocol_dir / 'a.html'), 'tmp': str(tmp_path),
+        'content': 'NEW', 'hash': _hash('NEW'), 'old_hash': _hash('OLD'),
+        'attrs': {'description': 'new', 'app_type': None, 'app_name': None},
+    })
+
+    protocol_journal.reconcile_journal()
+    assert (protocol_dir / 'a.html').read_text() == 'OLD'
+    assert not tmp_path.exists()
+
+
+def test_update_leaves_file_changed_by_others(protocol_dir):
+    _add_row('a.html')
+    (protocol_dir / 'a.html').write_text('PULLED')
+    _write_intents({
+        'id': '1', 'op': 'update', 'path': str(protocol_dir / 'a.html'),
+        'content': 'NEW', 'hash': _hash('NEW'), 'old_hash': _hash('OLD'),
+        'attrs': {'description': 'old', 'app_type': None, 'app_name': None},
+    })
+
+    protocol_journal.reconcile_journal()
+    assert (protocol_dir / 'a.html').read_text() == 'PULLED'
+
+
+def test_create_without_row_only_removes_own_file(protocol_dir):
+    (protocol_dir / 'mine.html').write_text('MINE')
+    (protocol_dir / 'tracked.html').write_text('TRACKED')
+    _write_intents(
+        {'id': '1', 'op': 'create', 'path': str(protocol_dir / 'mine.html'), 'content': 'MINE', 'hash': _hash('MINE')},
+        {'id': '2', 'op': 'create', 'path': str(protocol_dir / 'tracked.html'), 'content': 'X', 'hash': _hash('X')},
+    )
+
+    assert protocol_journal.reconcile_journal() == 2
+    assert not (protocol_dir / 'mine.html').exists()
+    assert (protocol_dir / 'tracked.html').read_text() == 'TRACKED'
+
+
+def test_create_with_row_restores_lost_file(protocol_dir):
+    _add_row('a.html')
+    (protocol_dir / 'a.html').write_text('')
+    _write_intents(
+        {'id': '1', 'op': 'create', 'path': str(protocol_dir / 'a.html'), 'content': 'A', 'hash': _hash('A')}
+    )
+
+    protocol_journal.reconcile_journal()
+    assert (protocol_dir / 'a.html').read_text() == 'A'
+
+
+def test_delete_without_row_only_removes_matching_file(protocol_dir):
+    (protocol_dir / 'a.html').write_text('A')
+    (protocol_dir / 'b.html').write_text('REPLACED')
+    _add_row('c.html')
+    (protocol_dir / 'c.html').write_text('C')
+    _write_intents(
+        {'id': '1', 'op': 'delete', 'path': str(protocol_dir / 'a.html'), 'old_hash': _hash('A')},
+        {'id': '2', 'op': 'delete', 'path': str(protocol_dir / 'b.html'), 'old_hash': _hash('B')},
+        {'id': '3', 'op': 'delete', 'path': str(protocol_dir / 'c.html'), 'old_hash': _hash('C')},
+    )
+
+    protocol_journal.reconcile_journal()
+    assert not (protocol_dir / 'a.html').exists()
+    assert (protocol_dir / 'b.html').exists()
+    # 数据库未提交删除
+    assert (protocol_dir / 'c.html').exists()
+
+
+def test_latest_intent_per_file_wins(protocol_dir):
+    _add_row('a.html')
+    (protocol_dir / 'a.html').write_text('SECOND')
+    attrs = {'description': 'old', 'app_type': None, 'app_name': None}
+    _write_intents(
+        {'id': '1', 'op': 'update', 'path': str(protocol_dir / 'a.html'), 'content': 'FIRST',
+         'hash': _hash('FIRST'), 'old_hash': _hash('SECOND'), 'attrs': attrs},
+        {'id': '2', 'op': 'update', 'path': str(protocol_dir / 'a.html'), 'content': 'SECOND',
+         'hash': _hash('SECOND'), 'old_hash': _hash('FIRST'), 'attrs': attrs},
+    )
+
+    protocol_journal.reconcile_journal()
+    assert (protocol_dir / 'a.html').read_text() == 'SECOND'
+
+
+def test_aborted_intent_is_ignored(protocol_dir):
+    (protocol_dir / 'a.html').write_text('A')
+    _write_intents(
+        {'id': '1', 'op': 'create', 'path': str(protocol_dir / 'a.html'), 'content': 'A', 'hash': _hash('A')}
+    )
+    with open(config.PROTOCOL_JOURNAL_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'id': '1', 'state': 'abort'}) + '\n')
+
+    assert protocol_journal.reconcile_journal() == 0
+    assert (protocol_dir / 'a.html').exists()
+
+
+def test_import_moves_staged_files_only_when_committed(protocol_dir):
+    committed = protocol_dir / '.import_committed'
+    pending = protocol_dir / '.import_pending'
+    for staging, name in ((committed, 'c.html'), (pending, 'p.html')):
+        staging.mkdir()
+        (staging / name).write_text(name)
+    _write_intents(
+        {'id': '1', 'op': 'import', 'path': str(committed)},
+        {'id': '2', 'op': 'import', 'path': str(pending)},
+    )
+    with open(config.PROTOCOL_JOURNAL_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps({'id': '1', 'state': 'committed'}) + '\n')
+
+    protocol_journal.reconcile_journal()
+    assert sorted(p.name for p in protocol_dir.iterdir()) == ['c.html']
@@ -0,0 +1,170 @@
+"""
+协议批量导入导出
+"""
+import io
+import json
+import tarfile
+
+import pytest
+from werkzeug.test import EnvironBuilder
+
+from db.database import db
+from db.models import Protocol, OperationLog
+from services import protocol_service
+from services.protocol_service import export_protocols, import_protocols, ImportTooLargeError
+
+
+@pytest.fixture
+def protocols(protocol_dir):
+    """两个有数据库记录的协议和一个只有文件的协议"""
+    for i, app_type in enumerate(('H5', '车机')):
+        db.session.add(Protocol(filename=f'p{i}.html', description=f'描述{i}', app_type=app_type, app_name='x'))
+        (protocol_dir / f'p{i}.html').write_text(f'<title>协议{i}</title>', encoding='utf-8')
+    db.session.commit()
+    (protocol_dir / 'loose.html').write_text('<title>loose</title>', encoding='utf-8')
+    protocol_service.invalidate_protocol_catalog()
+
+
+def _export(fmt):
+    return b''.join(export_protocols(fmt))
+
+
+def _clear(protocol_dir):
+    Protocol.query.delete()
+    db.session.commit()
+    for path in protocol_dir.iterdir():
+        path.unlink()
+    protocol_service.invalidate_protocol_catalog()
+
+
+def _snapshot(protocol_dir):
+    rows = {p.filename: (p.description, p.app_type, p.app_name) for p in Protocol.query.all()}
+    files = {p.name: p.read_text(encoding='utf-8') for p in protocol_dir.iterdir()}
+    return rows, files
+
+
+@pytest.mark.parametrize('fmt', ['tar', 'ndjson'])
+def test_round_trip(protocols, protocol_dir, admin_id, fmt):
+    _, files_before = _snapshot(protocol_dir)
+    data = _export(fmt)
+    _clear(protocol_dir)
+
+    result = import_protocols(io.BytesIO(data), admin_id, fmt)
+    assert sorted(result['created']) == ['loose.html', 'p0.html', 'p1.html']
+    assert result['updated'] == [] and result['skipped'] == []
+
+    rows, files = _snapshot(protocol_dir)
+    assert files == files_before
+    assert rows == {
+        'p0.html': ('描述0', 'H5', 'x'),
+        'p1.html': ('描述1', '车机', 'x'),
+        'loose.html': (None, None, None),
+    }
+    assert OperationLog.query.filter_by(action='import_protocol').count() == 3
+
+
+def test_export_omits_attrs_of_unregistered_files(protocols):
+    lines = [json.loads(line) for line in _export('ndjson').splitlines()]
+    loose = next(p for p in lines if p['filename'] == 'loose.html')
+    assert set(loose) == {'filename', 'content'}
+
+    with tarfile.open(fileobj=io.BytesIO(_export('tar')), mode='r:gz') as tar:
+        names = tar.getnames()
+        manifest = json.load(tar.extractfile('manifest.json'))
+    assert names[0] == 'manifest.json'
+    assert {'filename': 'loose.html'} in manifest['protocols']
+
+
+def test_reimport_keeps_existing_attrs(protocols, protocol_dir, admin_id):
+    Protocol.query.filter_by(filename='p0.html').one().description = '新描述'
+    db.session.add(Protocol(filename='loose.html', description='后来登记'))
+    db.session.commit()
+    data = b'\n'.join(
+        json.dumps(p, ensure_ascii=False).encode('utf-8') for p in (
+            {'filename': 'p0.html', 'content': '新内容'},
+            {'filename': 'loose.html', 'content': 'loose'},
+        )
+    )
+
+    result = import_protocols(io.BytesIO(data), admin_id, 'ndjson', overwrite=True)
+    assert sorted(result['updated']) == ['loose.html', 'p0.html']
+    rows, files = _snapshot(protocol_dir)
+    assert rows['p0.html'][0] == '新描述'
+    assert rows['loose.html'][0] == '后来登记'
+    assert files['p0.html'] == '新内容'
+
+
+def test_skip_existing_without_overwrite(protocols, admin_id):
+    data = json.dumps({'filename': 'p0.html', 'content': 'x'}).encode('utf-8')
+    result = import_protocols(io.BytesIO(data), admin_id, 'ndjson')
+    assert result['skipped'] == ['p0.html']
+
+
+def test_duplicate_entries_rejected(protocol_dir, admin_id):
+    data = b'\n'.join([json.dumps({'filename': 'a.html', 'content': 'x'}).encode('utf-8')] * 2)
+    with pytest.raises(ValueError):
+        import_protocols(io.BytesIO(data), admin_id, 'ndjson')
+    assert Protocol.query.count() == 0
+    assert list(protocol_dir.iterdir()) == []
+
+
+def test_import_size_limit(protocol_dir, admin_id, monkeypatch):
+    monkeypatch.setattr(protocol_service, 'PROTOCOL_IMPORT_MAX_BYTES', 100)
+    data = b'\n'.join(
+        json.dumps({'filename': f'{i}.html', 'content': 'x' * 40}).encode('utf-8') for i in range(5)
+    )
+    with pytest.raises(ImportTooLargeError):
+        import_protocols(io.BytesIO(data), admin_id, 'ndjson')
+    assert Protocol.query.count() == 0
+    assert list(protocol_dir.iterdir()) == []
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    """已登录的测试客户端，路由和请求体的导入上限设为 100 字节（导入服务本身的上限不变）"""
+    from routes import protocol_routes
+    monkeypatch.setattr(protocol_routes, 'PROTOCOL_IMPORT_MAX_BYTES', 100)
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 100)
+    client = app.test_client()
+    assert client.post('/api/auth/login', json={'username': 'admin', 'password': 'pw'}).status_code == 200
+    return client
+
+
+def test_request_body_limit_follows_import_limit(app):
+    from config import PROTOCOL_IMPORT_MAX_BYTES
+    assert app.config['MAX_CONTENT_LENGTH'] == PROTOCOL_IMPORT_MAX_BYTES
+
+
+def _multipart(size):
+    return {'file': (io.BytesIO(b'x' * size), 'protocols.ndjson', 'application/x-ndjson')}
+
+
+def test_oversized_upload_rejected_before_parsing(client, monkeypatch):
+    from werkzeug.formparser import FormDataParser
+
+    def fail(*args, **kwargs):
+        raise AssertionError('超过上限的请求体不应被解析')
+    monkeypatch.setattr(FormDataParser, 'parse', fail)
+
+    response = client.post('/api/protocols/import', data=_multipart(1000), content_type='multipart/form-data')
+    assert response.status_code == 413
+
+
+class _ChunkedBuilder(EnvironBuilder):
+    """模拟分块上传：请求没有 Content-Length"""
+
+    def get_environ(self):
+        environ = super().get_environ()
+        del environ['CONTENT_LENGTH']
+        environ['wsgi.input_terminated'] = True
+        return environ
+
+
+def test_chunked_oversized_upload_rejected(client):
+    body = (b'--b\r\nContent-Disposition: form-data; name="file"; filename="p.ndjson"\r\n'
+            b'Content-Type: application/x-ndjson\r\n\r\n' + b'x' * 1000 + b'\r\n--b--\r\n')
+    builder = _ChunkedBuilder(path='/api/protocols/import', method='POST', data=body,
+                              content_type='multipart/form-data; boundary=b')
+    response = client.open(builder)
+    assert response.status_code == 413
+    assert Protocol.query.count() == 0
@@ -0,0 +1,71 @@
+"""
+令牌桶限流
+"""
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import TokenBucketLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_burst_then_reject(clock):
+    limiter = TokenBucketLimiter(capacity=3, rate=1)
+    assert [limiter.acquire('a')[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.acquire('a')
+    assert not allowed
+    assert retry_after == pytest.approx(1.0)
+
+
+def test_refill_over_time(clock):
+    limiter = TokenBucketLimiter(capacity=2, rate=0.5)
+    limiter.acquire('a')
+    limiter.acquire('a')
+    assert not limiter.acquire('a')[0]
+
+    clock[0] += 2
+    assert limiter.acquire('a')[0]
+    assert not limiter.acquire('a')[0]
+
+
+def test_refill_capped_at_capacity(clock):
+    limiter = TokenBucketLimiter(capacity=2, rate=1)
+    limiter.acquire('a')
+    clock[0] += 100
+    assert [limiter.acquire('a')[0] for _ in range(3)] == [True, True, False]
+
+
+def test_keys_are_independent(clock):
+    limiter = TokenBucketLimiter(capacity=1, rate=1)
+    assert limiter.acquire('a')[0]
+    assert not limiter.acquire('a')[0]
+    assert limiter.acquire('b')[0]
+
+
+def test_refund(clock):
+    limiter = TokenBucketLimiter(capacity=1, rate=0.01)
+    assert limiter.acquire('a')[0]
+    limiter.refund('a')
+    assert limiter.acquire('a')[0]
+
+    # 退还不会超过容量，对不存在的键不做任何事
+    limiter.refund('a')
+    limiter.refund('a')
+    assert [limiter.acquire('a')[0] for _ in range(2)] == [True, False]
+    limiter.refund('missing')
+    assert 'missing' not in limiter._buckets
+
+
+def test_prune_drops_full_buckets(clock):
+    limiter = TokenBucketLimiter(capacity=1, rate=1, max_keys=2)
+    limiter.acquire('a')
+    limiter.acquire('b')
+    clock[0] += 10
+    limiter.acquire('c')
+    assert set(limiter._buckets) == {'c'}
@@ -0,0 +1,60 @@
+"""
+跨 worker 版本戳和依赖它的协议列表缓存
+"""
+from db.database import db
+from db.models import Protocol
+from services import protocol_service
+from utils.version_stamp import bump_stamp, read_stamp
+
+
+def test_bump_changes_stamp(app):
+    assert read_stamp('test_missing') is None
+    bump_stamp('test_stamp')
+    first = read_stamp('test_stamp')
+    bump_stamp('test_stamp')
+    assert read_stamp('test_stamp') not in (None, first)
+
+
+def test_bump_leaves_no_temp_files(app, tmp_path, monkeypatch):
+    from utils import version_stamp
+    monkeypatch.setitem(version_stamp._runtime_dir, 'path', tmp_path)
+    for _ in range(5):
+        bump_stamp('x')
+    assert [p.name for p in tmp_path.iterdir()] == ['x.stamp']
+
+
+def _descriptions():
+    return {e['filename']: e['description'] for e in protocol_service.get_protocol_list()}
+
+
+def test_catalog_cached_until_stamp_bumped(protocol_dir):
+    db.session.add(Protocol(filename='a.html', description='old'))
+    db.session.commit()
+    (protocol_dir / 'a.html').write_text('a')
+    protocol_service.invalidate_protocol_catalog()
+    assert _descriptions() == {'a.html': 'old'}
+
+    # 绕过服务直接改数据库：版本戳未更新，缓存不重新加载
+    Protocol.query.filter_by(filename='a.html').one().description = 'new'
+    db.session.commit()
+    assert _descriptions() == {'a.html': 'old'}
+
+    protocol_service.invalidate_protocol_catalog()
+    assert _descriptions() == {'a.html': 'new'}
+
+
+def test_catalog_rescans_when_directory_changes(protocol_dir):
+    protocol_service.invalidate_protocol_catalog()
+    assert _descriptions() == {}
+
+    (protocol_dir / 'b.html').write_text('b')
+    assert _descriptions() == {'b.html': None}
+
+
+def test_writes_through_service_invalidate_catalog(protocol_dir):
+    protocol_service.invalidate_protocol_catalog()
+    protocol_service.create_protocol('c', 'c', description='d1')
+    assert _descriptions() == {'c.html': 'd1'}
+
+    protocol_service.update_protocol('c.html', description='d2')
+    assert _descriptions() == {'c.html': 'd2'}
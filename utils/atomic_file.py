@@ -0,0 +1,122 @@
+"""
+原子文件写入
+
+静态服务器直接读取协议目录，原地覆盖写入时读取方可能读到写了一半的文件。
+这里先把内容完整写入同目录下的临时文件，再用 os.replace / os.link 一步换上去，
+读取方只会看到旧文件或完整的新文件。
+
+fsync 是写入路径上最慢的一步。目录的 fsync 由 GroupSync 按组合并：
+同一进程内并发的写入只需一次 fsync 就能全部落盘。
+"""
+import os
+import uuid
+import threading
+from pathlib import Path
+
+
+class GroupSync:
+    """合并并发的 fsync 请求
+
+    sync() 返回时，调用前完成的写入一定已经落盘。已有 fsync 在执行时后来者等待它结束，
+    再由其中一个线程执行一次 fsync，覆盖期间登记的所有请求。
+    """
+
+    def __init__(self, fsync_func):
+        self._fsync = fsync_func
+        self._cond = threading.Condition()
+        self._requested = 0
+        self._completed = 0
+        self._syncing = False
+
+    def sync(self):
+        with self._cond:
+            self._requested += 1
+            ticket = self._requested
+            while self._completed < ticket:
+                if self._syncing:
+                    self._cond.wait()
+                    continue
+
+                # 没有进行中的 fsync：由当前线程执行，一次覆盖所有已登记的请求
+                self._syncing = True
+                covered = self._requested
+                self._cond.release()
+                try:
+                    self._fsync()
+                finally:
+                    self._cond.acquire()
+                    self._syncing = False
+                    self._cond.notify_all()
+                # fsync 失败时异常直接抛出，等待中的线程会重新执行
+                self._completed = covered
+
+
+_dir_syncers = {}
+_dir_syncers_lock = threading.Lock()
+
+
+def _fsync_dir(dir_path):
+    """fsync 目录，使目录项的增删改名落盘（Windows 不支持打开目录，跳过）"""
+    if os.name == 'nt':
+        return
+    fd = os.open(str(dir_path), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_directory(dir_path):
+    """fsync 目录，同一目录的并发调用合并为一次"""
+    key = str(Path(dir_path).resolve())
+    with _dir_syncers_lock:
+        syncer = _dir_syncers.get(key)
+        if syncer is None:
+            syncer = _dir_syncers[key] = GroupSync(lambda: _fsync_dir(key))
+    syncer.sync()
+
+
+def temp_path_for(path):
+    """生成目标文件同目录下的临时文件路径（点号开头、不以原扩展名结尾，列表扫描会忽略）"""
+    path = Path(path)
+    return path.with_name(f'.{path.name}.{uuid.uuid4().hex[:12]}.tmp')
+
+
+def write_temp_file(tmp_path, content, durable=True):
+    """把内容完整写入临时文件，durable 时 fsync 文件内容"""
+    fd = os.open(str(tmp_path), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            if durable:
+                os.fsync(f.fileno())
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def replace_file(tmp_path, path, durable=True):
+    """用临时文件原子替换目标文件"""
+    os.replace(tmp_path, path)
+    if durable:
+        fsync_directory(Path(path).parent)
+
+
+def publish_new_file(tmp_path, path, durable=True):
+    """把临时文件发布为新文件，目标已存在时抛出 FileExistsError 且不覆盖"""
+    try:
+        # link 在目标存在时失败，避免并发创建同名文件时互相覆盖
+        os.link(tmp_path, path)
+    finally:
+        Path(tmp_path).unlink(missing_ok=True)
+    if durable:
+        fsync_directory(Path(path).parent)
+
+
+def remove_file(path, durable=True):
+    """删除文件（不存在时忽略）"""
+    Path(path).unlink(missing_ok=True)
+    if durable:
+        fsync_directory(Path(path).parent)
+
@@ -4,7 +4,11 @@ from flask_login import current_user
 
 
 def require_login(f):
-    """要求用户登录的装饰器"""
+    """要求用户登录的装饰器
+
+    current_user 来自会话 Cookie，或者 Authorization: Bearer 令牌（见 services/token_service.py），
+    令牌的角色来自签名中的声明，校验时不查询数据库。
+    """
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not current_user.is_authenticated:
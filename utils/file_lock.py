@@ -0,0 +1,131 @@
+"""
+跨进程文件锁
+
+gunicorn 的多个 worker 之间用锁文件做互斥（如同一仓库同时只允许一个部署任务）。
+锁跟随打开的文件描述符，持有锁的进程退出时由操作系统自动释放。
+"""
+import os
+import sys
+import time
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# gevent 下轮询获取锁的最长间隔（秒）
+_POLL_MAX_INTERVAL = 0.1
+
+
+def _gevent_patched():
+    """是否运行在打过 monkey patch 的 gevent worker 中
+
+    flock 是阻塞的系统调用，gevent 无法在等待期间切换协程，阻塞获取锁会卡住整个 worker。
+    """
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('time')
+
+
+class FileLock:
+    """基于 flock（Windows 上为 msvcrt.locking）的文件锁
+
+    shared=True 时为共享锁：多个持有者可以同时持有，与排他锁互斥。
+    Windows 上不支持共享锁，退化为排他锁。
+    """
+
+    def __init__(self, path, shared=False):
+        self.path = Path(path)
+        self.shared = shared
+        self._fd = None
+
+    def acquire(self, blocking=True):
+        """获取锁，非阻塞模式下获取失败返回 False"""
+        if self._fd is not None:
+            return True
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                flags = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+                if not blocking:
+                    flags |= fcntl.LOCK_NB
+                    fcntl.flock(fd, flags)
+                elif _gevent_patched():
+                    self._poll(fd, flags)
+                else:
+                    fcntl.flock(fd, flags)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            if blocking:
+                raise
+            return False
+
+        self._fd = fd
+        return True
+
+    @staticmethod
+    def _poll(fd, flags):
+        """非阻塞地轮询获取锁，等待期间用（已被 gevent 替换的）time.sleep 让出协程"""
+        interval = 0.001
+        while True:
+            try:
+                fcntl.flock(fd, flags | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                time.sleep(interval)
+                interval = min(interval * 2, _POLL_MAX_INTERVAL)
+
+    def release(self):
+        """释放锁"""
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def fileno(self):
+        """持有锁时的文件描述符，可通过 pass_fds 交给子进程"""
+        return self._fd
+
+    @classmethod
+    def adopt(cls, path, fd):
+        """接管从父进程继承的、已持有锁的文件描述符"""
+        lock = cls(path)
+        lock._fd = fd
+        return lock
+
+    def detach(self):
+        """关闭本进程的文件描述符但不解锁
+
+        flock 的锁属于打开的文件，子进程继承描述符后，父进程关闭自己的副本不影响子进程继续持有锁。
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def is_locked(self):
+        """检查锁当前是否被任何持有者占用（探测后不会保留锁）"""
+        probe = FileLock(self.path)
+        if probe.acquire(blocking=False):
+            probe.release()
+            return False
+        return True
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
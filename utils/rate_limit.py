@@ -0,0 +1,55 @@
+"""
+令牌桶限流
+
+每个键（用户名、IP 等）一个桶，桶中最多 capacity 个令牌，每秒补充 rate 个，
+每次请求消耗一个，桶空时拒绝。计数保存在当前进程内存中，gunicorn 的每个 worker 独立计数。
+"""
+import time
+import threading
+
+
+class TokenBucketLimiter:
+    """按键限流的令牌桶"""
+
+    def __init__(self, capacity, rate, max_keys=10000):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}  # 键 -> [剩余令牌数, 上次更新时间]
+
+    def _prune(self, now):
+        """清理已经补满的桶，它们和不存在的桶等价"""
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if bucket[0] + (now - bucket[1]) * self.rate < self.capacity
+        }
+
+    def acquire(self, key):
+        """消耗一个令牌
+
+        Returns:
+            (是否允许, 被拒绝时建议的重试等待秒数)
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._prune(now)
+                bucket = self._buckets[key] = [self.capacity, now]
+            else:
+                bucket[0] = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0
+            return False, (1 - bucket[0]) / self.rate
+
+    def refund(self, key):
+        """退还一个令牌（请求最终不计入限流时调用，如登录成功、被另一个限流器拒绝）"""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket[0] = min(self.capacity, bucket[0] + 1)
@@ -0,0 +1,51 @@
+"""
+跨 worker 共享的版本戳
+
+gunicorn 的多个 worker 进程之间没有共享内存，这里用 RUNTIME_DIR 下的小文件
+充当版本号：写入方 bump_stamp() 原子替换文件，读取方 read_stamp() 只需一次 stat。
+"""
+import os
+import time
+import tempfile
+from pathlib import Path
+from config import RUNTIME_DIR
+
+_runtime_dir = {'path': None}
+
+
+def _get_runtime_dir():
+    """获取运行时目录，每个进程只创建一次"""
+    if _runtime_dir['path'] is None:
+        runtime_dir = Path(RUNTIME_DIR)
+        runtime_dir.mkdir(parents=True, exist_ok=True)
+        _runtime_dir['path'] = runtime_dir
+    return _runtime_dir['path']
+
+
+def _stamp_path(name):
+    """获取版本戳文件路径"""
+    return _get_runtime_dir() / f'{name}.stamp'
+
+
+def bump_stamp(name):
+    """更新版本戳，通知所有 worker 对应的缓存已失效"""
+    stamp_path = _stamp_path(name)
+    # 临时文件名唯一，同一进程内的多个线程并发更新时不会互相覆盖或删除对方的临时文件
+    fd, tmp_path = tempfile.mkstemp(prefix=f'{stamp_path.name}.', suffix='.tmp', dir=stamp_path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(str(time.time_ns()))
+        # 替换后 inode 必然变化，即使文件系统的 mtime 精度不足也能区分两次更新
+        os.replace(tmp_path, stamp_path)
+    except Exception:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+def read_stamp(name):
+    """读取版本戳，返回可比较的元组；文件不存在时返回 None"""
+    try:
+        stat = _stamp_path(name).stat()
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns)